@@ -1,12 +1,212 @@
 import pandas as pd
+import numpy as np
 import requests, os
 import json
+import datetime
 import time
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+
+from extract.http_cache import HttpCache
+from extract.partition_store import PartitionStore
+
+
+# L'API Melodi n'exporte pas plus de 10000 observations par requête
+MELODI_URL = "https://api.insee.fr/melodi/data/"
+MELODI_MAX_ROWS = 10000
+
+# Première année de l'historique des nuitées
+PREMIERE_ANNEE_NUITEES = 2024
+
+
+class ExtractionIncomplete(RuntimeError) :
+    """
+    Levée quand des partitions d'une requête Melodi n'ont pas pu être extraites (erreur après toutes les
+    tentatives, ou réponse tronquée impossible à découper). Les observations extraites restent disponibles
+    dans df, et les paramètres des partitions en échec dans echecs.
+    """
+
+    def __init__(self, dataset, df, echecs):
+        super().__init__(f"{dataset} : {len(echecs)} partitions non extraites")
+        self.dataset = dataset
+        self.df = df
+        self.echecs = echecs
+
+
+def periodes_incompletes(erreur, periodes):
+    """
+    Périodes touchées par les partitions en échec d'une ExtractionIncomplete : les valeurs TIME_PERIOD de
+    leurs paramètres, ou toutes les périodes si une partition en échec ne filtre pas sur la période.
+    Args:
+        erreur (ExtractionIncomplete): extraction incomplète
+        periodes (list): périodes de la requête complète
+    Returns:
+        periodes (list): périodes à enregistrer comme provisoires
+    """
+    touchees = set()
+
+    for params in erreur.echecs:
+        valeurs = params.get("TIME_PERIOD")
+
+        if valeurs is None:
+            return list(periodes)
+
+        touchees.update([valeurs] if isinstance(valeurs, str) else valeurs)
+
+    return sorted(touchees)
+
+
+def construire_url_insee(dataset, params):
+    """
+    Construit l'URL d'une requête Melodi à partir d'un dictionnaire de paramètres. Une valeur
+    sous forme de liste est répétée dans l'URL (ex : ACTIVITY=I551&ACTIVITY=I553), ce que l'API
+    interprète comme un "ou" sur la dimension.
+    Args:
+        dataset (str): identifiant du jeu de données (ex : DS_TOUR_CAP)
+        params (dict): dictionnaire dimension -> valeur ou liste de valeurs
+    Returns:
+        url (str): url de la requête
+    """
+    return MELODI_URL + dataset + "?" + urlencode(params, doseq=True, safe="*")
+
+
+class TokenBucket() :
+    """
+    Limiteur de débit à jetons, partagé entre les threads qui appellent l'API de l'INSEE.
+    Le seau se remplit de `rate` jetons par seconde jusqu'à `capacity` jetons, et chaque requête
+    consomme un jeton : on respecte ainsi le quota de l'API sans faire de pause fixe entre les appels.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Bloque jusqu'à ce qu'un jeton soit disponible, puis le consomme.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
 
 class AttendanceExtractor() :
 
-    def __init__(self):
-        pass
+    def __init__(self, max_workers=8, requetes_par_minute=30, burst=5, nb_essais=3, cache=None, historique=None):
+        """
+        Args:
+            max_workers (int): nombre de requêtes envoyées en parallèle à l'API de l'INSEE
+            requetes_par_minute (int): quota de l'API Melodi (30 appels par minute)
+            burst (int): nombre de requêtes pouvant partir d'un coup avant d'être cadencées
+            nb_essais (int): nombre de tentatives pour chaque requête avant d'abandonner
+            cache (HttpCache): cache des réponses de l'API, partagé avec les autres extracteurs
+            historique (PartitionStore): historique local des observations, partitionné par période
+        """
+        self.max_workers = max_workers
+        self.nb_essais = nb_essais
+        self.rate_limiter = TokenBucket(requetes_par_minute / 60, burst)
+        self.cache = cache if cache is not None else HttpCache()
+        self.historique = historique if historique is not None else PartitionStore()
+
+        # Une seule session pour réutiliser les connexions keep-alive entre les requêtes
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+    def requete_insee(self, api_url, revalider=False):
+        """
+        Effectue une requête sur l'API de l'INSEE en respectant le quota, et la relance en cas
+        d'erreur réseau, de dépassement du quota (429) ou d'erreur serveur (5xx). Les réponses
+        déjà en cache et encore valides sont renvoyées sans appel réseau.
+        Args:
+            api_url (url): url de la requête que l'on veut effectuer
+            revalider (bool): True pour redemander la réponse au serveur même si elle est en cache
+        (cf HttpCache.get)
+        Returns:
+            data (dict): json renvoyé par l'API
+        """
+
+        for essai in range(1, self.nb_essais + 1):
+            try:
+                # Le quota n'est décompté que si la requête part vraiment sur le réseau
+                contenu = self.cache.get(api_url, "insee", session=self.session,
+                                         avant_requete=self.rate_limiter.acquire, revalider=revalider, timeout=60)
+                return json.loads(contenu)
+
+            except requests.exceptions.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+
+                # Inutile de relancer une requête mal formée (erreurs 4xx autres que 429)
+                if essai == self.nb_essais or (status is not None and status != 429 and status < 500):
+                    raise
+
+                # On attend le délai demandé par le serveur, sinon on fait un backoff exponentiel
+                retry_after = e.response.headers.get("Retry-After", "") if e.response is not None else ""
+                attente = int(retry_after) if retry_after.isdigit() else 2 ** essai
+
+                print(f"⚠️  Essai {essai} échoué ({e}), nouvel essai dans {attente} s")
+                time.sleep(attente)
+
+    def decoder_observations(self, data):
+        """
+        Transforme le json renvoyé par l'API de l'INSEE en dataframe, une ligne par observation.
+        Plutôt que de construire un dictionnaire par observation, on remplit directement une
+        colonne par dimension / attribut : les codes (GEO, ACTIVITY, TIME_PERIOD, ...) deviennent
+        des catégories et OBS_VALUE_NIVEAU un tableau de flottants.
+        Args:
+            data (dict): json renvoyé par l'API
+        Returns:
+            df (pd.DataFrame): DataFrame python des observations
+        """
+
+        observations = data['observations']
+
+        # Suivant les jeux de données attributes est présent ou non, on le remplace par un
+        # dictionnaire vide pour ne pas avoir à tester chaque observation
+        vide = {}
+        dimensions = [obs['dimensions'] for obs in observations]
+        attributes = [obs.get('attributes', vide) for obs in observations]
+
+        # On récupère les noms de colonnes présents dans au moins une observation, dans l'ordre
+        noms_dimensions = {}
+        noms_attributes = {}
+        for dims, attrs in zip(dimensions, attributes):
+            noms_dimensions.update(dict.fromkeys(dims))
+            noms_attributes.update(dict.fromkeys(attrs))
+
+        colonnes = {}
+
+        for nom in noms_dimensions:
+            colonnes[nom] = pd.Categorical([dims.get(nom) for dims in dimensions])
+
+        for nom in noms_attributes:
+            if nom not in colonnes:
+                colonnes[nom] = pd.Categorical([attrs.get(nom) for attrs in attributes])
+
+        # Suivant les jeux de données value peut être absent, il devient alors NaN
+        colonnes['OBS_VALUE_NIVEAU'] = np.array(
+            [obs['measures']['OBS_VALUE_NIVEAU'].get('value') for obs in observations], dtype=float)
+
+        #Création d'un dataframe python
+        df = pd.DataFrame(colonnes)
+
+        return df
 
     def extract_data_insee(self, api_url):
         """
@@ -21,45 +221,13 @@ class AttendanceExtractor() :
         try:
             print("Making API request... (this may take a few seconds)")
 
-            get_data = requests.get(api_url, verify= False)
-            time.sleep(2)
-            data_from_net = get_data.content
-            data = json.loads(data_from_net)
+            data = self.requete_insee(api_url)
 
             # Extraction des informations du jeu de données
             title = data['title']['fr']
             identifier = data['identifier']
 
-            #Extraction des observations du jeu de données filtré, sur lesquelles on va boucler
-            observations = data['observations']
-            extracted_data = []
-
-            #Boucle de lecture des observations dans le json 
-            for obs in observations:
-                dimensions = obs['dimensions']
-                
-                # Suivant les jeux de données attributes est présent ou non
-                if 'attributes' in obs:
-                    attributes = obs['attributes']
-                else:
-                    attributes = None
-
-                # Suivant les jeux de données value peut être absent
-                if 'value' in obs['measures']['OBS_VALUE_NIVEAU']:
-                    measures = obs['measures']['OBS_VALUE_NIVEAU']['value']
-                else:
-                    mesures = None
-                
-                # on rassemble tout dans un objet
-                if 'attributes' in obs:
-                    combined_data = {**dimensions,**attributes, 'OBS_VALUE_NIVEAU': measures}
-                else:
-                    combined_data = {**dimensions, 'OBS_VALUE_NIVEAU': measures}
-                
-                extracted_data.append(combined_data)
-
-            #Création d'un dataframe python
-            df = pd.DataFrame(extracted_data)
+            df = self.decoder_observations(data)
 
             print(f'Jeu de données : {identifier} \nTitre : {title} ')
 
@@ -73,7 +241,143 @@ class AttendanceExtractor() :
             return pd.DataFrame()
         
 
-    def extract_data_capacite(self) :
+    def est_tronquee(self, data):
+        """
+        Indique si une réponse de l'API a atteint la limite d'export de Melodi, et renvoie le
+        nombre total d'observations de la requête quand l'API le communique.
+        Args:
+            data (dict): json renvoyé par l'API
+        Returns:
+            tronquee (bool): True si toutes les observations n'ont pas été renvoyées
+            total (int ou None): nombre total d'observations correspondant à la requête
+        """
+
+        nb_observations = len(data.get('observations', []))
+        paging = data.get('paging', {})
+        total = paging.get('count')
+
+        if total is not None and total > nb_observations:
+            return True, total
+        if paging.get('isLast') is False:
+            return True, total
+
+        return nb_observations >= MELODI_MAX_ROWS, total
+
+    def decouper_partition(self, params, dimensions_decoupage, total):
+        """
+        Découpe une partition trop volumineuse en sous-partitions contiguës, selon la première
+        dimension de dimensions_decoupage qui a encore plusieurs valeurs. Quand le nombre total
+        d'observations est connu, on découpe directement en autant de morceaux que nécessaire,
+        sinon on coupe en deux.
+        Args:
+            params (dict): paramètres de la requête à découper
+            dimensions_decoupage (list): dimensions sur lesquelles on peut découper, par priorité
+            total (int ou None): nombre total d'observations de la requête
+        Returns:
+            liste_params (list): paramètres des sous-partitions, vide si on ne peut plus découper
+        """
+
+        for dimension in dimensions_decoupage:
+            valeurs = params.get(dimension)
+
+            if not isinstance(valeurs, list) or len(valeurs) < 2:
+                continue
+
+            # On vise 80 % de la limite pour absorber l'hétérogénéité entre les valeurs
+            nb_morceaux = 2
+            if total is not None:
+                nb_morceaux = math.ceil(total / (0.8 * MELODI_MAX_ROWS))
+            nb_morceaux = min(max(nb_morceaux, 2), len(valeurs))
+
+            taille = math.ceil(len(valeurs) / nb_morceaux)
+
+            return [{**params, dimension: valeurs[i:i + taille]} for i in range(0, len(valeurs), taille)]
+
+        return []
+
+    def extract_data_partitionnee(self, dataset, params, dimensions_decoupage, revalider=False):
+        """
+        Extrait toutes les observations d'une requête Melodi, quel que soit son volume, avec le
+        moins de requêtes possible. On commence par requêter toutes les valeurs d'un coup (les
+        petites partitions voisines sont donc regroupées), puis chaque partition qui atteint la
+        limite des 10000 lignes est redécoupée et requêtée à nouveau, jusqu'à ce que plus aucune
+        réponse ne soit tronquée. Fonctionne pour n'importe quel jeu de données DS_*.
+        Args:
+            dataset (str): identifiant du jeu de données (ex : DS_TOUR_CAP)
+            params (dict): dimension -> valeur ou liste de valeurs de la requête complète
+            dimensions_decoupage (list): dimensions (à valeurs multiples dans params) sur lesquelles
+        on peut découper la requête, par ordre de priorité
+            revalider (bool): True pour ne pas se contenter des réponses en cache (cf requete_insee)
+        Returns:
+            df (pd.DataFrame): DataFrame de toutes les observations, dans l'ordre des partitions
+        Raises:
+            ExtractionIncomplete: si une partition échoue après toutes les tentatives de requete_insee,
+        ou reste tronquée ; les autres partitions sont tout de même extraites
+        """
+
+        def requete_partition(partition):
+            try:
+                return self.requete_insee(construire_url_insee(dataset, partition[1]), revalider=revalider)
+            except Exception as e:
+                print(f"❌ Error fetching partition {partition[0]}: {e}")
+                return None
+
+        # Une partition est identifiée par son chemin de découpage, qui sert à les trier à la fin
+        partitions = [((0,), params)]
+        resultats = []
+        echecs = []
+        nb_requetes = 0
+
+        while partitions:
+            # Toutes les partitions d'un même niveau sont requêtées en parallèle
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                reponses = list(executor.map(requete_partition, partitions))
+
+            nb_requetes += len(partitions)
+            partitions_suivantes = []
+
+            for (chemin, partition), data in zip(partitions, reponses):
+                if data is None:
+                    echecs.append(partition)
+                    continue
+
+                tronquee, total = self.est_tronquee(data)
+
+                if tronquee:
+                    sous_partitions = self.decouper_partition(partition, dimensions_decoupage, total)
+
+                    if sous_partitions:
+                        partitions_suivantes += [(chemin + (i,), p) for i, p in enumerate(sous_partitions)]
+                        continue
+
+                    print(f"⚠️  Partition {partition} tronquée et impossible à découper davantage")
+                    echecs.append(partition)
+
+                resultats.append((chemin, self.decoder_observations(data)))
+
+            partitions = partitions_suivantes
+
+        print(f"{dataset} : {len(resultats)} partitions extraites en {nb_requetes} requêtes")
+
+        resultats.sort(key=lambda resultat: resultat[0])
+
+        if resultats:
+            df = pd.concat([df for _, df in resultats], ignore_index=True)
+
+            # Les catégories diffèrent d'une partition à l'autre, pd.concat repasse donc les codes en
+            # chaînes de caractères : on les recode une seule fois sur le dataframe complet
+            colonnes_codes = [colonne for colonne in df.columns if colonne != 'OBS_VALUE_NIVEAU']
+            df[colonnes_codes] = df[colonnes_codes].astype('category')
+        else:
+            df = pd.DataFrame()
+
+        # Un jeu de données partiel n'est jamais renvoyé comme s'il était complet
+        if echecs:
+            raise ExtractionIncomplete(dataset, df, echecs)
+
+        return df
+
+    def extract_data_capacite(self, annee=None) :
         """
         Fonction qui extrait les données de capacités d'hébergements touristiques dans toute la France.
         Ces données ont été actualisées en 2025, et pour chaque commune, on a accès au nombre de lits
@@ -81,10 +385,14 @@ class AttendanceExtractor() :
         Pour les nombres de nuitées on a uniquement accès aux hôtels et aux campings donc on va faire
         de même pour les capacités.
         L'appel à l'API de l'INSEE ne permet d'exporter que 10000 lignes à la fois, or le dataframe
-        concerné (DS_TOUR_CAP) en comporte bien plus, on va donc requêter l'API de manière séparée
-        pour chaque département, et concaténer les résultats obtenus dans le dataframe qui sera retourné.
-        Args: 
-            None
+        concerné (DS_TOUR_CAP) en comporte bien plus, on va donc découper la requête par groupes de
+        départements (cf extract_data_partitionnee), et concaténer les résultats obtenus dans le
+        dataframe qui sera retourné.
+        Les observations sont conservées par année dans l'historique local (cf extract/partition_store.py) :
+        une année déjà téléchargée et définitive n'est pas redemandée à l'API, une année provisoire (extraction
+        incomplète ou données révisables) l'est, même si elle n'est pas terminée.
+        Args:
+            annee (int): année des capacités, None pour la plus récente
         Returns:
             df_capacite (pd.DataFrame): DataFrame python contenant, pour chaque ville et chaque type
         d'hébergement, le nombre de lits disponibles.
@@ -102,29 +410,70 @@ class AttendanceExtractor() :
                                 "80", "81", "82", "83", "84", "85", "86", "87", "88", "89",
                                 "90", "91", "92", "93", "94", "95"]
 
-        liste_api_url_capacite_departement = []
+        params_capacite = {"TOUR_MEASURE": "PLACE",
+                           "UNIT_LOC_RANKING": "_T",
+                           "L_STAY": "_T",
+                           "ACTIVITY": ["I551", "I553"],
+                           "GEO": [f"2025-DEP-{id_departement}*COM" for id_departement in liste_id_departements]}
+
+        # Les capacités sont conservées par année dans l'historique local : sans année demandée, on relit la
+        # plus récente, et on ne télécharge tout que si l'historique est vide ou provisoire
+        # Les capacités d'une année sont publiées pendant l'année : une partition provisoire de l'année en cours
+        # est donc redemandée sans attendre la fin de l'année
+        if annee is None:
+            periodes = self.historique.periodes("DS_TOUR_CAP")
 
-        # On construit une liste d'URLs pour chaque département
-        for id_departement in liste_id_departements :
+            if periodes and not self.historique.a_telecharger("DS_TOUR_CAP", periodes[-1:], terminees_seulement=False):
+                return self.historique.lire("DS_TOUR_CAP", periodes[-1:])
+
+            periodes_demandees = []
+
+        else:
+            periodes_demandees = self.historique.a_telecharger("DS_TOUR_CAP", [str(annee)], terminees_seulement=False)
+
+            if not periodes_demandees:
+                return self.historique.lire("DS_TOUR_CAP", [str(annee)])
+
+            params_capacite["TIME_PERIOD"] = periodes_demandees
+
+        # Le planificateur regroupe les départements en aussi peu de requêtes que possible, en
+        # redécoupant (par départements puis par type d'hébergement) celles qui sont tronquées.
+        # Les périodes ne sont demandées que si elles manquent ou sont provisoires : on revalide donc le cache HTTP
+        try:
+            df_capacite = self.extract_data_partitionnee("DS_TOUR_CAP", params_capacite, ["GEO", "ACTIVITY"],
+                                                         revalider=True)
+        except ExtractionIncomplete as e:
+            # Les départements en échec manquent à l'année extraite, qui reste provisoire pour être redemandée ;
+            # une table nationale incomplète n'est jamais renvoyée, on se rabat sur la dernière année complète
+            provisoires = periodes_demandees
+            if not provisoires and len(e.df):
+                provisoires = e.df["TIME_PERIOD"].astype(str).unique().tolist()
 
-            liste_api_url_capacite_departement.append(f"https://api.insee.fr/melodi/data/DS_TOUR_CAP?TOUR_MEASURE=PLACE&UNIT_LOC_RANKING=_T&L_STAY=_T&ACTIVITY=I551&ACTIVITY=I553&GEO=2025-DEP-{id_departement}*COM")
+            self.historique.ecrire("DS_TOUR_CAP", e.df, periodes_demandees, provisoires=provisoires)
 
-        df_capacite = pd.DataFrame()
+            completes = [periode for periode in self.historique.periodes("DS_TOUR_CAP")
+                         if (annee is None or periode <= str(annee)) and self.historique.complete("DS_TOUR_CAP", periode)]
 
-        # Pour chaque département, on appelle l'URL correspondante pour remplir df_capacite
-        for i in range(len(liste_api_url_capacite_departement)) :
+            if not completes:
+                raise
 
-            df_capacite_region = self.extract_data_insee(liste_api_url_capacite_departement[i])
-            df_capacite = pd.concat([df_capacite, df_capacite_region], ignore_index=True)
-            print(f"Département {liste_id_departements[i]} ajouté")
+            print(f"⚠️  {e}, capacités {completes[-1]} de l'historique utilisées")
 
-        return df_capacite
+            return self.historique.lire("DS_TOUR_CAP", completes[-1:])
 
+        self.historique.ecrire("DS_TOUR_CAP", df_capacite, periodes_demandees)
 
-    def extract_data_nb_nuitees(self) :
+        if annee is None:
+            periodes = self.historique.periodes("DS_TOUR_CAP")
+            return self.historique.lire("DS_TOUR_CAP", periodes[-1:])
+
+        return self.historique.lire("DS_TOUR_CAP", [str(annee)])
+
+
+    def extract_data_nb_nuitees(self, annees=None) :
         """
         Fonction qui extrait les nombres de nuitées des différents types d'hébergements (hôtel,
-        camping, ...), pour chaque mois de l'année 2024, et pour l'année 2024 au global,
+        camping, ...), pour chaque mois des années demandées, et pour chaque année au global,
         dans chaque département de France.
         Au niveau du département, on a accès uniquement aux hôtels et aux campings, et pas aux autres
         types d'hébergements malheureusement. De plus, les données mensuelles sont uniquement
@@ -133,15 +482,55 @@ class AttendanceExtractor() :
         A l'origine on aurait voulu récupérer les taux d'occupation plutôt, mais il manque des données
         dans la source INSEE (on a uniquement les hôtels au niveau départemental), donc on a préféré
         récupérer les nombres de nuitées.
+        Les observations sont conservées dans l'historique local, une partition par année (données
+        annuelles) et par mois (données mensuelles) : seules les périodes terminées qui manquent ou
+        sont encore provisoires (OBS_STATUS = P) sont demandées à l'API, puis on relit les partitions
+        des années demandées.
         Args:
-            None
+            annees (list): années souhaitées, par défaut de PREMIERE_ANNEE_NUITEES à l'année en cours
         Returns:
             df_nb_nuitees (pd.DataFrame): DataFrame python contenant les informations souhaitées.
         """
 
-        api_url_nb_nuitees = "https://api.insee.fr/melodi/data/DS_TOUR_FREQ?FREQ=A&FREQ=M&TOUR_RESID=_T&HOTEL_STA=_T&TERRTYPO=_T&TOUR_MEASURE=NUI&UNIT_LOC_RANKING=_T&TIME_PERIOD=2024&TIME_PERIOD=2024-01&TIME_PERIOD=2024-02&TIME_PERIOD=2024-03&TIME_PERIOD=2024-04&TIME_PERIOD=2024-05&TIME_PERIOD=2024-06&TIME_PERIOD=2024-07&TIME_PERIOD=2024-08&TIME_PERIOD=2024-09&TIME_PERIOD=2024-10&TIME_PERIOD=2024-11&TIME_PERIOD=2024-12&GEO=DEP"
+        if annees is None:
+            annees = range(PREMIERE_ANNEE_NUITEES, datetime.date.today().year + 1)
+
+        periodes = [periode for annee in annees
+                    for periode in [str(annee)] + [f"{annee}-{mois:02d}" for mois in range(1, 13)]]
+
+        periodes_demandees = self.historique.a_telecharger("DS_TOUR_FREQ", periodes)
+
+        if periodes_demandees:
+            print(f"Nuitées : {len(periodes_demandees)} périodes à télécharger")
+
+            params_nb_nuitees = {"FREQ": ["A", "M"],
+                                 "TOUR_RESID": "_T",
+                                 "HOTEL_STA": "_T",
+                                 "TERRTYPO": "_T",
+                                 "TOUR_MEASURE": "NUI",
+                                 "UNIT_LOC_RANKING": "_T",
+                                 "TIME_PERIOD": periodes_demandees,
+                                 "GEO": "DEP"}
+
+            # Les périodes ne sont demandées que si elles manquent ou sont provisoires : on revalide donc le cache HTTP
+            try:
+                df_nb_nuitees = self.extract_data_partitionnee("DS_TOUR_FREQ", params_nb_nuitees, ["TIME_PERIOD"],
+                                                               revalider=True)
+                self.historique.ecrire("DS_TOUR_FREQ", df_nb_nuitees, periodes_demandees)
+
+            except ExtractionIncomplete as e:
+                # Les périodes des partitions en échec restent provisoires pour être redemandées. Une partition
+                # complète déjà stockée est conservée (cf PartitionStore.ecrire) : sinon, on ne renvoie pas des
+                # nuitées incomplètes
+                provisoires = periodes_incompletes(e, periodes_demandees)
+                self.historique.ecrire("DS_TOUR_FREQ", e.df, periodes_demandees, provisoires=provisoires)
+
+                if not all(self.historique.complete("DS_TOUR_FREQ", periode) for periode in provisoires):
+                    raise
+
+                print(f"⚠️  {e}, partitions de l'historique utilisées pour {len(provisoires)} périodes")
 
-        df_nb_nuitees = self.extract_data_insee(api_url_nb_nuitees)
+        df_nb_nuitees = self.historique.lire("DS_TOUR_FREQ", periodes)
 
         return df_nb_nuitees
 
@@ -1,13 +1,28 @@
+import hashlib
+import json
+import os
 import pandas as pd
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from extract.http_cache import HttpCache
 
 class DataTourismExtractor():
-    def __init__(self, list_chemin) -> None:
+    def __init__(self, list_chemin, cache=None, max_workers=4) -> None:
         self.list_chemin = list_chemin
+        self.cache = cache if cache is not None else HttpCache()
+        self.max_workers = max_workers
+        self.dossier = "../data/DataTourism/"
+
+        # Session partagée par les téléchargements parallèles
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
 
     def extract_csv(self):
         """Fonction d'appel à l'API du site du gouvernement afin de telecharger les fichier CSV de DataTourisme sur chaque région 
-        et de les stocker"""
+        et de les stocker. Les régions sont téléchargées en parallèle, et celles dont le fichier local
+        correspond déjà à la ressource publiée (cf est_a_jour) ne sont pas retéléchargées"""
 
         api_url = "https://www.data.gouv.fr/api/2/datasets/5b598be088ee387c0c353714/resources/?page=1&page_size=50"
 
@@ -17,35 +32,19 @@ class DataTourismExtractor():
             
 
 
-            response = requests.get(api_url, timeout=10)
-            
-
+            # La liste des ressources passe par le cache partagé (cf extract/http_cache.py)
+            data = json.loads(self.cache.get(api_url, "datatourisme", timeout=10))
 
-            if response.status_code == 200: 
+            if data: 
                 print("Cela fonctionne")
 
+            # On récupère les ressources des csv a garder
+            parts = [part for part in data.get('data', []) if part.get('title') in self.list_chemin]
 
+            os.makedirs(self.dossier, exist_ok=True)
 
-                data = response.json() 
-            
-                for part in data.get('data', []):
-                    # On récupère les titres des fichier 
-                    title = part.get('title')
-                    
-                    # Si on est dans la liste des csv a garder
-                    if title in  self.list_chemin:
-                        
-                        url_csv  = part.get('url')
-
-                        # on fait un request à l'api du csv en question
-                        requests_csv = requests.get(url_csv)
-
-                        if requests_csv.status_code == 200:
-                            
-                            # On telecharge sous format CSV le fichier
-                            with open("../data/DataTourism/"+ title, "wb") as f:
-                                f.write(requests_csv.content)
-
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(self.telecharger_csv, parts))
 
             print(f"Tout les CSV sont créer")
         
@@ -55,6 +54,96 @@ class DataTourismExtractor():
         except Exception as e:
             print(f"❌ Error processing data: {e}")
             return pd.DataFrame()
+
+    def est_a_jour(self, part, chemin):
+        """Fonction qui indique si le fichier local correspond déjà à la ressource publiée sur data.gouv,
+        à partir des métadonnées de l'API des ressources (taille, date de modification, checksum)
+        
+        Args:
+            part (dict) : ressource renvoyée par l'API data.gouv
+            chemin (String) : chemin du fichier local
+        
+        Return:
+            a_jour (bool) : True si le fichier n'a pas besoin d'être retéléchargé"""
+
+        if not os.path.exists(chemin):
+            return False
+
+        filesize = part.get('filesize')
+        if filesize is not None and os.path.getsize(chemin) != filesize:
+            return False
+
+        checksum = part.get('checksum') or {}
+
+        # Métadonnées enregistrées lors du dernier téléchargement
+        try:
+            with open(chemin + ".meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+        # Sans date de modification ni checksum publiés, les métadonnées ne prouvent rien
+        publie = part.get('last_modified') is not None or checksum.get('value') is not None
+
+        if (publie and meta and meta.get('last_modified') == part.get('last_modified')
+                and meta.get('checksum') == checksum.get('value')):
+            return True
+
+        # Sinon on compare l'empreinte du fichier local avec celle publiée
+        if checksum.get('value') and checksum.get('type') in hashlib.algorithms_available:
+            empreinte = hashlib.new(checksum['type'])
+            with open(chemin, "rb") as f:
+                for bloc in iter(lambda: f.read(1 << 20), b""):
+                    empreinte.update(bloc)
+            return empreinte.hexdigest() == checksum['value']
+
+        return False
+
+    def telecharger_csv(self, part):
+        """Fonction qui télécharge le CSV d'une région par morceaux dans un fichier temporaire, renommé
+        une fois complet, pour ne jamais garder tout le fichier en mémoire ni laisser de fichier partiel
+        
+        Args:
+            part (dict) : ressource renvoyée par l'API data.gouv"""
+
+        # On récupère les titres des fichier 
+        title = part.get('title')
+        chemin = self.dossier + title
+        chemin_tmp = chemin + ".part"
+
+        try:
+            if self.est_a_jour(part, chemin):
+                print(f"{title} déjà à jour")
+                return
+
+            url_csv  = part.get('url')
+
+            # on fait un request à l'api du csv en question
+            with self.session.get(url_csv, stream=True, timeout=(10, 120)) as requests_csv:
+                requests_csv.raise_for_status()
+
+                # On telecharge sous format CSV le fichier
+                with open(chemin_tmp, "wb") as f:
+                    for chunk in requests_csv.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+
+            os.replace(chemin_tmp, chemin)
+
+            with open(chemin + ".meta.json", "w", encoding="utf-8") as f:
+                json.dump({'last_modified': part.get('last_modified'),
+                           'checksum': (part.get('checksum') or {}).get('value'),
+                           'filesize': part.get('filesize')}, f)
+
+            print(f"{title} téléchargé")
+
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Network error fetching {title}: {e}")
+        except OSError as e:
+            print(f"❌ Error writing {title}: {e}")
+        finally:
+            # Un téléchargement interrompu ne laisse pas de fichier partiel
+            if os.path.exists(chemin_tmp):
+                os.remove(chemin_tmp)
     
 
     def extract_data(self):
@@ -1,10 +1,66 @@
+import io
+from datetime import date
+
 import requests
 import pandas as pd
 
+from extract.http_cache import HttpCache
+
+
+# Attributs texte des stations, répétés à chaque observation : lus directement en category
+DTYPES_SYNOP = {"department (name)": "category",
+                "department (code)": "category",
+                "communes (code)": "category",
+                "Nom": "category"}
+
+SYNOP_URL = ("https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
+             "donnees-synop-essentielles-omm/exports/csv")
+
+# Premier jour de l'historique SYNOP publié sur Opendatasoft
+SYNOP_DEBUT = "2010-01-01"
+
+# Départements métropolitains : les stations d'outre-mer et des TAAF sont exclues côté serveur
+DEPARTEMENTS_METROPOLE = [f"{d:02d}" for d in range(1, 96) if d != 20] + ["2A", "2B"]
+
+# Champs décrivant une station, et libellés des colonnes correspondantes dans l'export use_labels
+ATTRIBUTS_SYNOP = {"latitude": "Latitude",
+                   "longitude": "Longitude",
+                   "nom_dept": "department (name)",
+                   "code_dep": "department (code)",
+                   "codegeo": "communes (code)",
+                   "nom": "Nom"}
+
+# Codes lus en texte pour conserver les zéros initiaux
+DTYPES_CODES = {"code_dep": str, "codegeo": str}
+
+# Mesures agrégées par station et par mois (fonction d'agrégation ODSQL, libellé de la colonne)
+MESURES_SYNOP = {"pres": ("avg", "Pression station"),
+                 "tc": ("avg", "Température (°C)"),
+                 "rr24": ("sum", "Précipitations dans les 24 dernières heures"),
+                 "rafper": ("avg", "Rafales sur une période")}
+
+# Mesures dont on agrège aussi le maximum mensuel (libellé de la colonne)
+MAXIMUMS_SYNOP = {"rafper": "Rafales sur une période (max)"}
+
+
+def construire_filtre_synop(date_debut, date_fin, departements=DEPARTEMENTS_METROPOLE, inclure_debut=True):
+    """
+    Construit la clause where ODSQL : fenêtre de dates [date_debut, date_fin[ (]date_debut, date_fin[ si
+    inclure_debut est False), départements, et mesures renseignées (comme le dropna de TransformMeteo.process_data).
+    """
+    conditions = [f"date {'>=' if inclure_debut else '>'} date'{date_debut}'", f"date < date'{date_fin}'"]
+
+    if departements is not None:
+        conditions.append("code_dep IN (" + ", ".join(f'"{d}"' for d in departements) + ")")
+
+    conditions += [f"{champ} is not null" for champ in MESURES_SYNOP]
+
+    return " AND ".join(conditions)
+
 
 class MeteoExtractor:
-    def __init__(self):
-        pass
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else HttpCache()
 
 
     def extract(self):
@@ -19,7 +75,7 @@ class MeteoExtractor:
         data_source = (
             "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
             "donnees-synop-essentielles-omm/exports/csv?"
-            "select=date,latitude,longitude,nom_dept,code_dep,codegeo,pres,nom,tc,rr3,rr24,raf10"
+            "select=date,latitude,longitude,nom_dept,code_dep,codegeo,pres,nom,tc,rr3,rr24,raf10,rafper"
             "&lang=fr"
             "&timezone=Europe%2FParis"
             "&use_labels=true"
@@ -28,9 +84,102 @@ class MeteoExtractor:
 
         print("📄 Reading meteorological data from CSV...")
 
-        self.df = pd.read_csv(data_source, sep=';')
+        # L'export complet fait plusieurs centaines de Mo : on passe par le cache partagé
+        contenu = self.cache.get(data_source, "meteo", timeout=600)
+
+        self.df = pd.read_csv(io.BytesIO(contenu), sep=';', dtype=DTYPES_SYNOP)
+
+        return self.df
+
+    def get_monthly_dataset(self, date_debut=SYNOP_DEBUT, date_fin=None, departements=DEPARTEMENTS_METROPOLE):
+        """
+        Renvoie directement les agrégats mensuels par station (même table que TransformMeteo.process_data), calculés
+        par l'API Explore d'Opendatasoft : les filtres (where) et l'agrégation (group_by station et mois, avg / sum)
+        sont exécutés côté serveur, qui ne renvoie que quelques centaines de lignes au lieu de l'export complet.
+        Si le serveur refuse la requête agrégée, l'erreur est propagée : TransformMeteo.monthly_dataset se replie
+        alors sur l'export brut par tranches (cf iter_observations), réduit localement.
+
+        Args:
+            date_debut (str): première date incluse (AAAA-MM-JJ)
+            date_fin (str): date exclue, par défaut aujourd'hui
+            departements (list): codes des départements gardés, None pour toutes les stations
+
+        Returns:
+            df_mensuel (pd.DataFrame): une ligne par station et par mois
+
+        Raises:
+            requests.exceptions.HTTPError: si le serveur refuse la requête agrégée
+        """
+        date_fin = date_fin or date.today().isoformat()
+
+        select = [f"{champ} as {champ}" for champ in ATTRIBUTS_SYNOP] + ["month(date) as mois"]
+        select += [f"{fonction}({champ}) as {champ}" for champ, (fonction, _) in MESURES_SYNOP.items()]
+        select += [f"max({champ}) as {champ}_max" for champ in MAXIMUMS_SYNOP]
+
+        params = {"select": ", ".join(select),
+                  "where": construire_filtre_synop(date_debut, date_fin, departements),
+                  "group_by": ", ".join(list(ATTRIBUTS_SYNOP) + ["month(date) as mois"]),
+                  "timezone": "UTC",
+                  "delimiter": ";"}
+
+        print("📄 Agrégation des données météo côté serveur...")
+
+        contenu = self.cache.get(SYNOP_URL, "meteo", params=params, timeout=600)
+
+        df = pd.read_csv(io.BytesIO(contenu), sep=';', dtype=DTYPES_CODES)
+
+        return self.renommer_agregats(df)
+
+    def iter_observations(self, date_debut=SYNOP_DEBUT, date_fin=None, departements=DEPARTEMENTS_METROPOLE,
+                          inclure_debut=True):
+        """
+        Télécharge les observations brutes filtrées côté serveur, par tranches d'un an.
+
+        Args:
+            date_debut (str): début de la fenêtre (date ou horodatage ISO, ex : le watermark d'une mise à jour)
+            date_fin (str): date exclue, par défaut aujourd'hui
+            departements (list): codes des départements gardés, None pour toutes les stations
+            inclure_debut (bool): si False, les observations datées exactement de date_debut sont exclues
+
+        Returns:
+            tranches (generator): DataFrames des observations, avec les libellés de l'export (Date, Latitude, ...)
+        """
+        date_fin = date_fin or date.today().isoformat()
+
+        for annee in range(int(date_debut[:4]), int(date_fin[:4]) + 1):
+            debut = max(date_debut, f"{annee}-01-01")
+            fin = min(date_fin, f"{annee + 1}-01-01")
+
+            if debut >= fin:
+                continue
+
+            params = {"select": ", ".join(["date"] + list(ATTRIBUTS_SYNOP) + list(MESURES_SYNOP)),
+                      "where": construire_filtre_synop(debut, fin, departements,
+                                                       inclure_debut=inclure_debut or debut != date_debut),
+                      "timezone": "UTC",
+                      "delimiter": ";"}
+
+            print(f"📄 Export brut des données météo de {annee} (à partir du {debut})...")
+
+            contenu = self.cache.get(SYNOP_URL, "meteo", params=params, timeout=600)
+            df = pd.read_csv(io.BytesIO(contenu), sep=';', dtype=DTYPES_CODES)
+
+            yield df.rename(columns={"date": "Date", **ATTRIBUTS_SYNOP,
+                                     **{champ: libelle for champ, (_, libelle) in MESURES_SYNOP.items()}})
+
+    def renommer_agregats(self, df):
+        """
+        Renomme les colonnes des agrégats avec les libellés utilisés par TransformMeteo, et trie par station et mois.
+        """
+        df = df.rename(columns={**ATTRIBUTS_SYNOP, "mois": "Mois",
+                                **{champ: libelle for champ, (_, libelle) in MESURES_SYNOP.items()},
+                                **{f"{champ}_max": libelle for champ, libelle in MAXIMUMS_SYNOP.items()}})
+
+        df = df.sort_values(list(ATTRIBUTS_SYNOP.values()) + ["Mois"]).reset_index(drop=True)
+
+        return df.astype(DTYPES_SYNOP)
+
 
-        
 
 if __name__ == '__main__' :
 
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+import requests
+
+
+# Le cache est partagé par tous les extracteurs, dans data/cache quel que soit le dossier courant
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache")
+
+# Durée (en secondes) pendant laquelle une réponse est réutilisée sans même interroger le serveur.
+# Au-delà, on revalide avec ETag / If-Modified-Since quand le serveur les fournit.
+TTL_SOURCES = {"insee": 7 * 24 * 3600,
+               "datatourisme": 24 * 3600,
+               "meteo": 24 * 3600}
+
+
+class HttpCache() :
+    """
+    Cache disque des réponses HTTP des extracteurs, indexé par URL et paramètres de requête.
+    Les contenus sont stockés sous le nom de leur empreinte sha256 (deux requêtes qui renvoient
+    le même contenu ne le stockent qu'une fois), et l'index associe chaque requête à son contenu,
+    ses en-têtes de validation et ses dates de téléchargement / d'accès.
+    Plusieurs instances (une par extracteur, voire plusieurs processus) partagent le même dossier :
+    chaque écriture relit et fusionne l'index sur disque sous un verrou de fichier, et l'éviction ne
+    supprime que les contenus des entrées qu'elle a elle-même retirées.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl_sources=None, taille_max=2 * 1024 ** 3):
+        """
+        Args:
+            cache_dir (str): dossier du cache
+            ttl_sources (dict): durées de validité par source, complètent TTL_SOURCES
+            taille_max (int): taille maximale (en octets) des contenus stockés
+        """
+        self.cache_dir = cache_dir
+        self.blobs_dir = os.path.join(cache_dir, "blobs")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.verrou_path = os.path.join(cache_dir, "index.lock")
+        self.ttl_sources = {**TTL_SOURCES, **(ttl_sources or {})}
+        self.taille_max = taille_max
+        self.lock = threading.Lock()
+
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        self.index = self.lire_index()
+
+    def cle(self, url, params=None):
+        """
+        Clé d'une requête : empreinte de l'URL et des paramètres triés.
+        """
+        requete = url + "?" + urlencode(sorted((params or {}).items()), doseq=True)
+        return hashlib.sha256(requete.encode("utf-8")).hexdigest()
+
+    def get(self, url, source, session=None, params=None, avant_requete=None, revalider=False, **kwargs):
+        """
+        Renvoie le contenu de la réponse à une requête GET, depuis le cache si l'entrée est encore
+        valide ou si le serveur répond 304, et depuis le réseau sinon.
+        Args:
+            url (str): url de la requête
+            source (str): nom de la source dans ttl_sources (insee, datatourisme, meteo, ...)
+            session (requests.Session): session à utiliser, requests par défaut
+            params (dict): paramètres de la requête
+            avant_requete (callable): appelée juste avant un appel réseau (ex : rate limiter)
+            revalider (bool): True pour interroger le serveur même si l'entrée est encore valide (requête
+        conditionnelle), par exemple pour redemander des données provisoires
+            **kwargs: arguments passés à session.get (timeout, ...)
+        Returns:
+            contenu (bytes): contenu de la réponse
+        Raises:
+            requests.exceptions.HTTPError: si le serveur renvoie une erreur
+        """
+
+        cle = self.cle(url, params)
+        ttl = self.ttl_sources.get(source, 0)
+
+        with self.lock:
+            entree = dict(self.index[cle]) if cle in self.index else None
+
+        headers = dict(kwargs.pop("headers", {}))
+
+        if entree is not None and not revalider and time.time() - entree["date"] < ttl:
+            try:
+                return self.lire(cle, entree)
+            except FileNotFoundError:
+                # Contenu évincé entre-temps par une autre instance
+                entree = None
+
+        if entree is not None and os.path.exists(self.chemin_blob(entree["empreinte"])):
+
+            # Requête conditionnelle : le serveur ne renvoie le contenu que s'il a changé
+            if entree.get("etag"):
+                headers["If-None-Match"] = entree["etag"]
+            if entree.get("last_modified"):
+                headers["If-Modified-Since"] = entree["last_modified"]
+
+        else:
+            entree = None
+
+        if avant_requete is not None:
+            avant_requete()
+
+        response = (session or requests).get(url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entree is not None:
+            entree["date"] = time.time()
+            with self.verrou():
+                # Le contenu est relu sous le verrou : aucune éviction ne peut le supprimer entre-temps
+                if os.path.exists(self.chemin_blob(entree["empreinte"])):
+                    self.fusionner_index()
+                    self.index[cle] = entree
+                    self.sauvegarder_index()
+                    return self.lire(cle, entree, verrouille=True)
+
+            # Contenu évincé depuis la requête conditionnelle : on le retélécharge en entier
+            return self.get(url, source, session=session, params=params, avant_requete=avant_requete,
+                            revalider=True, **kwargs)
+
+        response.raise_for_status()
+        contenu = response.content
+
+        self.enregistrer(cle, url, response, contenu)
+
+        return contenu
+
+    def chemin_blob(self, empreinte):
+        return os.path.join(self.blobs_dir, empreinte)
+
+    def lire(self, cle, entree, verrouille=False):
+        """
+        Lit le contenu d'une entrée et met à jour sa date d'accès (utilisée pour l'éviction). La date
+        d'accès n'est écrite sur disque qu'à la prochaine écriture de l'index, pas à chaque lecture.
+        Args:
+            verrouille (bool): True si l'appelant détient déjà self.verrou()
+        Raises:
+            FileNotFoundError: si le contenu a été évincé par une autre instance
+        """
+        with open(self.chemin_blob(entree["empreinte"]), "rb") as f:
+            contenu = f.read()
+
+        entree["acces"] = time.time()
+
+        if verrouille:
+            self.index[cle] = entree
+        else:
+            with self.lock:
+                self.index[cle] = entree
+
+        return contenu
+
+    def enregistrer(self, cle, url, response, contenu):
+        """
+        Stocke un nouveau contenu (s'il n'est pas déjà présent) et l'entrée d'index associée. Le contenu
+        est écrit sous le verrou : une éviction concurrente, qui ne voit que l'index, ne peut pas supprimer
+        un contenu écrit mais pas encore indexé.
+        """
+        empreinte = hashlib.sha256(contenu).hexdigest()
+        chemin = self.chemin_blob(empreinte)
+
+        maintenant = time.time()
+
+        with self.verrou():
+            if not os.path.exists(chemin):
+                # Écriture dans un fichier temporaire puis renommage, pour ne jamais laisser de
+                # contenu partiel dans le cache
+                chemin_tmp = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(chemin_tmp, "wb") as f:
+                    f.write(contenu)
+                os.replace(chemin_tmp, chemin)
+
+            self.fusionner_index()
+            self.index[cle] = {"url": url,
+                               "empreinte": empreinte,
+                               "taille": len(contenu),
+                               "etag": response.headers.get("ETag"),
+                               "last_modified": response.headers.get("Last-Modified"),
+                               "date": maintenant,
+                               "acces": maintenant}
+            self.evincer()
+            self.sauvegarder_index()
+
+    @contextmanager
+    def verrou(self):
+        """
+        Verrou exclusif sur l'index, entre les threads de cette instance et entre les instances et
+        processus qui partagent le dossier du cache.
+        """
+        with self.lock:
+            with open(self.verrou_path, "a+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def lire_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fusionner_index(self):
+        """
+        Fusionne l'index sur disque (écrit par d'autres instances) avec l'index en mémoire : pour une
+        même requête, l'entrée la plus récemment téléchargée l'emporte, avec la date d'accès la plus
+        récente des deux. Les entrées évincées par une autre instance disparaissent de l'index en
+        mémoire, sauf si elles ont été téléchargées depuis. Appelée avec self.verrou().
+        """
+        index_disque = self.lire_index()
+
+        for cle, entree in self.index.items():
+            sur_disque = index_disque.get(cle)
+
+            if sur_disque is None:
+                # Entrée retirée par une autre instance : on ne la garde que si son contenu existe encore
+                if os.path.exists(self.chemin_blob(entree["empreinte"])):
+                    index_disque[cle] = entree
+                continue
+
+            plus_recente = entree if entree["date"] > sur_disque["date"] else sur_disque
+            index_disque[cle] = {**plus_recente, "acces": max(entree["acces"], sur_disque["acces"])}
+
+        self.index = index_disque
+
+    def evincer(self):
+        """
+        Supprime les entrées les moins récemment utilisées tant que les contenus stockés dépassent
+        taille_max, puis les contenus de ces entrées qui ne sont plus référencés par aucune autre.
+        Appelée avec self.verrou().
+        """
+        tailles = {entree["empreinte"]: entree["taille"] for entree in self.index.values()}
+        taille_totale = sum(tailles.values())
+        evincees = set()
+
+        for cle, entree in sorted(self.index.items(), key=lambda item: item[1]["acces"]):
+            if taille_totale <= self.taille_max:
+                break
+
+            del self.index[cle]
+
+            if all(autre["empreinte"] != entree["empreinte"] for autre in self.index.values()):
+                taille_totale -= tailles.pop(entree["empreinte"], 0)
+                evincees.add(entree["empreinte"])
+
+        for empreinte in evincees:
+            try:
+                os.remove(self.chemin_blob(empreinte))
+            except OSError:
+                pass
+
+    def sauvegarder_index(self):
+        """
+        Écrit l'index sur disque de manière atomique. Appelée avec self.verrou().
+        """
+        chemin_tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(chemin_tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(chemin_tmp, self.index_path)
@@ -0,0 +1,186 @@
+import datetime
+import json
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+
+
+# Historique local des observations Melodi, dans data/partitions quel que soit le dossier courant
+DOSSIER_PARTITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "partitions")
+
+# Statut INSEE des observations provisoires, qui seront révisées : leurs partitions sont retéléchargées
+STATUT_PROVISOIRE = "P"
+
+
+def periode_terminee(periode, aujourd_hui=None):
+    """
+    Indique si une période Melodi ('2024' ou '2024-07') est terminée, et donc susceptible d'être publiée.
+    """
+    aujourd_hui = aujourd_hui or datetime.date.today()
+    annee = int(periode[:4])
+
+    if len(periode) == 4:
+        return annee < aujourd_hui.year
+
+    mois = int(periode[5:7])
+
+    return (annee, mois) < (aujourd_hui.year, aujourd_hui.month)
+
+
+class PartitionStore() :
+    """
+    Historique local, en ajout seul, des observations d'un jeu de données Melodi (DS_TOUR_FREQ, DS_TOUR_CAP, ...),
+    partitionné par période : un fichier par année pour les données annuelles et par mois pour les données
+    mensuelles, rangés dans un dossier par année (ex : DS_TOUR_FREQ/2024/2024-07.pkl). Un index par jeu de
+    données garde le statut de chaque partition : seules les partitions manquantes ou provisoires sont à
+    télécharger, et on ne relit que les partitions dont une requête a besoin.
+    """
+
+    def __init__(self, dossier=DOSSIER_PARTITIONS):
+        self.dossier = dossier
+        self.lock = threading.Lock()
+
+    def chemin_index(self, dataset):
+        return os.path.join(self.dossier, dataset, "index.json")
+
+    def chemin(self, dataset, periode):
+        return os.path.join(self.dossier, dataset, periode[:4], f"{periode}.pkl")
+
+    def index(self, dataset):
+        """
+        Index des partitions d'un jeu de données : période -> {provisoire, incomplet, nb_observations, date}.
+        """
+        try:
+            with open(self.chemin_index(dataset), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def a_telecharger(self, dataset, periodes, terminees_seulement=True):
+        """
+        Périodes terminées (cf periode_terminee) dont la partition est manquante ou provisoire.
+        Args:
+            dataset (str): identifiant du jeu de données
+            periodes (list): périodes souhaitées ('2024', '2024-07', ...)
+            terminees_seulement (bool): False pour les jeux de données publiés pendant leur période
+        (ex : capacités de l'année en cours)
+        Returns:
+            periodes (list): périodes à télécharger
+        """
+        index = self.index(dataset)
+
+        return [periode for periode in periodes
+                if (periode_terminee(periode) or not terminees_seulement)
+                and (periode not in index or index[periode]["provisoire"]
+                     or not os.path.exists(self.chemin(dataset, periode)))]
+
+    def ecrire(self, dataset, df, periodes=(), colonne_periode="TIME_PERIOD", provisoires=()):
+        """
+        Range des observations dans leurs partitions, qui remplacent les partitions existantes. Une période
+        demandée (periodes) sans observation est enregistrée vide et provisoire : elle sera redemandée.
+        Une extraction vide ou incomplète ne remplace jamais une partition déjà stockée : celle-ci est gardée
+        (sauf si elle était elle-même incomplète et plus petite) et seulement marquée provisoire.
+        Args:
+            dataset (str): identifiant du jeu de données
+            df (pd.DataFrame): observations (cf AttendanceExtractor.extract_data_partitionnee)
+            periodes (list): périodes demandées à l'API
+            colonne_periode (str): colonne des périodes
+            provisoires (list): périodes dont l'extraction est incomplète (cf ExtractionIncomplete), enregistrées
+        provisoires et incomplètes quel que soit leur OBS_STATUS
+        """
+        provisoires = {str(periode) for periode in provisoires}
+
+        if len(df):
+            groupes = dict(list(df.groupby(df[colonne_periode].astype(str), observed=True, sort=False)))
+        else:
+            groupes = {}
+
+        for periode in list(periodes) + sorted(provisoires):
+            groupes.setdefault(str(periode), df.iloc[:0])
+
+        with self.lock:
+            index = self.index(dataset)
+
+            for periode, df_periode in groupes.items():
+                chemin = self.chemin(dataset, periode)
+                incomplet = periode in provisoires
+
+                ancienne = index.get(periode) if os.path.exists(chemin) else None
+
+                if ancienne is not None and ancienne["nb_observations"] > 0 and (
+                        len(df_periode) == 0
+                        or (incomplet and (not ancienne.get("incomplet", False)
+                                           or ancienne["nb_observations"] >= len(df_periode)))):
+                    index[periode] = {**ancienne, "provisoire": True}
+                    continue
+
+                os.makedirs(os.path.dirname(chemin), exist_ok=True)
+
+                chemin_tmp = f"{chemin}.{os.getpid()}.tmp"
+                with open(chemin_tmp, "wb") as f:
+                    pickle.dump(df_periode.reset_index(drop=True), f)
+                os.replace(chemin_tmp, chemin)
+
+                provisoire = len(df_periode) == 0 or incomplet
+                if "OBS_STATUS" in df_periode:
+                    provisoire = provisoire or bool((df_periode["OBS_STATUS"].astype(str) == STATUT_PROVISOIRE).any())
+
+                index[periode] = {"provisoire": provisoire,
+                                  "incomplet": incomplet,
+                                  "nb_observations": len(df_periode),
+                                  "date": time.time()}
+
+            chemin_index = self.chemin_index(dataset)
+            os.makedirs(os.path.dirname(chemin_index), exist_ok=True)
+
+            chemin_tmp = f"{chemin_index}.{os.getpid()}.tmp"
+            with open(chemin_tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(chemin_tmp, chemin_index)
+
+    def complete(self, dataset, periode):
+        """
+        Indique si l'historique contient une partition non vide et extraite en entier (même provisoire au sens
+        de l'INSEE) pour une période.
+        """
+        entree = self.index(dataset).get(str(periode))
+
+        return (entree is not None and entree["nb_observations"] > 0 and not entree.get("incomplet", False)
+                and os.path.exists(self.chemin(dataset, str(periode))))
+
+    def lire(self, dataset, periodes=None):
+        """
+        Relit les observations des périodes demandées (toutes si periodes vaut None). Les périodes absentes de
+        l'historique sont ignorées.
+        Returns:
+            df (pd.DataFrame): observations, dans l'ordre des périodes
+        """
+        index = self.index(dataset)
+        periodes = sorted(index) if periodes is None else [str(periode) for periode in periodes]
+
+        dfs = []
+        for periode in periodes:
+            if periode in index and os.path.exists(self.chemin(dataset, periode)):
+                with open(self.chemin(dataset, periode), "rb") as f:
+                    dfs.append(pickle.load(f))
+
+        dfs = [df for df in dfs if len(df)]
+        if not dfs:
+            return pd.DataFrame()
+
+        df = pd.concat(dfs, ignore_index=True)
+
+        # Comme dans extract_data_partitionnee, les codes sont recodés en catégories sur le dataframe complet
+        colonnes_codes = [colonne for colonne in df.columns if colonne != "OBS_VALUE_NIVEAU"]
+        df[colonnes_codes] = df[colonnes_codes].astype("category")
+
+        return df
+
+    def periodes(self, dataset):
+        """
+        Périodes présentes dans l'historique d'un jeu de données, triées.
+        """
+        return sorted(self.index(dataset))
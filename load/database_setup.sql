@@ -4,7 +4,18 @@
 -- Drop tables if they exist (for clean restart)
 DROP TABLE IF EXISTS communes;
 DROP TABLE IF EXISTS tourisme;
-DROP TABLE IF EXISTS meteo;
+-- meteo était une table avant le schéma en étoile : on la supprime quel que soit son type
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'meteo' AND relkind = 'v' AND pg_table_is_visible(oid)) THEN
+        DROP VIEW meteo;
+    ELSIF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'meteo' AND relkind = 'r' AND pg_table_is_visible(oid)) THEN
+        DROP TABLE meteo;
+    END IF;
+END $$;
+DROP TABLE IF EXISTS cluster_station;
+DROP TABLE IF EXISTS meteo_station_mois;
+DROP TABLE IF EXISTS meteo_stations;
 DROP TABLE IF EXISTS affluences;
 
 -- Table communes : contient les informations relatives à chaque commune française
@@ -44,7 +55,7 @@ CREATE TABLE tourisme (
 -- Table affluences : contient les données relatives à l'affluence touristique de chaque zone d'emploi du territoire français
 CREATE TABLE affluences (
     id SERIAL PRIMARY KEY,
-    zone_emploi INT,
+    code_cluster INT,
     id_activity VARCHAR(10),
     activity_type VARCHAR(100),
     time_period VARCHAR(10),
@@ -52,16 +63,41 @@ CREATE TABLE affluences (
     nb_nights_zone FLOAT
 )
 
--- Table meteo : contient les données relatives à la météo de chaque zone d'emploi du territoire français
-CREATE TABLE meteo (
-    code_cluster INT,
-    Mois INT(2)
-    Pression station FLOAT
-    Température (°C) FLOAT
-    Précipitations dans les 24 dernières heures FLOAT
-    Rafales sur une période FLOAT
-    PRIMARY KEY (code_cluster, mois)
-)
+-- Tables meteo : schéma en étoile, les données de chaque station ne sont stockées qu'une fois
+-- Table meteo_stations : une ligne par station météo SYNOP
+CREATE TABLE meteo_stations (
+    station_id INT PRIMARY KEY,
+    latitude FLOAT,
+    longitude FLOAT,
+    department_name VARCHAR(100),
+    department_code VARCHAR(3),
+    commune_code VARCHAR(5),
+    nom VARCHAR(100)
+);
+
+-- Table meteo_station_mois : moyennes mensuelles de chaque station
+CREATE TABLE meteo_station_mois (
+    station_id INT REFERENCES meteo_stations(station_id),
+    mois INT,
+    pression_station FLOAT,
+    temperature FLOAT,
+    precipitations_24h FLOAT,
+    rafales FLOAT,
+    rafales_max FLOAT,
+    PRIMARY KEY (station_id, mois)
+);
+
+-- Table cluster_station : station météo de référence de chaque zone d'emploi
+CREATE TABLE cluster_station (
+    code_cluster INT PRIMARY KEY,
+    station_id INT REFERENCES meteo_stations(station_id)
+);
+
+-- Vue meteo : une ligne par zone d'emploi et par mois, matérialisée à la lecture
+CREATE VIEW meteo AS
+SELECT cs.code_cluster, f.mois, f.pression_station, f.temperature, f.precipitations_24h, f.rafales, f.rafales_max
+FROM cluster_station cs
+JOIN meteo_station_mois f ON f.station_id = cs.station_id;
 
 
 
@@ -70,7 +106,8 @@ CREATE INDEX idx_code_insee ON communes(code_insee);
 CREATE INDEX idx_region ON communes(reg_code);
 CREATE INDEX idx_departement ON communes(dep_code);
 CREATE INDEX idx_epci_code ON communes(epci_code);
-CREATE INDEX idx_zone_emploi ON affluences(zone_emploi);
+CREATE INDEX idx_affluences_cluster ON affluences(code_cluster);
+CREATE INDEX idx_cluster_station_station ON cluster_station(station_id);
 
 -- Verify tables were created
 \dt
@@ -28,47 +28,76 @@ def get_connection_string():
 
 
 
-def load_to_database_meteo(meteo_df):
+# Column names of the meteo star schema (cf TransformMeteo.save_star_schema) -> columns of database_setup.sql
+COLONNES_METEO_STATIONS = {'station_id': 'station_id',
+                           'Latitude': 'latitude',
+                           'Longitude': 'longitude',
+                           'department (name)': 'department_name',
+                           'department (code)': 'department_code',
+                           'communes (code)': 'commune_code',
+                           'Nom': 'nom'}
+
+COLONNES_METEO_STATION_MOIS = {'station_id': 'station_id',
+                               'Mois': 'mois',
+                               'Pression station': 'pression_station',
+                               'Température (°C)': 'temperature',
+                               'Précipitations dans les 24 dernières heures': 'precipitations_24h',
+                               'Rafales sur une période': 'rafales',
+                               'Rafales sur une période (max)': 'rafales_max'}
+
+COLONNES_CLUSTER_STATION = {'code_cluster': 'code_cluster',
+                            'station_id': 'station_id'}
+
+
+def preparer_table(df, colonnes):
     """
-    Load meteo cleaned data into PostgreSQL database
-    
+    Rename the columns of a DataFrame to the database column names, and keep only those columns
+    """
+    df = df.rename(columns=colonnes)
+
+    return df[[colonne for colonne in colonnes.values() if colonne in df]]
+
+
+def load_to_database_meteo(stations_df, station_mois_df, cluster_station_df):
+    """
+    Load the meteo star schema (cf TransformMeteo.save_star_schema) into the tables meteo_stations,
+    meteo_station_mois and cluster_station. The meteo view (one row per cluster and month) is computed
+    by the database from these tables.
+
+    The tables are created by database_setup.sql : they are emptied and filled in one transaction
+    (to_sql with if_exists='replace' would drop them, and the meteo view that depends on them).
+
     Args:
-    meteo_df (pandas.DataFrame): Cleaned meteo data
+        stations_df (pandas.DataFrame): stations table (TransformMeteo.get_station_table)
+        station_mois_df (pandas.DataFrame): station x month facts (TransformMeteo.df_faits)
+        cluster_station_df (pandas.DataFrame): cluster -> station table (TransformMeteo.build_cluster_bridge)
     """
     print("💾 Loading METEO data to PostgreSQL database...")
 
     connection_string = get_connection_string()
 
     try:
-        # TODO: Create SQLAlchemy engine
         engine = create_engine(connection_string)
-        
-        # TODO: Load METEO data
-        # Use pandas to_sql method to insert data
-        # 
-        # Parameters explanation:
-        # - 'meteo': table name in database
-        # - engine: database connection
-        # - if_exists='replace': replace table if it exists (use 'append' to add to existing data)
-        # - index=False: don't include pandas row index as a column
-        meteo_df.to_sql('meteo',engine,if_exists='replace',index='False')
-        
-        # Check if meteo_df is not empty before loading
-        if not meteo_df.empty :
-            meteo_df.to_sql('meteo', engine, if_exists='replace', index=False)
-        
-        # TODO: Print loading statistics
-        print(f"✅ Loaded {len(meteo_df)} meteo to database")
-        if not meteo_df.empty:
-            print(f"✅ Loaded {len(flights_df)} flights to database")
-        else:
-            print("ℹ️  No flight data to load")
-        
+
+        tables = [('meteo_stations', preparer_table(stations_df, COLONNES_METEO_STATIONS)),
+                  ('meteo_station_mois', preparer_table(station_mois_df, COLONNES_METEO_STATION_MOIS)),
+                  ('cluster_station', preparer_table(cluster_station_df, COLONNES_CLUSTER_STATION))]
+
+        with engine.begin() as connection:
+            connection.execute(text("TRUNCATE cluster_station, meteo_station_mois, meteo_stations"))
+
+            # Stations first : the two other tables reference them
+            for table, df in tables:
+                df.to_sql(table, connection, if_exists='append', index=False)
+
+        for table, df in tables:
+            print(f"✅ Loaded {len(df)} rows to {table}")
+
     except Exception as e:
         print(f"❌ Error loading data to database: {e}")
         print("💡 Make sure:")
         print("   - PostgreSQL is running")
-        print("   - Database 'airlife_db' exists") 
+        print("   - Database 'voyagevoyage_db' exists")
         print("   - Username and password are correct")
         print("   - Tables are created (run database_setup.sql)")
 
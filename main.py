@@ -76,18 +76,11 @@ def main():
     df_capacite = Attendance_Transformer.transform_data_capacite(df_capacite)
     df_nb_nuitees = Attendance_Transformer.transform_data_nb_nuitees(df_nb_nuitees)
 
-    df_affluences = Attendance_Transformer.creation_dataframe_affluences(df_capacite, df_nb_nuitees)
+    cube_affluences = Attendance_Transformer.creation_cube_affluences(df_capacite, df_nb_nuitees)
 
-    print(df_affluences.head())
+    df_affluence_cluster = cube_affluences.cluster_frame(df_towncleaned)
 
-    df_affluence_cluster = AttendanceTransformer.affluences_cluster(df_affluences, cluster_mapping)
-
-    # A compléter avec la partie d'Antonin
-    #  df_communes = 
-
-    # df_affluence_cluster = Transformer.affluences_cluster(df_affluences, df_communes)
-
-    # print(df_affluence_cluster)
+    print(df_affluence_cluster.head())
 
   
 
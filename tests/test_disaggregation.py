@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transform.disaggregation import desagreger, pivoter_series
+from transform.transform_affluences import AttendanceTransformer
+
+
+@pytest.fixture
+def df_nuitees():
+    """
+    Nuitées synthétiques au format Melodi : hôtels (I551) annuels et mensuels, campings (I553) seulement annuels.
+    Le département 07 n'a pas de données hôtelières en 2024-05, et le total annuel des hôtels du 05 est nul.
+    """
+    rng = np.random.default_rng(0)
+    lignes = []
+
+    for dept in [f"{d:02d}" for d in range(1, 11)]:
+        for annee in [2023, 2024]:
+            hotels = 100 * rng.random(12)
+            for mois in range(1, 13):
+                lignes.append(("M", f"FRA-DEP-{dept}", f"{annee}-{mois:02d}", "I551", hotels[mois - 1]))
+
+            # Comme dans les données INSEE, le total annuel des hôtels est la somme des mois
+            lignes.append(("A", f"FRA-DEP-{dept}", str(annee), "I551", hotels.sum()))
+            lignes.append(("A", f"FRA-DEP-{dept}", str(annee), "I553", 1000 * rng.random()))
+
+    df = pd.DataFrame(lignes, columns=["FREQ", "GEO", "TIME_PERIOD", "ACTIVITY", "OBS_VALUE_NIVEAU"])
+
+    df.loc[(df.GEO == "FRA-DEP-05") & (df.FREQ == "A") & (df.ACTIVITY == "I551"), "OBS_VALUE_NIVEAU"] = 0
+    df = df[~((df.GEO == "FRA-DEP-07") & (df.TIME_PERIOD == "2024-05"))]
+
+    return df.astype({colonne: "category" for colonne in df.columns if colonne != "OBS_VALUE_NIVEAU"})
+
+
+def ancienne_chaine(df):
+    """
+    Estimation des campings de l'ancienne chaîne de merges, pour les seuls mois où elle produisait une valeur :
+        Nb_nuitees_mois_camping = Nb_nuitees_an_camping * Nb_nuitees_mois_hotel / Nb_nuitees_an_hotel
+    """
+    df = df.astype({"GEO": str, "TIME_PERIOD": str, "ACTIVITY": str, "FREQ": str})
+    df = df.assign(dept_code=df.GEO.str.split("-").str[-1], annee=df.TIME_PERIOD.str[:4])
+
+    hotels_mois = df[(df.ACTIVITY == "I551") & (df.FREQ == "M")]
+    hotels_an = df[(df.ACTIVITY == "I551") & (df.FREQ == "A")].set_index(["dept_code", "annee"]).OBS_VALUE_NIVEAU
+    campings_an = df[(df.ACTIVITY == "I553") & (df.FREQ == "A")].set_index(["dept_code", "annee"]).OBS_VALUE_NIVEAU
+
+    estimation = {}
+    for ligne in hotels_mois.itertuples():
+        total_hotels = hotels_an[(ligne.dept_code, ligne.annee)]
+        if total_hotels > 0:
+            estimation[(ligne.dept_code, ligne.TIME_PERIOD)] = (campings_an[(ligne.dept_code, ligne.annee)]
+                                                                 * ligne.OBS_VALUE_NIVEAU / total_hotels)
+
+    return estimation
+
+
+def test_equivalence_ancienne_chaine(df_nuitees):
+    df = AttendanceTransformer().transform_data_nb_nuitees(df_nuitees.copy())
+    campings = df[df.id_activity == "I553"].set_index(["dept_code", "time_period"]).nb_nights
+
+    reference = ancienne_chaine(df_nuitees)
+
+    assert len(reference) > 0
+    for cle, valeur in reference.items():
+        assert campings[cle] == pytest.approx(valeur)
+
+
+def test_mois_manquant_part_nationale(df_nuitees):
+    df = AttendanceTransformer().transform_data_nb_nuitees(df_nuitees.copy())
+    campings = df[df.id_activity == "I553"].set_index(["dept_code", "time_period"]).nb_nights
+    hotels = df[df.id_activity == "I551"].set_index(["dept_code", "time_period"]).nb_nights
+
+    brut = df_nuitees.astype({"GEO": str, "TIME_PERIOD": str, "ACTIVITY": str, "FREQ": str})
+    annuel = brut[brut.FREQ == "A"].set_index(["GEO", "ACTIVITY", "TIME_PERIOD"]).OBS_VALUE_NIVEAU
+
+    # Part nationale de mai 2024 : départements dont le mois et le total annuel des hôtels sont connus
+    valides = [f"{d:02d}" for d in range(1, 11) if f"{d:02d}" not in ("05", "07")]
+    part = (sum(hotels[(dept, "2024-05")] for dept in valides)
+            / sum(annuel[(f"FRA-DEP-{dept}", "I551", "2024")] for dept in valides))
+
+    assert campings[("07", "2024-05")] == pytest.approx(annuel[("FRA-DEP-07", "I553", "2024")] * part)
+
+    # Les autres mois du 07 gardent la saisonnalité du département
+    assert campings[("07", "2024-06")] == pytest.approx(annuel[("FRA-DEP-07", "I553", "2024")]
+                                                         * hotels[("07", "2024-06")]
+                                                         / annuel[("FRA-DEP-07", "I551", "2024")])
+
+    # Total hôtelier nul : tous les mois du 05 prennent la part nationale
+    valides = [f"{d:02d}" for d in range(1, 11) if f"{d:02d}" != "05"]
+    part = (sum(hotels[(dept, "2024-01")] for dept in valides)
+            / sum(annuel[(f"FRA-DEP-{dept}", "I551", "2024")] for dept in valides))
+
+    assert campings[("05", "2024-01")] == pytest.approx(annuel[("FRA-DEP-05", "I553", "2024")] * part)
+
+
+def test_mois_observes_conserves():
+    mensuel = np.full((1, 1, 12, 2), np.nan)
+    mensuel[0, 0, :, 0] = np.arange(1, 13)
+    mensuel[0, 0, 0, 1] = 5.0
+    annuel = np.array([[[78.0, 100.0]]])
+
+    complet, estime = desagreger(mensuel, annuel, pd.Index(["I551", "I553"]), "I551")
+
+    # Le mois observé est gardé, les autres mois sont estimés avec le profil des hôtels
+    assert complet[0, 0, 0, 1] == 5.0
+    np.testing.assert_allclose(complet[0, 0, 1:, 1], 100 * np.arange(2, 13) / 78)
+    assert estime[0, 0, :, 1].sum() == 11
+    assert not estime[0, 0, :, 0].any()
+
+
+def test_pivoter_series():
+    df = pd.DataFrame({"dept_code": ["01", "01", "02"],
+                       "temporal_rate": ["A", "M", "M"],
+                       "time_period": ["2024", "2024-07", "2025-01"],
+                       "id_activity": ["I551", "I551", "I553"],
+                       "nb_nights": [10.0, 1.0, 2.0]})
+
+    departements, annees, activites, mensuel, annuel = pivoter_series(df)
+
+    assert list(annees) == [2024, 2025]
+    assert mensuel.shape == (2, 2, 12, 2)
+    assert mensuel[0, 0, 6, 0] == 1.0 and mensuel[1, 1, 0, 1] == 2.0
+    assert annuel[0, 0, 0] == 10.0 and np.isnan(annuel[1, 1, 1])
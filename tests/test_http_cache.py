@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+from extract.http_cache import HttpCache
+
+
+class Reponse():
+    def __init__(self, contenu=b"", status_code=200, headers=None):
+        self.content = contenu
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class Serveur():
+    """
+    Session factice : renvoie 304 aux requêtes conditionnelles dont l'ETag correspond, le contenu sinon.
+    """
+
+    def __init__(self, contenus):
+        self.contenus = contenus
+        self.requetes = []
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.requetes.append((url, dict(headers or {})))
+        contenu = self.contenus[url]
+        etag = f"etag-{len(contenu)}"
+
+        if (headers or {}).get("If-None-Match") == etag:
+            return Reponse(status_code=304)
+
+        return Reponse(contenu, headers={"ETag": etag})
+
+
+@pytest.fixture
+def dossier(tmp_path):
+    return str(tmp_path)
+
+
+def test_reponse_valide_sans_appel_reseau(dossier):
+    serveur = Serveur({"http://a": b"aaa"})
+    cache = HttpCache(dossier)
+
+    assert cache.get("http://a", "insee", session=serveur) == b"aaa"
+    assert cache.get("http://a", "insee", session=serveur) == b"aaa"
+    assert len(serveur.requetes) == 1
+
+
+def test_revalidation(dossier):
+    serveur = Serveur({"http://a": b"aaa"})
+    cache = HttpCache(dossier)
+    cache.get("http://a", "insee", session=serveur)
+
+    # Requête conditionnelle malgré le TTL, le serveur répond 304
+    assert cache.get("http://a", "insee", session=serveur, revalider=True) == b"aaa"
+    assert serveur.requetes[-1][1] == {"If-None-Match": "etag-3"}
+
+    # Contenu révisé : la revalidation le récupère
+    serveur.contenus["http://a"] = b"revise"
+    assert cache.get("http://a", "insee", session=serveur, revalider=True) == b"revise"
+    assert cache.get("http://a", "insee", session=serveur) == b"revise"
+
+
+def test_instances_partagent_l_index(dossier):
+    serveur = Serveur({"http://a": b"aaa", "http://b": b"bbb"})
+    premier, second = HttpCache(dossier), HttpCache(dossier)
+
+    premier.get("http://a", "insee", session=serveur)
+    second.get("http://b", "insee", session=serveur)
+
+    with open(os.path.join(dossier, "index.json"), encoding="utf-8") as f:
+        assert sorted(entree["url"] for entree in json.load(f).values()) == ["http://a", "http://b"]
+
+
+def test_eviction(dossier):
+    serveur = Serveur({"http://a": b"aaa", "http://b": b"bbb", "http://c": b"aaa"})
+    cache = HttpCache(dossier, taille_max=5)
+
+    cache.get("http://a", "insee", session=serveur)
+    cache.get("http://b", "insee", session=serveur)
+
+    assert [entree["url"] for entree in cache.index.values()] == ["http://b"]
+    assert len(os.listdir(cache.blobs_dir)) == 1
+
+    # Un contenu partagé par deux entrées n'est stocké qu'une fois
+    cache = HttpCache(dossier)
+    cache.get("http://a", "insee", session=serveur)
+    cache.get("http://c", "insee", session=serveur)
+    assert len(os.listdir(cache.blobs_dir)) == 2
+
+
+def test_contenu_evince_pendant_la_revalidation(dossier):
+    cache = HttpCache(dossier)
+    serveur = Serveur({"http://a": b"aaa"})
+    cache.get("http://a", "insee", session=serveur)
+
+    class ServeurEvincant(Serveur):
+        def get(self, url, params=None, headers=None, **kwargs):
+            # Une autre instance évince le contenu pendant la requête conditionnelle
+            for blob in os.listdir(cache.blobs_dir):
+                os.remove(os.path.join(cache.blobs_dir, blob))
+            return super().get(url, params=params, headers=headers, **kwargs)
+
+    serveur = ServeurEvincant({"http://a": b"aaa"})
+
+    assert cache.get("http://a", "insee", session=serveur, revalider=True) == b"aaa"
+    assert serveur.requetes[-1][1] == {}
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from transform.near_duplicates import find_near_duplicates, normaliser_noms
+from transform.spatial_index import RAYON_TERRE_KM
+
+KM_PAR_DEGRE = 2 * np.pi * RAYON_TERRE_KM / 360
+
+
+def test_normaliser_noms():
+    assert list(normaliser_noms(["La Citadelle - Calvi", "Église  d'Ajaccio", None])) == \
+        ["citadelle calvi", "eglise ajaccio", ""]
+
+
+@pytest.mark.parametrize("distance_km", [0.1, 0.5, 0.9, 0.99])
+def test_rappel_paires_proches(distance_km):
+    # Chaque POI a un double au même nom à distance_km, dans une direction quelconque
+    rng = np.random.default_rng(1)
+    nb = 300
+
+    latitudes = 45 + rng.random(nb)
+    longitudes = 2 + 3 * rng.random(nb)
+    angles = 2 * np.pi * rng.random(nb)
+
+    latitudes_doubles = latitudes + distance_km * np.cos(angles) / KM_PAR_DEGRE
+    longitudes_doubles = longitudes + distance_km * np.sin(angles) / (KM_PAR_DEGRE * np.cos(np.radians(latitudes)))
+
+    noms = [f"Chateau numero {k}" for k in range(nb)] * 2
+    groupes = find_near_duplicates(noms, np.r_[latitudes, latitudes_doubles], np.r_[longitudes, longitudes_doubles])
+
+    assert (groupes[:nb] == groupes[nb:]).all()
+
+
+def test_noms_proches_et_eloignes():
+    noms = ["Citadelle de Calvi", "La citadelle - Calvi", "Citadelle de Calvi", "Musée Fesch"]
+    latitudes = [42.567, 42.568, 43.567, 42.567]
+    longitudes = [8.758, 8.759, 8.758, 8.758]
+
+    groupes = find_near_duplicates(noms, latitudes, longitudes, max_distance_km=1.0)
+
+    # Même lieu sous deux noms ; même nom à 110 km ; nom différent au même endroit
+    assert groupes[0] == groupes[1]
+    assert groupes[2] != groupes[0]
+    assert groupes[3] != groupes[0]
+
+
+def test_distance_invalide():
+    with pytest.raises(ValueError):
+        find_near_duplicates(["a", "b"], [45.0, 45.0], [2.0, 2.0], max_distance_km=0)
+
+
+def test_case_trop_dense_ignoree():
+    rng = np.random.default_rng(2)
+    nb = 2000
+
+    groupes = find_near_duplicates(["Parking"] * nb, 45 + 0.001 * rng.random(nb), 2 + 0.001 * rng.random(nb),
+                                   max_par_case=100)
+
+    assert len(np.unique(groupes)) == nb
@@ -0,0 +1,127 @@
+import pandas as pd
+import pytest
+
+from extract.extract_affluences import AttendanceExtractor, ExtractionIncomplete
+from extract.partition_store import PartitionStore, periode_terminee
+
+
+def observations(periodes, departements, statut="A"):
+    return pd.DataFrame([{"GEO": f"FRA-DEP-{dept}", "TIME_PERIOD": periode, "ACTIVITY": "I551",
+                          "OBS_STATUS": statut, "OBS_VALUE_NIVEAU": 1.0}
+                         for periode in periodes for dept in departements])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionStore(str(tmp_path))
+
+
+def test_periode_terminee():
+    import datetime
+    aujourd_hui = datetime.date(2025, 7, 15)
+
+    assert periode_terminee("2024", aujourd_hui)
+    assert not periode_terminee("2025", aujourd_hui)
+    assert periode_terminee("2025-06", aujourd_hui)
+    assert not periode_terminee("2025-07", aujourd_hui)
+
+
+def test_statut_provisoire(store):
+    store.ecrire("DS", observations(["2023"], ["01"]), ["2023"])
+    store.ecrire("DS", observations(["2024"], ["01"], statut="P"), ["2024"])
+
+    assert not store.index("DS")["2023"]["provisoire"]
+    assert store.index("DS")["2024"]["provisoire"]
+    assert store.a_telecharger("DS", ["2023", "2024", "2022"]) == ["2024", "2022"]
+
+
+def test_periode_vide_ne_remplace_pas_la_partition(store):
+    store.ecrire("DS", observations(["2024"], ["01", "02"], statut="P"), ["2024"])
+
+    store.ecrire("DS", pd.DataFrame(), ["2024"], provisoires=["2024"])
+
+    entree = store.index("DS")["2024"]
+    assert entree["nb_observations"] == 2 and entree["provisoire"]
+    assert len(store.lire("DS", ["2024"])) == 2
+    assert store.complete("DS", "2024")
+
+
+def test_extraction_partielle_ne_remplace_pas_la_partition(store):
+    store.ecrire("DS", observations(["2024"], ["01", "02"]), ["2024"])
+
+    store.ecrire("DS", observations(["2024"], ["01"]), ["2024"], provisoires=["2024"])
+
+    assert len(store.lire("DS", ["2024"])) == 2
+    assert store.index("DS")["2024"]["provisoire"]
+
+
+def test_extraction_partielle_sans_historique(store):
+    store.ecrire("DS", observations(["2024"], ["01"]), ["2024"], provisoires=["2024"])
+
+    assert len(store.lire("DS", ["2024"])) == 1
+    assert not store.complete("DS", "2024")
+
+    # Une extraction complète remplace la partition incomplète
+    store.ecrire("DS", observations(["2024"], ["01", "02"]), ["2024"])
+
+    assert store.complete("DS", "2024")
+    assert not store.index("DS")["2024"]["provisoire"]
+
+
+class ExtracteurFactice(AttendanceExtractor):
+    """
+    Extracteur dont l'API est remplacée par un scénario : "ok", "partiel" (un département manque) ou "echec".
+    """
+
+    def __init__(self, historique):
+        super().__init__(cache=object(), historique=historique)
+        self.scenario = "ok"
+        self.appels = []
+
+    def extract_data_partitionnee(self, dataset, params, dimensions_decoupage, revalider=False):
+        self.appels.append((dataset, params.get("TIME_PERIOD"), revalider))
+        periodes = params.get("TIME_PERIOD", ["2025"])
+
+        if self.scenario == "partiel":
+            raise ExtractionIncomplete(dataset, observations(periodes, ["01"]), [{**params, "GEO": ["02"]}])
+        if self.scenario == "echec":
+            raise ExtractionIncomplete(dataset, pd.DataFrame(), [params])
+
+        return observations(periodes, ["01", "02"], statut="P" if dataset == "DS_TOUR_CAP" else "A")
+
+
+def test_capacites_incompletes(store):
+    extracteur = ExtracteurFactice(store)
+
+    extracteur.scenario = "echec"
+    with pytest.raises(ExtractionIncomplete):
+        extracteur.extract_data_capacite()
+
+    extracteur.scenario = "ok"
+    assert len(extracteur.extract_data_capacite()) == 2
+
+    # L'année la plus récente, provisoire, est redemandée (en revalidant le cache HTTP) ; l'extraction partielle
+    # ne remplace pas les capacités complètes déjà stockées
+    extracteur.scenario = "partiel"
+    assert len(extracteur.extract_data_capacite()) == 2
+    assert extracteur.appels[-1] == ("DS_TOUR_CAP", None, True)
+
+
+def test_nuitees_incompletes(store):
+    extracteur = ExtracteurFactice(store)
+
+    extracteur.scenario = "partiel"
+    with pytest.raises(ExtractionIncomplete):
+        extracteur.extract_data_nb_nuitees([2024])
+
+    assert all(store.index("DS_TOUR_FREQ")[periode]["provisoire"] for periode in store.periodes("DS_TOUR_FREQ"))
+
+    extracteur.scenario = "ok"
+    df = extracteur.extract_data_nb_nuitees([2024])
+
+    assert len(df) == 2 * 13
+    assert store.a_telecharger("DS_TOUR_FREQ", store.periodes("DS_TOUR_FREQ")) == []
+
+    # Plus rien à télécharger : une nouvelle panne ne change rien
+    extracteur.scenario = "echec"
+    assert len(extracteur.extract_data_nb_nuitees([2024])) == 2 * 13
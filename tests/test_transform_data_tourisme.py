@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import transform.transform_data_tourisme as transform_data_tourisme
+from transform.transform_data_tourisme import DataTourismTransformer, deduplicate
+
+
+CAT_TO_KEEP = ["Hotel", "Restaurant", "Museum", "Beach"]
+CATEGORIE_DICT = {"Logement": ["Hotel"], "Nourriture": ["Restaurant"], "Culture": ["Museum"]}
+ONTOLOGIE = "https://www.datatourisme.fr/ontology/core#"
+
+
+@pytest.fixture
+def df_communes():
+    return pd.DataFrame({"code_insee": ["2A004", "2B033", "69123", "69266"],
+                         "latitude_centre": [41.92, 42.70, 45.76, 45.77],
+                         "longitude_centre": [8.74, 9.45, 4.83, 4.88],
+                         "code_cluster": [1, 2, 3, 3],
+                         "code_postal": [20000, 20200, 69001, 69100],
+                         "population": [70000, 48000, 520000, 150000]})
+
+
+def export(nb=120, graine=0):
+    """
+    Export DataTourisme synthétique : POI autour de quatre communes, avec des doublons (même nom, mêmes
+    coordonnées, identifiants différents et pas dans l'ordre de l'export) plus ou moins complets, et des
+    catégories hors de cat_to_keep.
+    """
+    rng = np.random.default_rng(graine)
+    centres = [(41.92, 8.74, "20000#Ajaccio"), (42.70, 9.45, "20200#Bastia"),
+               (45.76, 4.83, "69001#Lyon"), (45.77, 4.88, "69100#Villeurbanne")]
+    categories = ["Hotel", "Restaurant", "Museum", "Beach", "Parking"]
+
+    lignes = []
+    for k in range(nb):
+        latitude, longitude, commune = centres[(k // 3) % 4]
+        categorie = categories[rng.integers(len(categories))]
+        lignes.append({"Nom_du_POI": f"Lieu {k // 3}",
+                       "Categories_de_POI": f"{ONTOLOGIE}PointOfInterest|{ONTOLOGIE}{categorie}|http://schema.org/Place",
+                       "Latitude": round(latitude + 0.001 * (k // 3), 6),
+                       "Longitude": round(longitude, 6),
+                       "Code_postal_et_commune": commune,
+                       "Date_de_mise_a_jour": "2024-01-01",
+                       "Description": None if rng.random() < 0.5 else "description",
+                       "URI_ID_du_POI": f"https://data.datatourisme.fr/1/{(k * 7919) % 1009:04d}-{k}"})
+
+    return pd.DataFrame(lignes)
+
+
+def transformer(df, df_communes):
+    return DataTourismTransformer(df, CAT_TO_KEEP, CATEGORIE_DICT, df_communes, avertissements=False)
+
+
+def test_deduplicate_garde_l_ordre_et_la_ligne_la_plus_complete():
+    df = pd.DataFrame({"dedup_hash": [2, 1, 2, 1, 3], "nb_nan": [1, 0, 0, 0, 0]},
+                      index=["e", "d", "c", "b", "a"])
+
+    assert list(deduplicate(df).index) == ["d", "c", "a"]
+
+
+def test_classification_par_bits(df_communes):
+    t = transformer(export(), df_communes)
+    df = t.clean_data()
+
+    # Les POI dont aucune sous-catégorie n'est à garder (Parking) sont retirés, Beach est classée dans Autre
+    assert set(df["Categorie_simplifiee"].astype(str)) <= {"Logement", "Nourriture", "Culture", "Autre"}
+    assert df["ID"].is_unique
+    assert len(df) < len(t.df_tourism[~t.df_tourism["Categories_de_POI"].str.contains("Parking")])
+    assert df["Cluster_id"].notna().all()
+
+
+def verifier_equivalence(t_incremental, df_incremental, df_brut, df_communes):
+    t_complet = transformer(df_brut, df_communes)
+    df_complet = t_complet.clean_data()
+    t_complet.build_count_matrix()
+
+    pd.testing.assert_frame_equal(df_incremental, df_complet)
+
+    comptages = pd.DataFrame(t_incremental.count_matrix, index=t_incremental.cluster_ids)
+    comptages = comptages[comptages.sum(axis=1) > 0]
+    np.testing.assert_array_equal(comptages.to_numpy(), t_complet.count_matrix)
+
+
+def test_incremental_equivalent_a_clean_data(tmp_path, df_communes):
+    etat = str(tmp_path / "etat")
+    brut = export()
+
+    t = transformer(brut, df_communes)
+    verifier_equivalence(t, t.clean_data_incremental(etat), brut, df_communes)
+
+    # Modification (dont un doublon), suppressions et insertion
+    brut2 = brut.copy()
+    brut2.loc[4, "Description"] = "description complétée"
+    brut2.loc[4, "Date_de_mise_a_jour"] = "2025-01-01"
+    brut2.loc[7, "Nom_du_POI"] = "Lieu renommé"
+    brut2 = brut2.drop(index=[10, 11, 30])
+    nouveau = brut.iloc[[20]].assign(URI_ID_du_POI="https://data.datatourisme.fr/1/nouveau", Nom_du_POI="Nouveau lieu")
+    brut2 = pd.concat([brut2, nouveau], ignore_index=True)
+
+    t = transformer(brut2, df_communes)
+    verifier_equivalence(t, t.clean_data_incremental(etat), brut2, df_communes)
+
+    # Sans changement
+    t = transformer(brut2, df_communes)
+    verifier_equivalence(t, t.clean_data_incremental(etat), brut2, df_communes)
+
+
+def test_incremental_ecriture_interrompue(tmp_path, df_communes, monkeypatch):
+    etat = str(tmp_path / "etat")
+    brut = export()
+    transformer(brut, df_communes).clean_data_incremental(etat)
+
+    brut2 = brut.drop(index=[0, 1, 2]).reset_index(drop=True)
+
+    # Les partitions sont réécrites mais etat.pkl ne l'est pas
+    remplacer = os.replace
+
+    def replace_interrompu(source, destination):
+        if destination.endswith("etat.pkl"):
+            raise KeyboardInterrupt
+        remplacer(source, destination)
+
+    monkeypatch.setattr(transform_data_tourisme.os, "replace", replace_interrompu)
+    with pytest.raises(KeyboardInterrupt):
+        transformer(brut2, df_communes).clean_data_incremental(etat)
+    monkeypatch.setattr(transform_data_tourisme.os, "replace", remplacer)
+
+    t = transformer(brut2, df_communes)
+    verifier_equivalence(t, t.clean_data_incremental(etat), brut2, df_communes)
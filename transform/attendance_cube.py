@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from transform.cluster_lookup import ClusterLookup
+
+
+class AttendanceCube() :
+    """
+    Modèle d'affluence stocké dans un cube numpy float32 indexé par (commune, activité, période), dont les axes
+    sont codés en entiers (self.communes, self.activites, self.periodes). Les nuitées de chaque département sont
+    réparties entre ses communes proportionnellement à leur capacité d'hébergement, par broadcasting :
+        nuitees_commune = nuitees_dept * capacite_commune / capacite_dept
+    sans construire la table longue commune x activité x période (cf to_frame, export explicite et optionnel).
+    """
+
+    def __init__(self, df_capacite, df_nb_nuitees):
+        """
+        Args:
+            df_capacite (pd.DataFrame): capacités par commune (cf AttendanceTransformer.transform_data_capacite)
+            df_nb_nuitees (pd.DataFrame): nuitées par département et par mois
+        (cf AttendanceTransformer.transform_data_nb_nuitees)
+        """
+
+        ### Axes codés en entiers ###
+
+        code_commune, self.communes = pd.factorize(df_capacite['insee_code'])
+        code_activite_cap, self.activites = pd.factorize(pd.concat([df_capacite['id_activity'],
+                                                                    df_nb_nuitees['id_activity']], ignore_index=True))
+        code_activite_nuit = code_activite_cap[len(df_capacite):]
+        code_activite_cap = code_activite_cap[:len(df_capacite)]
+
+        code_periode, self.periodes = pd.factorize(df_nb_nuitees['time_period'], sort=True)
+
+        code_dept, self.departements = pd.factorize(pd.concat([df_capacite['dept_code'], df_nb_nuitees['dept_code']],
+                                                              ignore_index=True))
+        code_dept_nuit = code_dept[len(df_capacite):]
+        code_dept_cap = code_dept[:len(df_capacite)]
+
+        # Libellés des activités, ceux de la table des capacités en priorité
+        self.activity_types = dict(zip(pd.concat([df_nb_nuitees['id_activity'], df_capacite['id_activity']]),
+                                       pd.concat([df_nb_nuitees['activity_type'], df_capacite['activity_type']])))
+
+        nb_communes, nb_activites = len(self.communes), len(self.activites)
+        nb_periodes, nb_depts = len(self.periodes), len(self.departements)
+
+        ### Capacités (commune x activité) et département de chaque commune ###
+
+        self.commune_dept = np.zeros(nb_communes, dtype=np.int64)
+        self.commune_dept[code_commune] = code_dept_cap
+
+        self.capacite = np.zeros((nb_communes, nb_activites), dtype=np.float32)
+        np.add.at(self.capacite, (code_commune, code_activite_cap),
+                  df_capacite['capacity'].fillna(0).to_numpy(dtype=np.float32))
+
+        # Couples (commune, activité) présents dans la table des capacités
+        self.a_capacite = np.zeros((nb_communes, nb_activites), dtype=bool)
+        self.a_capacite[code_commune, code_activite_cap] = True
+
+        self.capacite_dept = np.zeros((nb_depts, nb_activites), dtype=np.float32)
+        np.add.at(self.capacite_dept, self.commune_dept, self.capacite)
+
+        ### Nuitées (département x activité x période), NaN si non publiées ###
+
+        self.nuitees_dept = np.full((nb_depts, nb_activites, nb_periodes), np.nan, dtype=np.float32)
+        self.publie = np.zeros((nb_depts, nb_activites, nb_periodes), dtype=bool)
+
+        garder = code_periode >= 0
+        cellules = (code_dept_nuit[garder], code_activite_nuit[garder], code_periode[garder])
+        self.nuitees_dept[cellules] = df_nb_nuitees['nb_nights'].to_numpy(dtype=np.float32)[garder]
+        self.publie[cellules] = True
+
+        ### Répartition par broadcasting (les nuitées sont publiées en milliers) ###
+
+        part = np.divide(self.capacite, self.capacite_dept[self.commune_dept],
+                         out=np.full_like(self.capacite, np.nan), where=self.capacite_dept[self.commune_dept] > 0)
+
+        self.cube = self.nuitees_dept[self.commune_dept] * (1000 * part)[:, :, None]
+
+    def presence(self):
+        """
+        Cellules (commune, activité, période) renseignées : la commune a une capacité pour l'activité et son
+        département une ligne de nuitées pour la période (comme le merge de creation_dataframe_affluences).
+        """
+        return self.a_capacite[:, :, None] & self.publie[self.commune_dept]
+
+    def incidence_clusters(self, df_communes):
+        """
+        Matrice creuse (nb_clusters, nb_communes) de rattachement des communes à leur cluster
+        (cf transform/cluster_lookup.py). Les communes sans cluster ne sont rattachées à aucune ligne.
+        Returns:
+            incidence (sparse.csr_matrix): matrice d'incidence
+            cluster_ids (np.ndarray): code du cluster de chaque ligne
+        """
+        code_cluster = ClusterLookup(df_communes).lookup(self.communes)
+
+        cluster_ids, ligne = np.unique(code_cluster, return_inverse=True)
+        garder = code_cluster > 0
+
+        incidence = sparse.csr_matrix((np.ones(garder.sum(), dtype=np.float32),
+                                       (ligne[garder], np.flatnonzero(garder))),
+                                      shape=(len(cluster_ids), len(self.communes)))
+
+        # La ligne du code 0 (communes sans cluster) est retirée
+        lignes = cluster_ids > 0
+
+        return incidence[lignes], cluster_ids[lignes]
+
+    def cluster_totals(self, df_communes):
+        """
+        Totaux par cluster, par un produit matrice d'incidence x cube.
+        Returns:
+            cluster_ids (np.ndarray): codes des clusters
+            capacite (np.ndarray): capacités (nb_clusters, nb_activites, nb_periodes), des seules communes dont
+        le département a des nuitées pour la période
+            nuitees (np.ndarray): nuitées (nb_clusters, nb_activites, nb_periodes)
+            presence (np.ndarray): nombre de cellules renseignées agrégées
+        """
+        incidence, cluster_ids = self.incidence_clusters(df_communes)
+
+        presence = self.presence()
+        forme = (len(cluster_ids),) + self.cube.shape[1:]
+
+        capacite = incidence @ np.where(presence, self.capacite[:, :, None], 0).reshape(len(self.communes), -1)
+        nuitees = incidence @ np.nan_to_num(np.where(presence, self.cube, 0)).reshape(len(self.communes), -1)
+        nb_presents = incidence @ presence.reshape(len(self.communes), -1).astype(np.float32)
+
+        return cluster_ids, capacite.reshape(forme), nuitees.reshape(forme), nb_presents.reshape(forme)
+
+    def cluster_frame(self, df_communes):
+        """
+        Export long des totaux par cluster (mêmes colonnes que AttendanceTransformer.affluences_cluster).
+        """
+        cluster_ids, capacite, nuitees, nb_presents = self.cluster_totals(df_communes)
+
+        cl, act, per = np.nonzero(nb_presents > 0)
+
+        return pd.DataFrame({'code_cluster': cluster_ids[cl],
+                             'id_activity': np.asarray(self.activites)[act],
+                             'activity_type': pd.Series(np.asarray(self.activites)[act]).map(self.activity_types).to_numpy(),
+                             'time_period': np.asarray(self.periodes)[per],
+                             'capacity_zone': capacite[cl, act, per],
+                             'nb_nights_zone': nuitees[cl, act, per]})
+
+    def to_frame(self):
+        """
+        Export long, une ligne par cellule renseignée du cube (commune, activité, période), comparable à la table
+        de AttendanceTransformer.creation_dataframe_affluences. Étape explicite et optionnelle : le cube suffit
+        aux calculs.
+        """
+        com, act, per = np.nonzero(self.presence())
+        dept = self.commune_dept[com]
+
+        return pd.DataFrame({'insee_code': np.asarray(self.communes)[com],
+                             'dept_code': np.asarray(self.departements)[dept],
+                             'id_activity': np.asarray(self.activites)[act],
+                             'activity_type': pd.Series(np.asarray(self.activites)[act]).map(self.activity_types).to_numpy(),
+                             'capacity_city': self.capacite[com, act],
+                             'capacity_dept': self.capacite_dept[dept, act],
+                             'time_period': np.asarray(self.periodes)[per],
+                             'nb_nights_dept': self.nuitees_dept[dept, act, per],
+                             'nb_nights_city': self.cube[com, act, per]})
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+# Un code INSEE (5 caractères) est encodé en entier : numéro de département * 1000 + numéro de commune.
+# Les départements corses 2A et 2B, non numériques, sont encodés 100 et 101.
+DEPARTEMENTS_NON_NUMERIQUES = {"2A": "100", "2B": "101"}
+TAILLE_TABLE = 102 * 1000
+
+
+def encoder_code_insee(codes):
+    """
+    Encode des codes INSEE de communes en entiers compacts, utilisables comme indices de tableau.
+    Args:
+        codes (array-like): codes INSEE (chaînes ou entiers ayant perdu leur zéro initial)
+    Returns:
+        codes_entiers (np.ndarray): codes encodés, -1 pour les codes invalides ou manquants
+    """
+    codes = pd.Series(codes).astype("string").str.zfill(5)
+
+    departement = codes.str[:2].replace(DEPARTEMENTS_NON_NUMERIQUES)
+    departement = pd.to_numeric(departement, errors="coerce")
+    commune = pd.to_numeric(codes.str[2:], errors="coerce")
+
+    codes_entiers = (departement * 1000 + commune).fillna(-1).to_numpy(dtype=np.int64)
+    codes_entiers[(codes_entiers < 0) | (codes_entiers >= TAILLE_TABLE)] = -1
+
+    return codes_entiers
+
+
+class ClusterLookup() :
+    """
+    Table de correspondance code INSEE -> code_cluster, stockée dans un tableau numpy indexé par le
+    code INSEE encodé (cf encoder_code_insee). Construite une fois à partir de la table des communes,
+    elle est partagée par les transformers pour rattacher des communes à leur cluster par simple
+    indexation, sans merge ni parcours de la table des communes.
+    """
+
+    def __init__(self, df_communes, colonne_code="code_insee", colonne_cluster="code_cluster"):
+        """
+        Args:
+            df_communes (pd.DataFrame): table des communes nettoyée (cf TownTransformer.clean_data)
+            colonne_code (str): colonne des codes INSEE
+            colonne_cluster (str): colonne des codes de cluster (entiers >= 1)
+        """
+        codes = encoder_code_insee(df_communes[colonne_code])
+        valides = codes >= 0
+
+        # 0 signifie "commune sans cluster"
+        self.table = np.zeros(TAILLE_TABLE, dtype=np.int32)
+        self.table[codes[valides]] = df_communes[colonne_cluster].to_numpy()[valides]
+
+    def lookup(self, codes):
+        """
+        Renvoie le code_cluster de chaque code INSEE.
+        Args:
+            codes (array-like): codes INSEE
+        Returns:
+            clusters (np.ndarray): codes des clusters, 0 pour les communes inconnues
+        """
+        codes = encoder_code_insee(codes)
+
+        return np.where(codes >= 0, self.table[np.maximum(codes, 0)], 0)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+
+NB_MOIS = 12
+
+
+def pivoter_series(df_series):
+    """
+    Range des séries annuelles et mensuelles dans des tableaux numpy indexés par des axes codés en entiers.
+    Args:
+        df_series (pd.DataFrame): une ligne par observation, colonnes dept_code, temporal_rate ('A' ou 'M'),
+    time_period ('2024' ou '2024-07'), id_activity et nb_nights
+    Returns:
+        departements (pd.Index): axe des départements
+        annees (np.ndarray): axe des années, trié
+        activites (pd.Index): axe des activités
+        mensuel (np.ndarray): tableau (département x année x mois x activité), NaN si non observé
+        annuel (np.ndarray): tableau (département x année x activité), NaN si non observé
+    """
+    periodes = df_series['time_period'].astype(str)
+    frequences = df_series['temporal_rate'].astype(str).to_numpy()
+
+    annee = pd.to_numeric(periodes.str[:4], errors='coerce').to_numpy()
+    mois = pd.to_numeric(periodes.str[5:7], errors='coerce').to_numpy()
+
+    code_dept, departements = pd.factorize(df_series['dept_code'])
+    code_activite, activites = pd.factorize(df_series['id_activity'])
+
+    annees = np.unique(annee[~np.isnan(annee)]).astype(int)
+    code_annee = np.searchsorted(annees, np.nan_to_num(annee))
+
+    valeurs = df_series['nb_nights'].to_numpy(dtype=float)
+    valide = (code_dept >= 0) & (code_activite >= 0) & ~np.isnan(annee)
+
+    mensuel = np.full((len(departements), len(annees), NB_MOIS, len(activites)), np.nan)
+    est_mensuel = valide & (frequences == 'M') & (mois >= 1) & (mois <= NB_MOIS)
+    mensuel[code_dept[est_mensuel], code_annee[est_mensuel],
+            mois[est_mensuel].astype(int) - 1, code_activite[est_mensuel]] = valeurs[est_mensuel]
+
+    annuel = np.full((len(departements), len(annees), len(activites)), np.nan)
+    est_annuel = valide & (frequences == 'A')
+    annuel[code_dept[est_annuel], code_annee[est_annuel], code_activite[est_annuel]] = valeurs[est_annuel]
+
+    return departements, annees, activites, mensuel, annuel
+
+
+def profils_saisonniers(mensuel_reference, annuel_reference):
+    """
+    Profils saisonniers (part de chaque mois dans le total annuel) d'une activité de référence, par département
+    et par année. Chaque département garde ses propres parts pour les mois observés ; un mois manquant, ou tous
+    les mois d'un département dont le total annuel est nul ou manquant, prennent la part nationale du mois
+    (départements où ce mois et le total annuel sont connus, agrégés), et à défaut une part uniforme.
+    Args:
+        mensuel_reference (np.ndarray): tableau (département x année x mois)
+        annuel_reference (np.ndarray): tableau (département x année)
+    Returns:
+        profils (np.ndarray): tableau (département x année x mois)
+    """
+    valide = (annuel_reference[:, :, None] > 0) & np.isfinite(mensuel_reference)
+    annuel = np.broadcast_to(annuel_reference[:, :, None], mensuel_reference.shape)
+
+    profils = np.divide(mensuel_reference, annuel, out=np.full_like(mensuel_reference, np.nan), where=valide)
+
+    total_mois = np.where(valide, mensuel_reference, 0).sum(axis=0)
+    total_annee = np.where(valide, annuel, 0).sum(axis=0)
+
+    national = np.divide(total_mois, total_annee, out=np.full_like(total_mois, 1 / NB_MOIS), where=total_annee > 0)
+
+    return np.where(valide, profils, national[None])
+
+
+def desagreger(mensuel, annuel, activites, activite_reference):
+    """
+    Complète les séries mensuelles : chaque mois non observé d'une activité dont le total annuel est connu reçoit
+    la part de ce total donnée par le profil saisonnier de l'activité de référence, en une seule opération de
+    broadcasting sur toutes les années, tous les départements et toutes les activités :
+        Nb_mois_activite = Nb_annee_activite * Nb_mois_reference / Nb_annee_reference
+    Les mois observés sont conservés tels quels.
+    Args:
+        mensuel (np.ndarray): tableau (département x année x mois x activité) (cf pivoter_series)
+        annuel (np.ndarray): tableau (département x année x activité)
+        activites (pd.Index): axe des activités
+        activite_reference (str): activité dont les profils saisonniers servent à l'estimation
+    Returns:
+        mensuel_complet (np.ndarray): tableau (département x année x mois x activité), NaN si ni observé
+    ni estimable
+        estime (np.ndarray): booléens, True pour les mois estimés
+    """
+    if activite_reference in activites:
+        reference = activites.get_loc(activite_reference)
+        profils = profils_saisonniers(mensuel[:, :, :, reference], annuel[:, :, reference])
+    else:
+        profils = np.full(mensuel.shape[:3], 1 / NB_MOIS)
+
+    observe = np.isfinite(mensuel)
+
+    estimation = annuel[:, :, None, :] * profils[:, :, :, None]
+
+    mensuel_complet = np.where(observe, mensuel, estimation)
+    estime = ~observe & np.isfinite(annuel)[:, :, None, :]
+
+    return mensuel_complet, estime
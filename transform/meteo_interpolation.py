@@ -0,0 +1,172 @@
+import hashlib
+import os
+
+import numpy as np
+from scipy import sparse
+
+from transform.spatial_index import SpatialIndex
+
+
+# Gradient thermique vertical moyen (°C par mètre) pour la correction d'altitude des températures
+GRADIENT_THERMIQUE = 0.0065
+
+# Distance plancher (km) de la pondération inverse : une commune sur une station ne lui donne pas un poids infini
+DISTANCE_MIN_KM = 0.5
+
+# Version du calcul des poids, incluse dans leur empreinte : un changement de calcul invalide les poids conservés
+VERSION_POIDS = 2
+
+# Les poids sont conservés sur disque, indexés par l'empreinte des stations, des communes et des paramètres,
+# dans data/cache/interpolation quel que soit le dossier courant
+DOSSIER_POIDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "interpolation")
+
+
+def empreinte(*tableaux):
+    """
+    Empreinte sha256 d'une suite de tableaux (coordonnées, altitudes, paramètres, ...).
+    """
+    h = hashlib.sha256()
+    for tableau in tableaux:
+        h.update(np.ascontiguousarray(np.asarray(tableau, dtype=float)).tobytes())
+        h.update(b"|")
+
+    return h.hexdigest()[:16]
+
+
+def poids_idw(index, latitudes, longitudes, k=4, puissance=2, max_distance_km=None):
+    """
+    Matrice creuse (nb_points, nb_stations) des poids de pondération inverse à la distance : chaque point reçoit
+    ses k stations les plus proches, avec des poids en 1 / distance**puissance normalisés à 1.
+    Args:
+        index (SpatialIndex): index spatial des stations
+        latitudes (array-like): latitudes des points
+        longitudes (array-like): longitudes des points
+        k (int): nombre de stations par point
+        puissance (float): exposant de la distance
+        max_distance_km (float): distance maximale entre un point et ses stations
+    Returns:
+        poids (sparse.csr_matrix): une ligne par point, vide si aucune station n'est assez proche
+    """
+    indices, distances = index.query(latitudes, longitudes, k=k, max_distance_km=max_distance_km)
+    indices = indices.reshape(len(indices), -1)
+    distances = distances.reshape(len(distances), -1)
+
+    trouve = indices >= 0
+    poids = np.where(trouve, 1 / np.maximum(distances, DISTANCE_MIN_KM) ** puissance, 0)
+
+    total = poids.sum(axis=1, keepdims=True)
+    poids = np.divide(poids, total, out=np.zeros_like(poids), where=total > 0)
+
+    lignes = np.repeat(np.arange(len(indices)), indices.shape[1]).reshape(indices.shape)
+
+    return sparse.csr_matrix((poids[trouve], (lignes[trouve], indices[trouve])),
+                             shape=(len(indices), index.nb_points))
+
+
+class StationInterpolator() :
+    """
+    Interpolation des données des stations météo vers les communes puis les clusters. Les poids (commune x station,
+    puis cluster x station par moyenne des communes pondérée par leur population) sont calculés une fois et
+    conservés sur disque : ils ne sont recalculés que si les stations, les communes ou les paramètres changent.
+    Interpoler un tableau (station x mois x variable) est alors un seul produit matrice creuse x matrice dense.
+    """
+
+    def __init__(self, df_stations, df_communes, k=4, puissance=2, max_distance_km=None,
+                 altitudes_stations=None, dossier=DOSSIER_POIDS):
+        """
+        Args:
+            df_stations (pd.DataFrame): stations (Latitude, Longitude), dans l'ordre des station_id
+            df_communes (pd.DataFrame): communes (latitude_centre, longitude_centre, code_cluster, population et,
+        pour la correction d'altitude, altitude_moyenne)
+            k (int): nombre de stations par commune
+            puissance (float): exposant de la pondération inverse à la distance
+            max_distance_km (float): distance maximale entre une commune et ses stations
+            altitudes_stations (array-like): altitude de chaque station, None pour ne pas corriger les températures
+            dossier (str): dossier des poids conservés
+        """
+        df_communes = df_communes.dropna(subset=["latitude_centre", "longitude_centre", "code_cluster"])
+
+        latitudes_st = df_stations["Latitude"].to_numpy(dtype=float)
+        longitudes_st = df_stations["Longitude"].to_numpy(dtype=float)
+
+        self.cluster_ids, code_cluster = np.unique(df_communes["code_cluster"].to_numpy(), return_inverse=True)
+
+        corriger = altitudes_stations is not None and "altitude_moyenne" in df_communes
+        altitudes_st = np.asarray(altitudes_stations, dtype=float) if corriger else np.zeros(len(df_stations))
+        altitudes_com = df_communes["altitude_moyenne"].to_numpy(dtype=float) if corriger else np.zeros(len(df_communes))
+
+        self.signature = empreinte(latitudes_st, longitudes_st, altitudes_st,
+                                   df_communes["latitude_centre"], df_communes["longitude_centre"], altitudes_com,
+                                   code_cluster, df_communes["population"],
+                                   [k, puissance, -1 if max_distance_km is None else max_distance_km, VERSION_POIDS])
+        chemin = os.path.join(dossier, f"poids_{self.signature}.npz")
+
+        if os.path.exists(chemin):
+            with np.load(chemin) as data:
+                self.poids_clusters = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]),
+                                                        shape=tuple(data["shape"]))
+                self.correction_altitude = data["correction_altitude"]
+            return
+
+        print("📐 Calcul des poids d'interpolation stations -> communes -> clusters...")
+
+        index = SpatialIndex(latitudes_st, longitudes_st)
+        poids_communes = poids_idw(index, df_communes["latitude_centre"], df_communes["longitude_centre"],
+                                   k=k, puissance=puissance, max_distance_km=max_distance_km)
+
+        # Moyenne des communes de chaque cluster pondérée par la population (uniforme si elle est nulle)
+        population = df_communes["population"].fillna(0).to_numpy(dtype=float)
+        population_cluster = np.bincount(code_cluster, weights=population, minlength=len(self.cluster_ids))
+        nb_communes = np.bincount(code_cluster, minlength=len(self.cluster_ids))
+        ponderation = np.where(population_cluster[code_cluster] > 0,
+                               population / np.maximum(population_cluster[code_cluster], 1),
+                               1 / nb_communes[code_cluster])
+
+        incidence = sparse.csr_matrix((ponderation, (code_cluster, np.arange(len(df_communes)))),
+                                      shape=(len(self.cluster_ids), len(df_communes)))
+
+        self.poids_clusters = (incidence @ poids_communes).tocsr()
+
+        # Température ramenée à l'altitude des communes : + gradient x (altitude des stations - altitude des communes).
+        # L'altitude moyenne des stations d'une commune est renormalisée sur les stations d'altitude connue ; une
+        # commune sans altitude, ou dont aucune station n'a d'altitude connue, est exclue de la moyenne du cluster,
+        # et un cluster sans aucune commune corrigeable n'est pas corrigé
+        connue = ~np.isnan(altitudes_st)
+        poids_connus = poids_communes @ connue.astype(float)
+        altitude_stations_com = np.divide(poids_communes @ np.where(connue, altitudes_st, 0), poids_connus,
+                                          out=np.full(len(df_communes), np.nan), where=poids_connus > 0)
+
+        correction_communes = GRADIENT_THERMIQUE * (altitude_stations_com - altitudes_com)
+        corrigeable = ~np.isnan(correction_communes)
+
+        somme = incidence @ np.where(corrigeable, correction_communes, 0)
+        poids = incidence @ corrigeable.astype(float)
+        self.correction_altitude = np.divide(somme, poids, out=np.zeros_like(somme), where=poids > 0)
+
+        os.makedirs(dossier, exist_ok=True)
+        chemin_tmp = f"{chemin}.{os.getpid()}.tmp.npz"
+        np.savez(chemin_tmp, data=self.poids_clusters.data, indices=self.poids_clusters.indices,
+                 indptr=self.poids_clusters.indptr, shape=np.array(self.poids_clusters.shape),
+                 correction_altitude=self.correction_altitude)
+        os.replace(chemin_tmp, chemin)
+
+    def interpoler(self, valeurs):
+        """
+        Interpole un tableau de valeurs des stations vers les clusters. Les valeurs manquantes (NaN) d'une station
+        sont ignorées : les poids des autres stations sont renormalisés.
+        Args:
+            valeurs (np.ndarray): tableau (nb_stations, ...) (ex : station x mois x variable)
+        Returns:
+            valeurs_clusters (np.ndarray): tableau (nb_clusters, ...)
+        """
+        forme = valeurs.shape
+        valeurs = valeurs.reshape(forme[0], -1)
+
+        presentes = ~np.isnan(valeurs)
+
+        somme = self.poids_clusters @ np.where(presentes, valeurs, 0)
+        poids = self.poids_clusters @ presentes.astype(float)
+
+        resultat = np.divide(somme, poids, out=np.full_like(somme, np.nan), where=poids > 0)
+
+        return resultat.reshape((len(self.cluster_ids),) + forme[1:])
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+
+from transform.quantile_sketch import KLLSketch
+
+
+# Attributs d'une station, constants d'une observation à l'autre : ils forment la table des stations et ne
+# sont plus répétés dans les clés d'agrégation
+COLONNES_STATION = ["Latitude", "Longitude",
+                    "department (name)", "department (code)",
+                    "communes (code)", "Nom"]
+
+# Agrégation mensuelle de chaque mesure, avec une méthode adaptée pour la pluie
+AGREGATIONS = {"Pression station": "mean",
+               "Température (°C)": "mean",
+               "Précipitations dans les 24 dernières heures": "sum",
+               "Rafales sur une période": "mean"}
+
+# Mesures dont on garde aussi le maximum mensuel
+MAXIMUMS = ["Rafales sur une période"]
+
+CLES_ETATS = COLONNES_STATION + ["Mois"]
+
+# Mesures résumées par un sketch de quantiles, et quantiles publiés
+MESURES_SKETCH = ["Température (°C)"]
+QUANTILES = {"médiane": 0.5, "p90": 0.9}
+
+# Un jour de pluie est un cumul sur 24 h d'au moins 1 mm, relevé à 06 UTC (une fois par jour)
+PRECIPITATIONS_24H = "Précipitations dans les 24 dernières heures"
+HEURE_CUMUL_24H = 6
+SEUIL_JOUR_DE_PLUIE = 1.0
+
+# Rafales fortes : au moins 16 m/s (environ 58 km/h)
+RAFALES = "Rafales sur une période"
+SEUIL_RAFALE_FORTE = 16.0
+
+
+def colonnes_agregats():
+    """
+    Colonnes des agrégats mensuels finalisés : une par mesure de AGREGATIONS, puis les maximums.
+    """
+    return list(AGREGATIONS) + [f"{mesure} (max)" for mesure in MAXIMUMS]
+
+
+def colonnes_etats():
+    """
+    Colonnes des états partiels et leur fonction de fusion : somme et effectif pour une moyenne, somme pour un
+    cumul, maximum pour les rafales. Fusionner deux états donne l'état de l'union des observations.
+    """
+    colonnes = {}
+
+    for mesure, agregation in AGREGATIONS.items():
+        colonnes[f"{mesure} (somme)"] = "sum"
+        if agregation == "mean":
+            colonnes[f"{mesure} (nb)"] = "sum"
+
+    for mesure in MAXIMUMS:
+        colonnes[f"{mesure} (max)"] = "max"
+
+    return colonnes
+
+
+def etats_mensuels(df_observations):
+    """
+    Réduit des observations SYNOP (libellés de l'export, colonne Date) en états partiels par station et par mois.
+    Les observations incomplètes sont ignorées, comme dans TransformMeteo.process_data.
+
+    Args:
+        df_observations (pd.DataFrame): observations
+
+    Returns:
+        df_etats (pd.DataFrame): une ligne par station et par mois, colonnes CLES_ETATS et colonnes_etats()
+    """
+    df = df_observations[["Date"] + COLONNES_STATION + list(AGREGATIONS)].dropna()
+    df = df.assign(Mois=pd.to_datetime(df["Date"], format="ISO8601", utc=True).dt.month)
+
+    agregations = {}
+    for mesure, agregation in AGREGATIONS.items():
+        agregations[f"{mesure} (somme)"] = (mesure, "sum")
+        if agregation == "mean":
+            agregations[f"{mesure} (nb)"] = (mesure, "count")
+
+    for mesure in MAXIMUMS:
+        agregations[f"{mesure} (max)"] = (mesure, "max")
+
+    return df.groupby(CLES_ETATS, as_index=False, observed=True).agg(**agregations)
+
+
+def fusionner_etats(df_etats, df_nouveaux):
+    """
+    Fusionne deux tables d'états partiels (la première peut être None).
+    """
+    if df_etats is None:
+        return df_nouveaux
+
+    df = pd.concat([df_etats, df_nouveaux], ignore_index=True)
+
+    # Les clés texte sont comparées en chaînes : deux tranches n'ont pas les mêmes catégories
+    for colonne in COLONNES_STATION:
+        if isinstance(df[colonne].dtype, pd.CategoricalDtype):
+            df[colonne] = df[colonne].astype(str)
+
+    return df.groupby(CLES_ETATS, as_index=False).agg(colonnes_etats())
+
+
+def finaliser_etats(df_etats):
+    """
+    Calcule les agrégats mensuels (colonnes de TransformMeteo.process_data) à partir des états partiels, dont
+    le maximum mensuel des mesures de MAXIMUMS.
+    """
+    df = df_etats[CLES_ETATS].copy()
+
+    for mesure, agregation in AGREGATIONS.items():
+        df[mesure] = df_etats[f"{mesure} (somme)"]
+        if agregation == "mean":
+            df[mesure] = df[mesure] / df_etats[f"{mesure} (nb)"]
+
+    for mesure in MAXIMUMS:
+        df[f"{mesure} (max)"] = df_etats[f"{mesure} (max)"]
+
+    return df.sort_values(CLES_ETATS).reset_index(drop=True)
+
+
+class MeteoDistributions() :
+    """
+    Statistiques de distribution par station et par mois, construites en une passe sur des tranches d'observations
+    et en mémoire constante : sketches de quantiles (cf KLLSketch) pour les mesures de MESURES_SKETCH, et
+    compteurs de jours de pluie et de rafales fortes. Comme les états partiels, deux objets se fusionnent
+    (cf merge), et l'objet se sérialise (pickle, ou to_dict pour du JSON).
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.sketches = {mesure: {} for mesure in MESURES_SKETCH}
+        self.df_compteurs = None
+
+    def update(self, df_observations):
+        """
+        Intègre une tranche d'observations (libellés de l'export, colonne Date).
+        """
+        df = df_observations.dropna(subset=COLONNES_STATION + ["Date"])
+        dates = pd.to_datetime(df["Date"], format="ISO8601", utc=True)
+        df = df.assign(Mois=dates.dt.month)
+
+        for colonne in COLONNES_STATION:
+            if isinstance(df[colonne].dtype, pd.CategoricalDtype):
+                df[colonne] = df[colonne].astype(str)
+
+        ### Sketches : un lot de valeurs par station et par mois ###
+
+        for cle, positions in df.groupby(CLES_ETATS, sort=False).indices.items():
+            for mesure in MESURES_SKETCH:
+                if cle not in self.sketches[mesure]:
+                    self.sketches[mesure][cle] = KLLSketch(self.k)
+                self.sketches[mesure][cle].update(df[mesure].to_numpy(dtype=float)[positions])
+
+        ### Compteurs ###
+
+        cumul_24h = df[PRECIPITATIONS_24H].where((dates.dt.hour == HEURE_CUMUL_24H).to_numpy())
+
+        df_compteurs = df[CLES_ETATS].assign(**{
+            "Jours de pluie (nb)": (cumul_24h >= SEUIL_JOUR_DE_PLUIE).astype(np.int64),
+            "Jours observés (nb)": cumul_24h.notna().astype(np.int64),
+            "Rafales fortes (nb)": (df[RAFALES] >= SEUIL_RAFALE_FORTE).astype(np.int64),
+            "Rafales observées (nb)": df[RAFALES].notna().astype(np.int64)})
+
+        self.fusionner_compteurs(df_compteurs.groupby(CLES_ETATS, as_index=False).sum())
+
+        return self
+
+    def fusionner_compteurs(self, df_compteurs):
+        if self.df_compteurs is not None:
+            df_compteurs = pd.concat([self.df_compteurs, df_compteurs], ignore_index=True)
+            df_compteurs = df_compteurs.groupby(CLES_ETATS, as_index=False).sum()
+
+        self.df_compteurs = df_compteurs
+
+    def merge(self, autre):
+        """
+        Ajoute les statistiques d'un autre objet (autres observations des mêmes stations ou d'autres stations).
+        """
+        for mesure in MESURES_SKETCH:
+            for cle, sketch in autre.sketches[mesure].items():
+                if cle in self.sketches[mesure]:
+                    self.sketches[mesure][cle].merge(sketch)
+                else:
+                    self.sketches[mesure][cle] = KLLSketch.from_dict(sketch.to_dict())
+
+        if autre.df_compteurs is not None:
+            self.fusionner_compteurs(autre.df_compteurs)
+
+        return self
+
+    def to_frame(self):
+        """
+        Statistiques par station et par mois : quantiles de QUANTILES pour chaque mesure de MESURES_SKETCH,
+        nombre et part de jours de pluie, nombre et part d'observations avec rafales fortes.
+        """
+        if self.df_compteurs is None:
+            return pd.DataFrame(columns=CLES_ETATS)
+
+        df = self.df_compteurs.copy()
+        cles = list(df[CLES_ETATS].itertuples(index=False, name=None))
+
+        for mesure in MESURES_SKETCH:
+            valeurs = np.array([self.sketches[mesure][cle].quantiles(list(QUANTILES.values()))
+                                if cle in self.sketches[mesure] else np.full(len(QUANTILES), np.nan)
+                                for cle in cles]).reshape(len(cles), len(QUANTILES))
+
+            for i, nom in enumerate(QUANTILES):
+                df[f"{mesure} ({nom})"] = valeurs[:, i]
+
+        df["Part de jours de pluie"] = df["Jours de pluie (nb)"] / df["Jours observés (nb)"].replace(0, np.nan)
+        df["Part de rafales fortes"] = df["Rafales fortes (nb)"] / df["Rafales observées (nb)"].replace(0, np.nan)
+
+        return df.sort_values(CLES_ETATS).reset_index(drop=True)
+
+    def to_dict(self):
+        """
+        Représentation sérialisable (JSON) des statistiques.
+        """
+        return {"k": self.k,
+                "sketches": {mesure: [[[getattr(v, "item", lambda: v)() for v in cle], sketch.to_dict()]
+                                      for cle, sketch in sketches.items()]
+                             for mesure, sketches in self.sketches.items()},
+                "compteurs": None if self.df_compteurs is None else self.df_compteurs.to_dict(orient="list")}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Reconstruit des statistiques sérialisées par to_dict.
+        """
+        distributions = cls(data["k"])
+        distributions.sketches = {mesure: {tuple(cle): KLLSketch.from_dict(sketch) for cle, sketch in sketches}
+                                  for mesure, sketches in data["sketches"].items()}
+
+        if data["compteurs"] is not None:
+            distributions.df_compteurs = pd.DataFrame(data["compteurs"])
+
+        return distributions
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from transform.spatial_index import RAYON_TERRE_KM
+
+
+# Mots vides retirés des noms avant comparaison ("La citadelle - Calvi" -> "citadelle calvi")
+MOTS_VIDES = ["le", "la", "les", "l", "de", "du", "des", "d", "et", "a", "au", "aux", "en", "sur"]
+REGEX_MOTS_VIDES = r"\b(?:" + "|".join(MOTS_VIDES) + r")\b"
+
+# Nombre premier supérieur à 2**32 pour les permutations de MinHash
+PREMIER = np.uint64(4294967311)
+
+# Nombre maximal de POI d'une même case partageant une bande LSH : au-delà (nom très courant comme "parking" dans
+# une zone dense), la case est ignorée pour cette bande, plutôt que de générer un nombre quadratique de paires
+MAX_POI_PAR_CASE = 500
+
+
+def normaliser_noms(noms):
+    """
+    Normalise des noms de POI : minuscules, sans accents, sans ponctuation ni mots vides.
+    Args:
+        noms (array-like): noms des POI
+    Returns:
+        noms_normalises (np.ndarray): noms normalisés, en ASCII, "" pour les noms manquants
+    """
+    noms = pd.Series(noms, dtype=object).fillna("").astype(str)
+
+    noms = noms.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii").str.lower()
+    noms = noms.str.replace(r"[^a-z0-9]+", " ", regex=True)
+    noms = noms.str.replace(REGEX_MOTS_VIDES, " ", regex=True)
+
+    return noms.str.split().str.join(" ").to_numpy(dtype=object)
+
+
+def shingles(noms, taille=3):
+    """
+    Découpe des noms normalisés en sous-chaînes de `taille` caractères (shingles), encodées en entiers par leurs
+    octets ASCII : aucun hachage n'est nécessaire et toutes les sous-chaînes sont extraites en une passe numpy.
+    Chaque nom est entouré d'espaces, pour marquer le début et la fin des mots et donner au moins un shingle aux
+    noms courts.
+    Args:
+        noms (array-like): noms normalisés (ASCII)
+        taille (int): taille des shingles
+    Returns:
+        lignes (np.ndarray): position du nom de chaque shingle, croissante
+        codes (np.ndarray): shingles encodés (uint64)
+    """
+    noms = [f" {nom or '_'} " for nom in noms]
+    longueurs = np.array([len(nom) for nom in noms], dtype=np.int64)
+    octets = np.frombuffer("".join(noms).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+
+    nb_shingles = longueurs - taille + 1
+    debuts_noms = np.cumsum(longueurs) - longueurs
+    debuts_shingles = np.cumsum(nb_shingles) - nb_shingles
+
+    lignes = np.repeat(np.arange(len(noms)), nb_shingles)
+    positions = np.repeat(debuts_noms - debuts_shingles, nb_shingles) + np.arange(nb_shingles.sum())
+
+    codes = np.zeros(len(positions), dtype=np.uint64)
+    for k in range(taille):
+        codes = (codes << np.uint64(8)) | octets[positions + k]
+
+    return lignes, codes
+
+
+class MinHasher() :
+    """
+    Signatures MinHash des noms de POI : chaque nom est résumé par nb_permutations minima de hachages de ses
+    shingles, et la proportion de minima égaux entre deux signatures estime la similarité de Jaccard des noms.
+    """
+
+    def __init__(self, nb_permutations=64, graine=0):
+        rng = np.random.default_rng(graine)
+
+        # a < 2**31 et x < 2**32 : a * x + b tient dans un uint64 sans débordement
+        self.a = rng.integers(1, 2 ** 31, nb_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 2 ** 32, nb_permutations, dtype=np.uint64)
+        self.nb_permutations = nb_permutations
+
+    def signatures(self, noms, taille_lot=100000):
+        """
+        Calcule la signature de chaque nom, par lots pour borner la mémoire.
+        Args:
+            noms (array-like): noms normalisés
+            taille_lot (int): nombre de noms traités à la fois
+        Returns:
+            signatures (np.ndarray): tableau (nb_noms, nb_permutations) de uint64
+        """
+        # Les noms répétés (chaînes, enseignes, ...) ne sont hachés qu'une fois
+        codes, noms_uniques = pd.factorize(pd.Series(noms, dtype=object))
+
+        signatures_uniques = np.empty((len(noms_uniques), self.nb_permutations), dtype=np.uint64)
+
+        for debut in range(0, len(noms_uniques), taille_lot):
+            lot = noms_uniques[debut:debut + taille_lot]
+
+            lignes, x = shingles(lot)
+            debuts = np.flatnonzero(np.r_[True, lignes[1:] != lignes[:-1]])
+
+            # Une permutation à la fois : minimum des hachages des shingles de chaque nom
+            for k in range(self.nb_permutations):
+                hachages = (x * self.a[k] + self.b[k]) % PREMIER
+                signatures_uniques[debut:debut + len(lot), k] = np.minimum.reduceat(hachages, debuts)
+
+        return signatures_uniques[codes]
+
+
+def paires_voisines(cles, cases_lat, cases_lon, max_par_case=MAX_POI_PAR_CASE):
+    """
+    Paires de points qui partagent une clé (bande LSH) et sont dans la même case ou dans deux cases voisines
+    (voisinage 3 x 3). Chaque paire de cases voisines n'est parcourue que dans un sens. Les groupes (clé, case) de
+    plus de max_par_case points sont ignorés, ce qui borne le nombre de paires à 5 x max_par_case par point.
+    Args:
+        cles (np.ndarray): clé de chaque point (uint64)
+        cases_lat (np.ndarray): ligne de la case de chaque point
+        cases_lon (np.ndarray): colonne de la case de chaque point
+        max_par_case (int): taille maximale d'un groupe (clé, case)
+    Returns:
+        i, j (np.ndarray): positions des deux points de chaque paire (i < j pour une même case)
+        nb_ignores (int): nombre de points ignorés car dans un groupe trop grand
+    """
+    def hacher(lignes, colonnes):
+        return pd.util.hash_pandas_object(pd.DataFrame({"cle": cles, "lat": lignes, "lon": colonnes}),
+                                          index=False).to_numpy()
+
+    cles_cases = hacher(cases_lat, cases_lon)
+    ordre = np.argsort(cles_cases, kind="stable")
+    cles_triees = cles_cases[ordre]
+
+    # Points des groupes (clé, case) trop grands : ni comparés, ni cibles des cases voisines
+    taille_groupe = (np.searchsorted(cles_triees, cles_cases, side="right")
+                     - np.searchsorted(cles_triees, cles_cases, side="left"))
+    ignores = taille_groupe > max_par_case
+
+    liste_i, liste_j = [], []
+
+    # Même case, puis les 4 voisines "suivantes" : chaque couple de cases voisines est vu une seule fois
+    for d_lat, d_lon in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+        cles_voisines = cles_cases if (d_lat, d_lon) == (0, 0) else hacher(cases_lat + d_lat, cases_lon + d_lon)
+
+        debuts = np.searchsorted(cles_triees, cles_voisines, side="left")
+        fins = np.searchsorted(cles_triees, cles_voisines, side="right")
+        nb = np.where(ignores | (fins - debuts > max_par_case), 0, fins - debuts)
+
+        if not nb.any():
+            continue
+
+        i = np.repeat(np.arange(len(cles)), nb)
+        j = ordre[np.repeat(debuts - np.cumsum(nb) + nb, nb) + np.arange(nb.sum())]
+
+        if (d_lat, d_lon) == (0, 0):
+            garder = i < j
+            i, j = i[garder], j[garder]
+
+        liste_i.append(i)
+        liste_j.append(j)
+
+    if not liste_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), int(ignores.sum())
+
+    return np.concatenate(liste_i), np.concatenate(liste_j), int(ignores.sum())
+
+
+def find_near_duplicates(noms, latitudes, longitudes, max_distance_km=1.0, seuil=0.5,
+                         nb_bandes=16, nb_permutations=64, max_par_case=MAX_POI_PAR_CASE):
+    """
+    Regroupe les POI quasi-dupliqués : noms proches (similarité de Jaccard estimée par MinHash au moins égale à
+    seuil) et distants de moins de max_distance_km. Les paires candidates sont trouvées par LSH : les signatures
+    sont découpées en nb_bandes bandes, et deux POI sont candidats s'ils partagent une bande et sont dans la même
+    case spatiale ou dans deux cases voisines. Les cases mesurent au moins max_distance_km de côté (la largeur en
+    longitude est corrigée par le cosinus de la latitude la plus élevée), donc deux POI assez proches sont
+    toujours dans des cases voisines. Chaque POI n'est comparé qu'à ses voisins, en temps quasi linéaire.
+
+    Args:
+        noms (pd.Series): noms des POI
+        latitudes (array-like): latitudes des POI
+        longitudes (array-like): longitudes des POI
+        max_distance_km (float): distance maximale entre deux doublons
+        seuil (float): similarité de Jaccard minimale entre deux doublons
+        nb_bandes (int): nombre de bandes LSH (nb_permutations doit en être un multiple)
+        nb_permutations (int): taille des signatures MinHash
+        max_par_case (int): nombre maximal de POI d'une case partageant une bande (cf paires_voisines)
+
+    Returns:
+        groupes (np.ndarray): identifiant de groupe de chaque POI, identique pour des quasi-doublons
+    """
+
+    if not max_distance_km > 0:
+        raise ValueError(f"max_distance_km doit être strictement positif ({max_distance_km})")
+
+    nb_poi = len(noms)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+
+    # Chaque nom distinct n'est normalisé qu'une fois
+    codes, noms_uniques = pd.factorize(pd.Series(noms, dtype=object).fillna(""))
+    noms_normalises = normaliser_noms(noms_uniques)[codes]
+
+    signatures = MinHasher(nb_permutations).signatures(noms_normalises)
+
+    # Les POI sans coordonnées ou sans nom ne peuvent pas être comparés
+    localises = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)) & (noms_normalises != ""))
+
+    if len(localises) < 2:
+        return np.arange(nb_poi)
+
+    # Un degré de latitude mesure partout km_par_degre ; un degré de longitude en mesure km_par_degre x cos(lat),
+    # au moins cos(latitude maximale) sur l'ensemble des POI
+    km_par_degre = 2 * np.pi * RAYON_TERRE_KM / 360
+    cos_min = max(np.cos(np.radians(np.abs(latitudes[localises]).max())), 1e-3)
+
+    taille_lat = max_distance_km / km_par_degre
+    taille_lon = max_distance_km / (km_par_degre * cos_min)
+
+    cases_lat = np.floor(latitudes[localises] / taille_lat).astype(np.int64)
+    cases_lon = np.floor(longitudes[localises] / taille_lon).astype(np.int64)
+
+    lignes_par_bande = nb_permutations // nb_bandes
+
+    liste_i, liste_j = [], []
+    nb_ignores = 0
+
+    for bande in range(nb_bandes):
+        colonnes = signatures[localises, bande * lignes_par_bande:(bande + 1) * lignes_par_bande]
+        cles = pd.util.hash_pandas_object(pd.DataFrame(colonnes), index=False).to_numpy()
+
+        i, j, ignores = paires_voisines(cles, cases_lat, cases_lon, max_par_case)
+        liste_i.append(localises[i])
+        liste_j.append(localises[j])
+        nb_ignores = max(nb_ignores, ignores)
+
+    if nb_ignores:
+        print(f"⚠️  Jusqu'à {nb_ignores} POI par bande ignorés (plus de {max_par_case} noms identiques dans une case)")
+
+    i = np.concatenate(liste_i)
+    j = np.concatenate(liste_j)
+
+    if len(i) == 0:
+        return np.arange(nb_poi)
+
+    # Une paire trouvée dans plusieurs bandes n'est vérifiée qu'une fois
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    paires = np.unique(i * nb_poi + j)
+    i, j = paires // nb_poi, paires % nb_poi
+
+    # Vérification des candidats : similarité estimée et distance réelle
+    similarite = (signatures[i] == signatures[j]).mean(axis=1)
+
+    lat_i, lat_j = np.radians(latitudes[i]), np.radians(latitudes[j])
+    dlat = lat_j - lat_i
+    dlon = np.radians(longitudes[j] - longitudes[i])
+    distance = 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(
+        np.sin(dlat / 2) ** 2 + np.cos(lat_i) * np.cos(lat_j) * np.sin(dlon / 2) ** 2))
+
+    garder = (similarite >= seuil) & (distance <= max_distance_km)
+
+    graphe = coo_matrix((np.ones(garder.sum()), (i[garder], j[garder])), shape=(nb_poi, nb_poi))
+    _, groupes = connected_components(graphe, directed=False)
+
+    return groupes
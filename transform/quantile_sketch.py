@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class KLLSketch() :
+    """
+    Résumé approximatif (sketch KLL) d'une distribution, en mémoire bornée quel que soit le nombre de valeurs.
+    Les valeurs sont rangées dans des compacteurs : quand le compacteur de niveau h est plein, il est trié et une
+    valeur sur deux (en partant d'un décalage aléatoire) passe au niveau h + 1, où elle pèse 2**(h+1).
+    Deux sketches se fusionnent niveau par niveau, ce qui permet de les construire par morceaux et de les
+    compléter lors des mises à jour incrémentales. L'erreur sur le rang d'un quantile est de l'ordre de 1 / k.
+    """
+
+    def __init__(self, k=200, graine=None):
+        """
+        Args:
+            k (int): taille du plus grand compacteur, qui règle le compromis précision / mémoire
+            graine (int): graine des décalages aléatoires
+        """
+        self.k = k
+        self.n = 0
+        self.compacteurs = [np.empty(0)]
+        self.rng = np.random.default_rng(graine)
+
+    def capacite(self, niveau):
+        """
+        Capacité d'un compacteur : k pour le niveau le plus haut, décroissante (facteur 2/3) vers les niveaux bas.
+        """
+        profondeur = len(self.compacteurs) - niveau - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** profondeur)))
+
+    def update(self, valeurs):
+        """
+        Ajoute un lot de valeurs (les NaN sont ignorés).
+        """
+        valeurs = np.asarray(valeurs, dtype=float)
+        valeurs = valeurs[~np.isnan(valeurs)]
+
+        self.n += len(valeurs)
+        self.compacteurs[0] = np.concatenate([self.compacteurs[0], valeurs])
+        self.compresser()
+
+        return self
+
+    def merge(self, autre):
+        """
+        Ajoute au sketch toutes les valeurs résumées par un autre sketch.
+        """
+        while len(self.compacteurs) < len(autre.compacteurs):
+            self.compacteurs.append(np.empty(0))
+
+        for niveau, valeurs in enumerate(autre.compacteurs):
+            self.compacteurs[niveau] = np.concatenate([self.compacteurs[niveau], valeurs])
+
+        self.n += autre.n
+        self.compresser()
+
+        return self
+
+    def compresser(self):
+        """
+        Compacte les niveaux qui dépassent leur capacité, jusqu'à ce qu'aucun ne la dépasse.
+        """
+        plein = True
+
+        while plein:
+            plein = False
+
+            for niveau in range(len(self.compacteurs)):
+                if len(self.compacteurs[niveau]) < self.capacite(niveau):
+                    continue
+
+                plein = True
+
+                if niveau + 1 == len(self.compacteurs):
+                    self.compacteurs.append(np.empty(0))
+
+                # Un nombre pair de valeurs est compacté : une sur deux monte, l'éventuelle dernière reste
+                valeurs = np.sort(self.compacteurs[niveau])
+                nb = len(valeurs) // 2 * 2
+                promues = valeurs[self.rng.integers(2):nb:2]
+
+                self.compacteurs[niveau] = valeurs[nb:]
+                self.compacteurs[niveau + 1] = np.concatenate([self.compacteurs[niveau + 1], promues])
+
+    def quantiles(self, qs):
+        """
+        Renvoie les quantiles approchés demandés (NaN si le sketch est vide).
+        Args:
+            qs (array-like): niveaux des quantiles, entre 0 et 1
+        Returns:
+            quantiles (np.ndarray): valeurs des quantiles
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+
+        valeurs = np.concatenate(self.compacteurs)
+        if len(valeurs) == 0:
+            return np.full(len(qs), np.nan)
+
+        poids = np.concatenate([np.full(len(c), 2.0 ** niveau) for niveau, c in enumerate(self.compacteurs)])
+
+        ordre = np.argsort(valeurs, kind="stable")
+        cumul = np.cumsum(poids[ordre])
+
+        positions = np.searchsorted(cumul, qs * cumul[-1], side="left")
+
+        return valeurs[ordre][np.minimum(positions, len(valeurs) - 1)]
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def to_dict(self):
+        """
+        Représentation sérialisable (JSON) du sketch.
+        """
+        return {"k": self.k, "n": self.n, "compacteurs": [c.tolist() for c in self.compacteurs]}
+
+    @classmethod
+    def from_dict(cls, data, graine=None):
+        """
+        Reconstruit un sketch sérialisé par to_dict.
+        """
+        sketch = cls(data["k"], graine)
+        sketch.n = data["n"]
+        sketch.compacteurs = [np.asarray(c, dtype=float) for c in data["compacteurs"]]
+
+        return sketch
@@ -0,0 +1,64 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+RAYON_TERRE_KM = 6371.0
+
+
+def vecteurs_unitaires(latitudes, longitudes):
+    """
+    Convertit des coordonnées en degrés en vecteurs unitaires 3D. La distance euclidienne entre deux
+    vecteurs (la corde) est une fonction croissante de la distance sur la sphère, contrairement à la
+    distance entre degrés bruts qui surestime les écarts de longitude aux hautes latitudes.
+    Args:
+        latitudes (array-like): latitudes en degrés
+        longitudes (array-like): longitudes en degrés
+    Returns:
+        vecteurs (np.ndarray): tableau (n, 3)
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class SpatialIndex() :
+    """
+    Index spatial (KD-tree sur les vecteurs unitaires) construit une seule fois à partir d'un ensemble
+    de points (stations météo, centroïdes de communes, ...), qui répond en un seul appel vectorisé aux
+    requêtes des k plus proches voisins d'un lot de points.
+    """
+
+    def __init__(self, latitudes, longitudes):
+        self.nb_points = len(latitudes)
+        self.tree = cKDTree(vecteurs_unitaires(latitudes, longitudes))
+
+    def query(self, latitudes, longitudes, k=1, max_distance_km=None):
+        """
+        Cherche les k points de l'index les plus proches de chaque point demandé.
+        Args:
+            latitudes (array-like): latitudes des points à rattacher
+            longitudes (array-like): longitudes des points à rattacher
+            k (int): nombre de voisins
+            max_distance_km (float): distance maximale, au-delà on ne renvoie pas de voisin
+        Returns:
+            indices (np.ndarray): positions des voisins dans l'index, -1 si aucun voisin, de forme (n,)
+        si k = 1 et (n, k) sinon
+            distances (np.ndarray): distances à vol d'oiseau en km, inf si aucun voisin
+        """
+
+        k = min(k, self.nb_points)
+        distance_max = np.inf
+
+        if max_distance_km is not None:
+            # Distance sur la sphère -> longueur de la corde
+            distance_max = 2 * np.sin(min(max_distance_km / RAYON_TERRE_KM, np.pi) / 2)
+
+        cordes, indices = self.tree.query(vecteurs_unitaires(latitudes, longitudes), k=k,
+                                          distance_upper_bound=distance_max)
+
+        trouve = indices < self.nb_points
+        indices = np.where(trouve, indices, -1)
+        distances = np.where(trouve, 2 * RAYON_TERRE_KM * np.arcsin(np.clip(cordes, 0, 2) / 2), np.inf)
+
+        return indices, distances
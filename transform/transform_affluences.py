@@ -1,6 +1,10 @@
 import pandas as pd
+import numpy as np
 
 from extract.extract_affluences import AttendanceExtractor
+from transform.cluster_lookup import ClusterLookup
+from transform.attendance_cube import AttendanceCube
+from transform.disaggregation import pivoter_series, desagreger
 
 class AttendanceTransformer() :
     def __init__(self):
@@ -52,7 +56,7 @@ class AttendanceTransformer() :
         return df_capacite
 
 
-    def transform_data_nb_nuitees(self,df_nb_nuitees) :
+    def transform_data_nb_nuitees(self, df_nb_nuitees, activite_reference='I551', activites=('I551', 'I553')) :
         """
         Traitement du dataframe contenant les informations sur les nombres de nuitées de chaque
         département. Les données obtenues sont encodées selon une nomenclature propre à l'INSEE, on va
@@ -64,26 +68,39 @@ class AttendanceTransformer() :
         campings, en supposant que la répartition au cours des mois de l'année est la même que dans les
         hôtels : 
             Nb_nuitees_mois_camping = Nb_nuitees_an_camping * Nb_nuitees_mois_hotel / Nb_nuitees_an_hotel
+        Les séries sont rangées dans des tableaux (département x année x mois x activité) et l'estimation
+        est faite en une fois pour toutes les années et toutes les activités sans données mensuelles
+        (cf transform/disaggregation.py). Un mois sans données hôtelières, ou un département dont le total
+        annuel des hôtels est nul ou manquant, prend la part nationale du mois.
         Args:
             df_nb_nuitees (pd.DataFrame): DataFrame résultant de l'appel à la fonction
         extract.extract_affluences.extract_data_nb_nuitees.
+            activite_reference (str): activité dont la saisonnalité sert à l'estimation
+            activites (list): activités conservées, None pour toutes les garder
         Returns:
             df_nb_nuitees (pd.DataFrame): DataFrame nettoyé, où une ligne = un nombre de nuitées pour
         un département donné, en un mois donné, sur un type d'hébergement donné.
         """
 
-        # On enlève les colonnes inutiles
-        df_nb_nuitees.drop(columns=['TOUR_RESID','HOTEL_STA','TERRTYPO','TOUR_MEASURE','UNIT_LOC_RANKING','OBS_STATUS',
-                                        'OBS_STATUS_FR','CONF_STATUS','UNIT_MULT','DECIMALS'], inplace=True)
-        
-        df_nb_nuitees.rename(columns={"FREQ" : "temporal_rate",
-                                    "ACTIVITY" : "id_activity",
-                                    "TIME_PERIOD" : "time_period",
-                                    "OBS_VALUE_NIVEAU" : "nb_nights",
-                                    }, inplace=True)
+        df_nb_nuitees = df_nb_nuitees.rename(columns={"FREQ" : "temporal_rate",
+                                                      "ACTIVITY" : "id_activity",
+                                                      "TIME_PERIOD" : "time_period",
+                                                      "OBS_VALUE_NIVEAU" : "nb_nights",
+                                                      })
 
         # On récupère le code INSEE de chaque département
-        df_nb_nuitees['dept_code'] = df_nb_nuitees["GEO"].str.split("-").str[-1]
+        df_nb_nuitees['dept_code'] = df_nb_nuitees["GEO"].astype(str).str.split("-").str[-1]
+
+        if activites is not None:
+            df_nb_nuitees = df_nb_nuitees[df_nb_nuitees['id_activity'].isin(list(activites) + [activite_reference])]
+
+        # Séries mensuelles observées, complétées par l'estimation des séries seulement annuelles
+        departements, annees, codes_activites, mensuel, annuel = pivoter_series(df_nb_nuitees)
+        mensuel, estime = desagreger(mensuel, annuel, codes_activites, activite_reference)
+
+        print(f"Nuitées : {int(estime.sum())} valeurs mensuelles estimées à partir des totaux annuels")
+
+        dept, annee, mois, activite = np.nonzero(np.isfinite(mensuel))
 
         # On rajoute une colonne activity_type comme pour les capacités
         dict_activity_types = {'I55' : 'Hébergement',
@@ -92,64 +109,16 @@ class AttendanceTransformer() :
                             'I552A_I552C' : 'Village vacances - Auberge - Centre sportif',
                             'I552B' : 'Résidence de tourisme',
                             'I553' : 'Terrain de camping'}
-        
-        df_nb_nuitees['activity_type'] = df_nb_nuitees['id_activity'].map(dict_activity_types)
-
-        df_nb_nuitees.drop(columns=['GEO'], inplace=True)
-
-        df_nb_nuitees = df_nb_nuitees[['temporal_rate','dept_code','time_period','id_activity','activity_type','nb_nights']]
-
-        # Estimation des nombres de nuitées mensuels pour les campings
-        # On commence par séparer les données mensuelles/annuelles et campings/hôtels
-        df_hotels_month = df_nb_nuitees[(df_nb_nuitees['id_activity'] == 'I551') & (df_nb_nuitees['temporal_rate'] == 'M')].copy()
-        df_hotels_year = df_nb_nuitees[(df_nb_nuitees['id_activity'] == 'I551') & (df_nb_nuitees['temporal_rate'] == 'A')].copy()
-        df_campings_year = df_nb_nuitees[(df_nb_nuitees['id_activity'] == 'I553') & (df_nb_nuitees['temporal_rate'] == 'A')].copy()
-
-        df_hotels_month.drop(columns=['temporal_rate'],inplace=True)
-        df_hotels_year = df_hotels_year.rename(columns={'nb_nights': 'nb_nights_hotel_year'}).drop(columns=['temporal_rate', 'id_activity'])
-        df_campings_year = df_campings_year.rename(columns={'nb_nights': 'nb_nights_camping_year'}).drop(columns=['temporal_rate', 'id_activity'])
-
-        # On récupère l'année (ici on aura que 2024)
-        df_hotels_month['year'] = df_hotels_month['time_period'].str[:4]
-        df_hotels_year['year'] = df_hotels_year['time_period'].astype(str)
-        df_campings_year['year'] = df_campings_year['time_period'].astype(str)
-
-        df_hotels_year.drop(columns=['time_period'],inplace=True)
-        df_campings_year.drop(columns=['time_period'],inplace=True)
-
-        # On merge ales données mensuelles des hôtels, annuelles des hôtels, et annuelles des campings
-        df_calc = df_hotels_month.merge(df_hotels_year, on=['dept_code','year'], how='left')
-        df_calc = df_calc.merge(df_campings_year, on=['dept_code','year'], how='left')
-
-        df_calc = df_calc[df_calc['nb_nights_hotel_year'] > 0]
 
-        # On calcule, pour chaque mois, le nb de nuitées des campings à partir du nb de nuitées annuel,
-        # du nombre de nuitées annuel des hôtels et du nombre de nuitées des hôtels dans le mois
-        df_calc['nb_nights_camping_month'] = (
-            df_calc['nb_nights_camping_year'] * df_calc['nb_nights'] / df_calc['nb_nights_hotel_year']
-                                            )
+        df_final = pd.DataFrame({'dept_code': np.asarray(departements)[dept],
+                                 'time_period': [f"{a}-{m:02d}" for a, m in zip(annees[annee], mois + 1)],
+                                 'id_activity': np.asarray(codes_activites)[activite]})
 
-        print(df_calc[['dept_code','time_period','nb_nights','nb_nights_hotel_year','nb_nights_camping_year']].head(12))
+        df_final['activity_type'] = df_final['id_activity'].map(dict_activity_types)
+        df_final['nb_nights'] = mensuel[dept, annee, mois, activite]
 
-        # On récupère les données mensuelles des campings ainsi calculées
-        df_campings_month = df_calc[['dept_code','time_period','nb_nights_camping_month']].copy()
-        df_campings_month['id_activity'] = 'I553'
-        df_campings_month['activity_type'] = 'Camping'
-        df_campings_month['temporal_rate'] = 'M'
-        df_campings_month = df_campings_month.rename(columns={'nb_nights_camping_month': 'nb_nights'})
-
-        df_hotels_month.drop(columns=['year'],inplace=True)
-
-        # On concatène les données mensuelles des hôtels et des campings dans df_final
-        df_final = pd.concat([
-                                df_hotels_month,
-                                df_campings_month
-                            ], ignore_index=True)
-        
-        df_final = df_final.drop(columns=['temporal_rate'])
-
-        # On s'assure qu'on a bien uniquement des hôtels et des campings
-        df_final = df_final[df_final['id_activity'].isin(['I551', 'I553'])]
+        if activites is not None:
+            df_final = df_final[df_final['id_activity'].isin(activites)].reset_index(drop=True)
 
         return df_final
 
@@ -190,46 +159,64 @@ class AttendanceTransformer() :
         return df_affluences
     
 
+    def creation_cube_affluences(self, df_capacite, df_nb_nuitees) :
+        """
+        Même modèle que creation_dataframe_affluences, stocké dans un cube numpy (commune x activité x mois)
+        plutôt que dans la table longue issue du merge (cf transform/attendance_cube.py). La table longue
+        s'obtient au besoin par AttendanceCube.to_frame, et les totaux par cluster par
+        AttendanceCube.cluster_frame (mêmes colonnes que affluences_cluster).
+        Args:
+            df_capacite (pd.DataFrame): capacités par commune (cf transform_data_capacite)
+            df_nb_nuitees (pd.DataFrame): nuitées par département et par mois (cf transform_data_nb_nuitees)
+        Returns:
+            cube (AttendanceCube): cube des affluences
+        """
+        return AttendanceCube(df_capacite, df_nb_nuitees)
+
+
     def affluences_cluster(self, df_affluences, df_communes) :
         """
         Aggrège les données du dataframe d'affluences par bassin d'emploi (i.e. cluster), en sommant
         les valeurs des lignes correspondant à des communes appartenant au bassin concerné.
+        Chaque commune est rattachée à son cluster par la table de correspondance code INSEE ->
+        code_cluster (cf transform/cluster_lookup.py), puis on fait un seul groupby sur des clés entières.
         Args:
             df_affluences (pd.DataFrame): DataFrame des affluences par mois et par commune, obtenu
             en sortie de la fonction creation_dataframe_affluences
             df_communes (pd.DataFrame): DataFrame contenant les informations relatives à chaque commune,
-            dont le bassin d'emploi en particulier.
+            dont le code_cluster en particulier (cf TownTransformer.clean_data).
         Returns:
             df_affluences_cluster (pd.DataFrame) : Dataframe final de la partie affluences
         """
 
-        df_affluences_cluster = pd.DataFrame()
+        cluster_lookup = ClusterLookup(df_communes)
 
-        df_affluences['code_insee_centre_zone_emploi'] = None
+        code_cluster = cluster_lookup.lookup(df_affluences['insee_code'])
 
-        for i in range (len(df_affluences_cluster)) :
+        # On code l'activité et le mois en entiers pour grouper uniquement sur des clés entières
+        code_activite, activites = pd.factorize(df_affluences['id_activity'])
+        code_periode, periodes = pd.factorize(df_affluences['time_period'])
 
-            insee_code = df_affluences.loc[i, 'insee_code']
+        # Les communes sans cluster (code 0) ou sans nuitées sont écartées
+        garder = (code_cluster > 0) & (code_activite >= 0) & (code_periode >= 0)
 
-            zone_emploi = df_communes.loc[df_communes['code_insee'] == insee_code, 'code_insee_centre_zone_emploi'].iloc[0]
+        df_affluences_cluster = (pd.DataFrame({'code_cluster': code_cluster[garder],
+                                               'code_activite': code_activite[garder],
+                                               'code_periode': code_periode[garder],
+                                               'capacity_zone': df_affluences['capacity_city'].to_numpy()[garder],
+                                               'nb_nights_zone': df_affluences['nb_nights_city'].to_numpy()[garder]})
+                                .groupby(['code_cluster', 'code_activite', 'code_periode'], as_index=False)
+                                .sum()
+                                )
 
-            df_affluences.loc[i, 'code_insee_centre_zone_emploi'] = zone_emploi
+        # On retrouve les libellés à partir des codes entiers
+        dict_activity_types = dict(zip(df_affluences['id_activity'], df_affluences['activity_type']))
 
-        
-        df_affluences_cluster = (df_affluences.groupby(
-                            ['zone_emploi', 'id_activity', 'activity_type', 'time_period'], as_index=False)
-                            .agg({
-                                'capacity_city': 'sum',
-                                'nb_nights_city': 'sum'
-                            })
-                            )
-        
+        df_affluences_cluster.insert(1, 'id_activity', np.asarray(activites)[df_affluences_cluster['code_activite']])
+        df_affluences_cluster.insert(2, 'activity_type', df_affluences_cluster['id_activity'].map(dict_activity_types))
+        df_affluences_cluster.insert(3, 'time_period', np.asarray(periodes)[df_affluences_cluster['code_periode']])
 
-        df_affluences_cluster.rename(columns={
-                        'capacity_city': 'capacity_zone',
-                        'nb_nights_city': 'nb_nights_zone'
-                    }, inplace=True)
-        
+        df_affluences_cluster = df_affluences_cluster.drop(columns=['code_activite', 'code_periode'])
 
         return df_affluences_cluster
 
@@ -252,13 +239,12 @@ if __name__ == "__main__" :
 
     print(df_nb_nuitees.head())
 
-    df_affluences = Transformer.creation_dataframe_affluences(df_capacite, df_nb_nuitees)
+    cube_affluences = Transformer.creation_cube_affluences(df_capacite, df_nb_nuitees)
 
-    print(df_affluences.head())
+    print(cube_affluences.to_frame().head())
 
-    # A compléter avec la partie d'Antonin
-    df_communes = pd.read_csv("data/cluster_mapping.csv")
+    df_communes = pd.read_csv("data/communes_france_cleaned.csv")
 
-    df_affluence_cluster = Transformer.affluences_cluster(df_affluences, df_communes)
+    df_affluence_cluster = cube_affluences.cluster_frame(df_communes)
 
     print(df_affluence_cluster.head())
@@ -31,7 +31,7 @@ class TownTransformer() :
             #On supprime toutes les autres colonnes inutiles pour la suite
             self.df_town.drop(['typecom', 'typecom_texte', 'canton_code', 'canton_nom', 'reg_code', 'dep_code', 'epci_code', 'epci_nom', 'codes_postaux', 
                     'academie_code', 'academie_nom', 'code_unite_urbaine', 'nom_unite_urbaine', 'taille_unite_urbaine', 'type_commune_unite_urbaine', 
-                    'statut_commune_unite_urbaine', 'superficie_hectare', 'altitude_moyenne', 'altitude_minimale','altitude_maximale', 
+                    'statut_commune_unite_urbaine', 'superficie_hectare', 'altitude_minimale','altitude_maximale', 
                      'niveau_equipements_services', 'niveau_equipements_services_texte', 'gentile', 
                     'url_wikipedia', 'url_villedereve'], axis=1, inplace=True)
 
@@ -46,31 +46,53 @@ class TownTransformer() :
 
             return self.df_town
 
-    def create_cluster_mapping(self):
+    def create_cluster_mapping(self, niveau="code_cluster"):
         """
         Fonction permettant de créer un mapping entre les codes des clusters et les zones d'emplois associées.
+        Toutes les informations sont calculées en un seul passage groupé sur les communes : centroïde, ville
+        principale (la plus peuplée), population totale, nombre de communes et centroïde pondéré par la population.
+        Args:
+            niveau (str): colonne d'agrégation, code_cluster par défaut, ou tout autre niveau présent dans
+            df_town (dep_nom, reg_nom, ...)
         Returns:
-            cluster_mapping (dict): Dictionnaire de mapping entre les codes des clusters et les zones d'emplois.
+            cluster_mapping (pd.DataFrame): DataFrame indexé par niveau avec les informations de chaque groupe.
         """
         if self.df_town.empty:
             print("⚠️  Pas de données pour créer le mapping")
             return {}
-        
-
-        self.cluster_mapping = (
-            self.df_town.groupby("code_cluster")
-            .agg({
-                "code_insee_centre_zone_emploi": "first",
-                "latitude_centre": "mean",
-                "longitude_centre": "mean"
-            })
-        )
-
-        for cluster_code in self.cluster_mapping.index:
-            biggest_town = self.get_biggest_town_cluster(cluster_code)
-            self.cluster_mapping.at[cluster_code, 'ville_principale'] = biggest_town['nom_standard']
-
-        return self.cluster_mapping
+
+        # Coordonnées pondérées par la population, sommées par groupe puis divisées par la population totale
+        df = self.df_town.assign(latitude_ponderee=self.df_town["latitude_centre"] * self.df_town["population"],
+                                 longitude_ponderee=self.df_town["longitude_centre"] * self.df_town["population"])
+
+        groupes = df.groupby(niveau)
+
+        agregations = {
+            "latitude_centre": ("latitude_centre", "mean"),
+            "longitude_centre": ("longitude_centre", "mean"),
+            "population_totale": ("population", "sum"),
+            "nb_communes": ("population", "size"),
+            "latitude_ponderee": ("latitude_ponderee", "sum"),
+            "longitude_ponderee": ("longitude_ponderee", "sum"),
+        }
+
+        if niveau == "code_cluster":
+            agregations = {"code_insee_centre_zone_emploi": ("code_insee_centre_zone_emploi", "first"), **agregations}
+
+        cluster_mapping = groupes.agg(**agregations)
+
+        # La plus grande commune de chaque groupe, dans le même passage groupé
+        cluster_mapping.insert(cluster_mapping.columns.get_loc("longitude_centre") + 1, "ville_principale",
+                               df.loc[groupes["population"].idxmax(), "nom_standard"].to_numpy())
+
+        population = cluster_mapping["population_totale"].where(cluster_mapping["population_totale"] > 0)
+        cluster_mapping["latitude_ponderee"] = (cluster_mapping["latitude_ponderee"] / population).fillna(cluster_mapping["latitude_centre"])
+        cluster_mapping["longitude_ponderee"] = (cluster_mapping["longitude_ponderee"] / population).fillna(cluster_mapping["longitude_centre"])
+
+        if niveau == "code_cluster":
+            self.cluster_mapping = cluster_mapping
+
+        return cluster_mapping
     
     def get_biggest_town_cluster(self, cluster_code):
         """
@@ -1,17 +1,164 @@
+import os
+import pickle
+import uuid
 import pandas as pd
-from extract.extract_data_tourisme import DataTourismExtractor
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from transform.spatial_index import SpatialIndex
+from transform.near_duplicates import find_near_duplicates
+from transform.cluster_lookup import ClusterLookup
 
-import pandas as pd
+# État du mode incrémental (cf DataTourismTransformer.clean_data_incremental)
+ETAT_CDC = "../data/DataTourism/etat_cdc"
+
+# Les lignes de l'état incrémental sont réparties en partitions selon leur dedup_hash : seules les partitions
+# des groupes touchés sont réécrites
+NB_PARTITIONS_ETAT = 64
+
+# Nombre de bits à 1 de chaque octet, pour compter les bits des ensembles de catégories
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
 class DataTourismTransformer():
-    def __init__(self, df_tourism, cat_to_keep, categorie_dict, df_cluster) -> None:
+    def __init__(self, df_tourism, cat_to_keep, categorie_dict, df_cluster,
+                 dedup_key=("Nom_du_POI", "Latitude", "Longitude"), dedup_decimales=3,
+                 near_duplicates_km=None, avertissements=True) -> None:
         self.df_tourism = df_tourism
         self.cat_to_keep = cat_to_keep
         self.categorie_dict = categorie_dict
         self.df_cluster = df_cluster
 
+        # Clé de déduplication des POI : par défaut le nom et les coordonnées arrondies (3 décimales, ~100 m),
+        # pour ne pas fusionner des homonymes éloignés. ("URI_ID_du_POI",) est aussi possible.
+        self.dedup_key = list(dedup_key)
+        self.dedup_decimales = dedup_decimales
+
+        # Distance maximale (km) entre deux POI aux noms proches pour les fusionner (cf drop_near_duplicates),
+        # None pour désactiver la détection des quasi-doublons
+        self.near_duplicates_km = near_duplicates_km
+
+        # Signale les incohérences entre cat_to_keep et categorie_dict (cf compile_categories) ; désactivé dans les
+        # processus de clean_data_parallel, pour ne pas répéter les mêmes avertissements à chaque région
+        self.avertissements = avertissements
+
+        # Cohérence des listes de catégories, vérifiée une seule fois
+        self.compile_categories()
+
+        # Vocabulaire fixe des sous-catégories, chacune associée à un bit (cf compile_bitsets)
+        self.compile_bitsets()
+
         self.df_DataTourisme = pd.DataFrame()
 
+    def compile_categories(self):
+        """
+        Fonction qui vérifie, une seule fois, la cohérence entre cat_to_keep et categorie_dict : sous-catégories
+        présentes dans plusieurs catégories simplifiées (la première l'emporte, cf compile_bitsets), et
+        sous-catégories à garder qui n'appartiennent à aucune (classées dans Autre). Les incohérences sont signalées
+        ici plutôt que découvertes ligne par ligne lors du nettoyage.
+        """
+
+        categorie = {}
+
+        for key, values in self.categorie_dict.items():
+            for cat in values:
+                if cat in categorie and categorie[cat] != key:
+                    if self.avertissements:
+                        print(f"⚠️  {cat} est à la fois dans {categorie[cat]} et {key}, on garde {categorie[cat]}")
+                    continue
+                categorie[cat] = key
+
+        for cat in self.cat_to_keep:
+            if cat not in categorie and self.avertissements:
+                print(f"⚠️  {cat} n'appartient à aucune catégorie, elle sera classée dans Autre")
+
+    def compile_bitsets(self):
+        """
+        Fonction qui associe un bit à chaque sous-catégorie du vocabulaire (cat_to_keep et categorie_dict),
+        et construit les masques utilisés pour filtrer et classer les POI par opérations bit à bit : le masque
+        des catégories à garder, et un masque par catégorie simplifiée. Le vocabulaire dépassant 64
+        sous-catégories, un ensemble de catégories est stocké sur plusieurs mots uint64.
+        """
+
+        vocabulaire = list(dict.fromkeys(list(self.cat_to_keep) + [cat for values in self.categorie_dict.values() for cat in values]))
+
+        self.bit_index = {cat: i for i, cat in enumerate(vocabulaire)}
+        self.nb_mots = (len(vocabulaire) + 63) // 64
+        self.colonnes_bits = [f"Categories_bits_{i}" for i in range(self.nb_mots)]
+
+        self.masque_keep = self.encode_masque(self.cat_to_keep)
+
+        # Une sous-catégorie présente dans plusieurs catégories n'appartient qu'à la première (cf compile_categories)
+        deja_vues = set()
+        masques = []
+        for values in self.categorie_dict.values():
+            masques.append(self.encode_masque([cat for cat in values if cat not in deja_vues]))
+            deja_vues.update(values)
+
+        self.masques_categories = np.array(masques, dtype=np.uint64).reshape(len(masques), self.nb_mots)
+
+    def encode_masque(self, categories):
+        """
+        Fonction qui renvoie le masque (nb_mots uint64) d'un ensemble de sous-catégories du vocabulaire
+        """
+        masque = np.zeros(self.nb_mots, dtype=np.uint64)
+
+        for cat in categories:
+            bit = self.bit_index[cat]
+            masque[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+        return masque
+
+    def encode_categories(self, categories_de_poi):
+        """
+        Fonction qui transforme la liste complète des catégories de chaque POI (URIs de l'ontologie séparées par
+        des |) en ensemble de bits sur le vocabulaire. Le découpage des URIs n'est fait qu'une fois par URI
+        distincte, les sous-catégories hors vocabulaire sont ignorées.
+
+        Args:
+            categories_de_poi (pd.Series) : colonne brute Categories_de_POI
+
+        Return:
+            bits (np.ndarray) : tableau (nb_POI, nb_mots) de uint64
+        """
+
+        uris = categories_de_poi.reset_index(drop=True).str.split('|').explode().astype("category")
+
+        # Nom court de chaque URI distincte, puis position de son bit (-1 si hors vocabulaire)
+        noms = uris.cat.categories.str.split('/').str[-1].str.split('#').str[-1]
+        bits_categories = np.array([self.bit_index.get(nom, -1) for nom in noms], dtype=np.int64)
+
+        codes = uris.cat.codes.to_numpy()
+        lignes = uris.index.to_numpy()
+        bits_uris = np.where(codes >= 0, bits_categories[codes], -1)
+        garder = bits_uris >= 0
+
+        bits = np.zeros((len(categories_de_poi), self.nb_mots), dtype=np.uint64)
+        np.bitwise_or.at(bits, (lignes[garder], bits_uris[garder] // 64),
+                         np.left_shift(np.uint64(1), (bits_uris[garder] % 64).astype(np.uint64)))
+
+        return bits
+
+    def categorie_simplifiee(self, bits):
+        """
+        Fonction qui attribue à chaque POI la catégorie simplifiée avec laquelle il partage le plus de
+        sous-catégories (la première de categorie_dict en cas d'égalité), "Autre" s'il n'en partage aucune.
+
+        Args:
+            bits (np.ndarray) : ensembles de bits des POI, cf encode_categories
+
+        Return:
+            categories (pd.Categorical) : catégorie simplifiée de chaque POI
+        """
+
+        # Nombre de bits communs entre chaque POI et chaque catégorie : (nb_POI, nb_categories)
+        communs = bits[:, None, :] & self.masques_categories[None, :, :]
+        nb_communs = POPCOUNT_8[communs.view(np.uint8)].reshape(len(bits), len(self.masques_categories), -1).sum(axis=2)
+
+        noms = np.array(list(self.categorie_dict.keys()) + ["Autre"], dtype=object)
+        codes = np.where(nb_communs.max(axis=1) > 0, nb_communs.argmax(axis=1), len(noms) - 1)
+
+        return pd.Categorical.from_codes(codes, categories=noms)
+
     def clean_data(self):
         """
         Fonction permettant de nétoyer les donnée brut du dataset DataTourisme. Cette fonction réalise plusieur
@@ -28,14 +175,70 @@ class DataTourismTransformer():
         
         print(f"🧹 Nettoyage des données...")
         print(f"On commence avec {len(self.df_tourism)} ")
+
+        df = self.clean_region(self.df_tourism)
+
+        return self.reduce_regions([df])
+
+    def clean_data_parallel(self, list_chemin, dossier="../data/DataTourism/", max_workers=None):
+        """
+        Version map-reduce de clean_data : chaque fichier région est lu et nettoyé indépendamment dans un
+        pool de processus (cf clean_region), puis les résultats sont fusionnés (cf reduce_regions). On ne
+        charge ainsi jamais le dataset complet de la France en mémoire, et on utilise tous les coeurs.
+        Le rattachement aux clusters est fait une seule fois dans reduce_regions, après la déduplication entre
+        régions, plutôt que dans chaque processus : l'index spatial des communes n'est construit qu'une fois.
+
+        Args:
+            list_chemin (list) : noms des fichiers CSV des régions
+            dossier (String) : dossier contenant les fichiers
+            max_workers (int) : nombre de processus, par défaut le nombre de coeurs
+
+        Returns:
+            df (pd.DataFrame): DataFrame nettoyé.
+        """
+
+        print(f"🧹 Nettoyage des données de {len(list_chemin)} régions en parallèle...")
+
+        chemins = [dossier + chemin for chemin in list_chemin]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Les régions sont nettoyées en parallèle mais fusionnées dans l'ordre de list_chemin (executor.map) :
+            # à nombre de nan égal, le doublon gardé est ainsi le même qu'avec clean_data, quel que soit l'ordre
+            # dans lequel les processus terminent
+            list_df = executor.map(clean_region_file, chemins,
+                                   repeat(self.cat_to_keep), repeat(self.categorie_dict),
+                                   repeat(self.dedup_key), repeat(self.dedup_decimales))
+
+            return self.reduce_regions(list_df)
+
+    def clean_region(self, df_region, dedoublonner=True):
+        """
+        Étape "map" du nettoyage, indépendante d'une région à l'autre : parsing des catégories et du code
+        postal, filtrage des catégories, ajout de la catégorie simplifiée, et suppression des doublons au
+        sein de la région. La colonne nb_nan est conservée pour la déduplication entre régions.
+
+        Args:
+            df_region (pd.DataFrame) : données brutes d'une ou plusieurs régions
+            dedoublonner (bool) : si False, les doublons sont conservés (cf clean_data_incremental)
+
+        Returns:
+            df (pd.DataFrame): DataFrame nettoyé de la région.
+        """
         
         # On fait un copy pour ne pas modifier l'originale
-        df = self.df_tourism.copy()
+        df = df_region.copy()
 
 
         ### On supprime les données qui sont inutiles pour notre algorithme de décision et dont les champs sont principalement vide. ###
-        df.drop(['Periodes_regroupees', 'Covid19_mesures_specifiques', 'Contacts_du_POI', 'Classements_du_POI', 'SIT_diffuseur'], axis=1)
+        df = df.drop(['Periodes_regroupees', 'Covid19_mesures_specifiques', 'Contacts_du_POI', 'Classements_du_POI', 'SIT_diffuseur'], axis=1, errors="ignore")
+
 
+        ### On code l'ensemble des catégories de chaque POI en bits : le filtrage et la classification se font
+        # uniquement sur ces bits. Categories_de_POI ne garde ensuite que la dernière sous-catégorie (souvent
+        # générique), conservée comme libellé lisible dans la table exportée (cf to_csv) ###
+        bits = self.encode_categories(df["Categories_de_POI"])
+        for i, colonne in enumerate(self.colonnes_bits):
+            df[colonne] = bits[:, i]
 
         ### On récupère uniquement les catégorie de POI (orignialement noyyer dans une url) ###
         df["Categories_de_POI"] = df["Categories_de_POI"].str.split('/').str[-1]
@@ -74,26 +277,18 @@ class DataTourismTransformer():
         ### On supprime les catégorie de POI qui ne représente pas vraiment des déstination touristique selon une liste "cat_to_keep" ###
 
 
-        df = df[df["Categories_de_POI"].isin(self.cat_to_keep)].copy()
+        # Un POI est gardé si l'une quelconque de ses sous-catégories est dans cat_to_keep (et plus seulement
+        # la dernière, souvent une catégorie générique schema.org)
+        bits = df[self.colonnes_bits].to_numpy(dtype=np.uint64)
 
-        ###  On redéfini les catégorie de POI avec des catégorie plus globale ###
-        def find_category(cat):
-            """ 
-            Fonction permettant de trouver la catégory dans laquelle la sous-catégorie de POI est contenue
-            
-            Args:
-                cat (String) : sous catégorie du POI
-            
-            Retunr:
-                key (String) :nom de la catégorie du POI
-            
-            """
-            for key, values in self.categorie_dict.items():
-                if cat in values:
-                    return key
-            return "Autre"  # si aucune correspondance trouvée
+        garder = (bits & self.masque_keep).any(axis=1)
+        df = df[garder].copy()
+        bits = bits[garder]
 
-        df.insert(3, 'Categorie_simplifiee', df["Categories_de_POI"].apply(find_category)) 
+        df["Categories_de_POI"] = df["Categories_de_POI"].astype("category")
+
+        ###  On redéfini les catégorie de POI avec des catégorie plus globale (cf categorie_simplifiee) ###
+        df.insert(3, 'Categorie_simplifiee', self.categorie_simplifiee(bits))
 
 
         ### Suppression des oublons en fonction du nombre de nan dans leur colonnes ###
@@ -101,14 +296,68 @@ class DataTourismTransformer():
         # On compte le nombre de nan dans une ligne
         df["nb_nan"] = df.isna().sum(axis=1)
 
-        # On trie par nombre de nan
-        df = df.sort_values(by=["Nom_du_POI", "nb_nan"], ascending=[True, True])
+        # On résume la clé de déduplication en une empreinte entière, puis on garde la ligne la plus complète
+        # de chaque empreinte (sans trier le dataframe)
+        df["dedup_hash"] = self.dedup_hash(df)
+
+        if dedoublonner:
+            df = deduplicate(df)
+
+        return df
+
+    def dedup_hash(self, df):
+        """
+        Fonction qui calcule l'empreinte (uint64) de la clé de déduplication de chaque POI, les coordonnées étant
+        arrondies à dedup_decimales.
+
+        Args:
+            df (pd.DataFrame) : POI
+
+        Returns:
+            empreintes (np.ndarray) : empreinte de chaque ligne
+        """
+
+        df_cle = df[self.dedup_key].copy()
 
-        # On supprime les doublons en gardant la première ligne
-        df = df.drop_duplicates(subset="Nom_du_POI", keep="first")
+        for colonne in ["Latitude", "Longitude"]:
+            if colonne in df_cle:
+                df_cle[colonne] = df_cle[colonne].round(self.dedup_decimales)
 
-        # On supprime la colonne temporaire
-        df = df.drop(columns="nb_nan")
+        return pd.util.hash_pandas_object(df_cle, index=False).to_numpy()
+
+    def reduce_regions(self, list_df):
+        """
+        Étape "reduce" du nettoyage : fusion des régions nettoyées, suppression des doublons entre régions,
+        création de la clé primaire et rattachement aux clusters.
+
+        Args:
+            list_df (iterable) : DataFrames renvoyés par clean_region, consommés au fur et à mesure
+
+        Returns:
+            df (pd.DataFrame): DataFrame nettoyé.
+        """
+
+        ### Suppression des doublons entre régions, toujours en gardant la ligne la plus complète ###
+        deduplicateur = PoiDeduplicator(["URI_ID_du_POI", "Nom_du_POI", "Categories_de_POI", "Categorie_simplifiee",
+                                         "Département", "Code_postale", "Commune", "Latitude", "Longitude",
+                                         "Date_de_mise_a_jour"] + self.colonnes_bits + ["nb_nan", "dedup_hash"])
+
+        for df_region in list_df:
+            deduplicateur.update(df_region)
+
+        df = deduplicateur.result()
+
+        # Quasi-doublons : même lieu publié sous des noms légèrement différents ("Citadelle de Calvi" et
+        # "La citadelle - Calvi"), dans plusieurs régions ou par plusieurs producteurs
+        if self.near_duplicates_km is not None:
+            df = self.drop_near_duplicates(df)
+
+        # Les catégories diffèrent d'une région à l'autre : on recode une fois après la concaténation
+        df[["Categories_de_POI", "Categorie_simplifiee"]] = df[["Categories_de_POI", "Categorie_simplifiee"]].astype("category")
+
+
+        # On supprime les colonnes temporaires
+        df = df.drop(columns=["nb_nan", "dedup_hash"])
 
         # On réindexe 
         df = df.reset_index(drop=True)
@@ -122,7 +371,7 @@ class DataTourismTransformer():
 
         ### On réindexe en fonction du département ###
 
-        df = df.sort_values(by=['Département'], ascending=[True]).reset_index(drop=True)
+        df = df.sort_values(by=['Département'], ascending=[True], kind="stable").reset_index(drop=True)
 
 
         ### On convertis les code postaux en floatant ###
@@ -130,19 +379,9 @@ class DataTourismTransformer():
         df['Code_postale'] = df['Code_postale'].astype(float)
 
 
-        ### On récupère les cluster id depuis la table des cluster en fonction des codes postaux ###
-
-        df_cluster = self.df_cluster.rename(columns={'code_postal': 'Code_postale'})
+        ### On rattache chaque POI à une unique commune, et donc à son cluster, à partir de ses coordonnées ###
 
-        # On fusionne sur les codes postaux
-        df_merged = df.merge(
-            df_cluster[['Code_postale', 'code_cluster']], 
-            on='Code_postale', 
-            how='left' 
-        )
-
-        # On renome la colonne pour plus de clarter
-        df = df_merged.rename(columns={'code_cluster': 'Cluster_id'})
+        df['code_insee'], df['Cluster_id'] = self.rattacher_communes(df)
 
         df = df.dropna(subset=["Cluster_id"])
 
@@ -152,36 +391,525 @@ class DataTourismTransformer():
 
         return df
     
+    def clean_data_incremental(self, chemin_etat=ETAT_CDC):
+        """
+        Version incrémentale de clean_data : seules les lignes de l'export insérées, modifiées (Date_de_mise_a_jour
+        plus récente ou contenu différent) ou supprimées depuis l'exécution précédente sont traitées. L'état
+        (empreinte et date de chaque ligne brute, lignes nettoyées avant déduplication, table finale et matrice des
+        nombres de POI) est conservé dans chemin_etat, indexé par l'ID du POI.
+
+        Seuls les groupes de doublons (dedup_hash) touchés par un changement sont re-dédoublonnés, et la matrice
+        des nombres de POI est corrigée par différence (cf patch_count_matrix). La détection des quasi-doublons
+        (near_duplicates_km), globale, est refaite sur toute la table quand elle est activée.
+
+        Args:
+            chemin_etat (String) : dossier de l'état, créé au premier appel
+
+        Returns:
+            df (pd.DataFrame): DataFrame nettoyé.
+        """
+
+        if self.df_tourism.empty:
+            print("⚠️  Pas de données a néttoyer")
+            return self.df_tourism
+
+        etat = self.charger_etat(chemin_etat)
+
+        ### Empreinte de chaque ligne brute, indexée par l'ID du POI ###
+
+        df_brut = self.df_tourism.copy()
+        df_brut.index = pd.Index(df_brut["URI_ID_du_POI"].str.split('/').str[-1], name="ID")
+        df_brut = df_brut[df_brut.index.notna() & ~df_brut.index.duplicated()]
+
+        df_empreintes = pd.DataFrame({"empreinte": pd.util.hash_pandas_object(df_brut, index=False),
+                                      "date": pd.to_datetime(df_brut["Date_de_mise_a_jour"])})
+
+        ### Comparaison avec l'état précédent ###
+
+        precedent = etat["empreintes"].reindex(df_empreintes.index)
+
+        inseres = precedent["empreinte"].isna()
+        modifies = ~inseres & ((precedent["empreinte"] != df_empreintes["empreinte"])
+                               | (df_empreintes["date"] > precedent["date"]))
+        supprimes = etat["empreintes"].index.difference(df_empreintes.index)
+
+        a_traiter = df_empreintes.index[inseres | modifies]
+        a_retirer = supprimes.union(df_empreintes.index[modifies])
+
+        depuis = f" depuis le {etat['watermark']}" if etat["watermark"] is not None else ""
+        print(f"🔄 {inseres.sum()} POI insérés, {modifies.sum()} modifiés, {len(supprimes)} supprimés{depuis}")
+
+        ### Nettoyage des seules lignes insérées ou modifiées ###
+
+        df_lignes = etat["df_lignes"]
+        df_nouvelles = pd.DataFrame(columns=df_lignes.columns)
+
+        if len(a_traiter) > 0:
+            df_nouvelles = self.clean_region(df_brut.loc[a_traiter], dedoublonner=False)
+            df_nouvelles.insert(0, 'ID', df_nouvelles.index)
+            df_nouvelles['Code_postale'] = df_nouvelles['Code_postale'].astype(float)
+            df_nouvelles['code_insee'], df_nouvelles['Cluster_id'] = self.rattacher_communes(df_nouvelles)
+
+        df_retirees = df_lignes[df_lignes.index.isin(a_retirer)]
+        df_lignes = self.concatener([df_lignes[~df_lignes.index.isin(a_retirer)], df_nouvelles])
+
+        ### Déduplication des seuls groupes touchés ###
+
+        touches = np.union1d(df_retirees["dedup_hash"].to_numpy(dtype=np.uint64),
+                             df_nouvelles["dedup_hash"].to_numpy(dtype=np.uint64))
+
+        # Comme dans clean_data, les lignes sont prises dans l'ordre de l'export : c'est lui qui départage les
+        # doublons à égalité de nan, et qui donne l'ordre des POI au sein d'un département
+        position = pd.Series(np.arange(len(df_brut)), index=df_brut.index)
+
+        df_vue = etat["df_vue"]
+        df_vue_retirees = df_vue[df_vue["dedup_hash"].isin(touches)]
+
+        df_groupes = df_lignes[df_lignes["dedup_hash"].isin(touches)]
+        df_groupes = df_groupes.iloc[np.argsort(position.reindex(df_groupes.index).to_numpy(), kind="stable")]
+
+        df_vue_ajoutees = deduplicate(df_groupes)
+        df_vue_ajoutees = df_vue_ajoutees.dropna(subset=["Cluster_id"])
+
+        df_vue = self.concatener([df_vue[~df_vue["dedup_hash"].isin(touches)], df_vue_ajoutees])
+        df_vue = df_vue.iloc[np.argsort(position.reindex(df_vue.index).to_numpy(), kind="stable")]
+        df_vue = df_vue.sort_values(by=['Département'], kind="stable")
+
+        categories = ["Categories_de_POI", "Categorie_simplifiee"]
+        df_vue[categories] = df_vue[categories].astype("category")
+
+        ### Table finale et matrice des nombres de POI ###
+
+        df = df_vue.drop(columns=["nb_nan", "dedup_hash"]).reset_index(drop=True)
+
+        if self.near_duplicates_km is not None:
+            df = self.drop_near_duplicates(df_vue.reset_index(drop=True)).drop(columns=["nb_nan", "dedup_hash"])
+            self.df_DataTourisme = df.copy()
+            self.build_count_matrix()
+        else:
+            self.df_DataTourisme = df.copy()
+            if etat["count_matrix"] is None:
+                self.build_count_matrix()
+            else:
+                self.count_matrix, self.cluster_ids = etat["count_matrix"], etat["cluster_ids"]
+                self.categories = list(self.categorie_dict.keys()) + ["Autre"]
+                self.patch_count_matrix(df_vue_retirees, df_vue_ajoutees)
+
+        watermark = df_empreintes["date"].max()
+        if etat["watermark"] is not None:
+            watermark = max(watermark, etat["watermark"])
+
+        etat.update({"watermark": watermark,
+                     "empreintes": df_empreintes,
+                     "df_lignes": df_lignes,
+                     "df_vue": df_vue,
+                     "count_matrix": None if self.near_duplicates_km is not None else self.count_matrix,
+                     "cluster_ids": self.cluster_ids})
+        self.sauvegarder_etat(etat, chemin_etat, touches)
+
+        print(f'Il reste {len(df)} data après nettoyage.')
+
+        return df
+
+    def concatener(self, list_df):
+        """
+        Concatène des morceaux de l'état incrémental en ignorant les morceaux vides, dont les colonnes sans type
+        (object) changeraient le type des autres, puis remet les types de clean_region : les bits des
+        catégories doivent rester en uint64 (un float64 ne représente pas exactement plus de 53 bits).
+        """
+        non_vides = [df for df in list_df if len(df) > 0]
+        if not non_vides:
+            return list_df[0]
+
+        df = pd.concat(non_vides)
+
+        types = {colonne: np.uint64 for colonne in self.colonnes_bits + ["dedup_hash"]}
+        types.update({"Département": np.int64, "nb_nan": np.int64})
+
+        return df.astype({colonne: type_ for colonne, type_ in types.items() if colonne in df})
+
+    def signature_configuration(self):
+        """
+        Empreinte des paramètres du nettoyage, table des communes comprise (elle donne les Cluster_id) : un état
+        incrémental calculé avec d'autres paramètres est ignoré.
+        """
+        empreinte_communes = None
+        if self.df_cluster is not None:
+            colonnes = [c for c in ["code_insee", "latitude_centre", "longitude_centre", "code_cluster", "code_postal",
+                                    "population"]
+                        if c in self.df_cluster]
+            empreinte_communes = int(pd.util.hash_pandas_object(self.df_cluster[colonnes], index=False)
+                                     .to_numpy().view(np.int64).sum())
+
+        return repr((sorted(self.cat_to_keep), sorted((k, list(v)) for k, v in self.categorie_dict.items()),
+                     self.dedup_key, self.dedup_decimales, empreinte_communes))
+
+    def charger_etat(self, chemin_etat):
+        """
+        Charge l'état du mode incrémental (dossier chemin_etat : etat.pkl et les partitions des lignes), ou un état
+        vide s'il n'existe pas ou a été calculé avec d'autres paramètres.
+        """
+        try:
+            with open(os.path.join(chemin_etat, "etat.pkl"), "rb") as f:
+                etat = pickle.load(f)
+
+            if etat["configuration"] != self.signature_configuration():
+                print("⚠️  Paramètres du nettoyage modifiés, état incrémental ignoré")
+                raise KeyError("configuration")
+
+            for cle in ["df_lignes", "df_vue"]:
+                morceaux = []
+                for partition in range(NB_PARTITIONS_ETAT):
+                    with open(os.path.join(chemin_etat, f"{cle}_{partition}.pkl"), "rb") as f:
+                        morceau = pickle.load(f)
+
+                    # Partition réécrite par une exécution interrompue avant etat.pkl : l'état n'est plus cohérent
+                    if morceau["generation"] != etat["generations"][partition]:
+                        print("⚠️  État incrémental incohérent (écriture interrompue), reconstruction complète")
+                        raise KeyError("generation")
+
+                    morceaux.append(morceau["df"])
+                etat[cle] = self.concatener(morceaux)
+
+            etat["complet"] = False
+            return etat
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            pass
+
+        return {"configuration": self.signature_configuration(),
+                "watermark": None,
+                "empreintes": pd.DataFrame({"empreinte": pd.Series(dtype=np.uint64),
+                                            "date": pd.Series(dtype="datetime64[ns]")}),
+                "df_lignes": pd.DataFrame(columns=["dedup_hash"]),
+                "df_vue": pd.DataFrame(columns=["dedup_hash"]),
+                "count_matrix": None,
+                "cluster_ids": None,
+                "generations": [None] * NB_PARTITIONS_ETAT,
+                "complet": True}
+
+    def sauvegarder_etat(self, etat, chemin_etat, touches):
+        """
+        Écrit l'état du mode incrémental : seules les partitions des dedup_hash touchés sont réécrites (toutes si
+        l'état vient d'être créé), chacune de manière atomique, puis etat.pkl en dernier. Chaque partition porte
+        l'identifiant de l'écriture (génération) qui l'a produite, et etat.pkl la génération attendue de chaque
+        partition : si l'écriture est interrompue entre les deux, charger_etat détecte l'écart et l'état est
+        reconstruit en entier.
+        """
+        os.makedirs(chemin_etat, exist_ok=True)
+
+        def ecrire(objet, nom):
+            chemin = os.path.join(chemin_etat, nom)
+            chemin_tmp = f"{chemin}.{os.getpid()}.tmp"
+            with open(chemin_tmp, "wb") as f:
+                pickle.dump(objet, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(chemin_tmp, chemin)
+
+        if etat["complet"]:
+            partitions = np.arange(NB_PARTITIONS_ETAT)
+        else:
+            partitions = np.unique(np.asarray(touches, dtype=np.uint64) % np.uint64(NB_PARTITIONS_ETAT))
+
+        generation = uuid.uuid4().hex
+        generations = list(etat["generations"])
+
+        for cle in ["df_lignes", "df_vue"]:
+            df = etat[cle]
+            partition_lignes = df["dedup_hash"].to_numpy(dtype=np.uint64) % np.uint64(NB_PARTITIONS_ETAT)
+
+            for partition in partitions:
+                ecrire({"generation": generation, "df": df[partition_lignes == partition]}, f"{cle}_{partition}.pkl")
+
+        for partition in partitions:
+            generations[partition] = generation
+        etat["generations"] = generations
+
+        ecrire({cle: valeur for cle, valeur in etat.items() if cle not in ["df_lignes", "df_vue", "complet"]},
+               "etat.pkl")
+
+    def drop_near_duplicates(self, df, seuil=0.5):
+        """
+        Fusionne les POI aux noms proches (MinHash / LSH, cf find_near_duplicates) et distants de moins de
+        near_duplicates_km, en gardant pour chaque groupe la ligne la plus complète.
+
+        Args:
+            df (pd.DataFrame): POI dédoublonnés exactement, avec la colonne nb_nan
+            seuil (float): similarité de Jaccard minimale entre les noms de deux doublons
+
+        Returns:
+            df (pd.DataFrame): POI sans quasi-doublons
+        """
+        df = df.copy()
+        df["dedup_hash"] = find_near_duplicates(df["Nom_du_POI"], df["Latitude"], df["Longitude"],
+                                                max_distance_km=self.near_duplicates_km, seuil=seuil)
+
+        df_sans_doublons = deduplicate(df).reset_index(drop=True)
+
+        print(f'{len(df) - len(df_sans_doublons)} quasi-doublons supprimés.')
+
+        return df_sans_doublons
+
+    def rattacher_communes(self, df, max_distance_km=20):
+        """
+        Fonction qui rattache chaque POI à la commune dont le centre est le plus proche de ses coordonnées, par une
+        seule requête sur un index spatial des centres des communes (cf transform/spatial_index.py), puis à son
+        cluster par la table code INSEE -> cluster partagée (cf transform/cluster_lookup.py). Contrairement à une
+        jointure sur le code postal, partagé par plusieurs communes, chaque POI reçoit exactement une commune.
+        Les POI sans coordonnées, ou trop loin de toute commune, sont rattachés par leur code postal à la commune
+        la plus peuplée qui le porte (la plus petite par code INSEE à population égale ou inconnue).
+
+        Args:
+            df (pd.DataFrame) : POI avec les colonnes Latitude, Longitude et Code_postale
+            max_distance_km (float) : distance maximale entre un POI et le centre de sa commune
+
+        Return:
+            code_insee (np.ndarray) : code INSEE de la commune de chaque POI (None si aucune)
+            cluster_id (np.ndarray) : code du cluster de chaque POI (NaN si aucun)
+        """
+
+        if getattr(self, 'commune_index', None) is None:
+            self.df_communes = self.df_cluster.dropna(subset=['latitude_centre', 'longitude_centre']).reset_index(drop=True)
+            self.commune_index = SpatialIndex(self.df_communes['latitude_centre'], self.df_communes['longitude_centre'])
+            self.cluster_lookup = ClusterLookup(self.df_cluster.dropna(subset=['code_insee', 'code_cluster']))
+
+        codes_insee = np.append(self.df_communes['code_insee'].to_numpy(dtype=object), None)
+
+        indices = np.full(len(df), -1)
+        avec_coordonnees = (df['Latitude'].notna() & df['Longitude'].notna()).to_numpy()
+
+        indices[avec_coordonnees], _ = self.commune_index.query(df['Latitude'].to_numpy()[avec_coordonnees],
+                                                                df['Longitude'].to_numpy()[avec_coordonnees],
+                                                                max_distance_km=max_distance_km)
+
+        # Repli sur le code postal, dédoublonné pour ne jamais multiplier les lignes
+        sans_commune = indices < 0
+        if sans_commune.any():
+            communes = self.df_communes.reset_index()
+            population = communes['population'] if 'population' in communes else pd.Series(0, index=communes.index)
+
+            commune_principale = (communes.assign(population_tri=population.fillna(-1))
+                                  .sort_values(['population_tri', 'code_insee'], ascending=[False, True], kind="stable")
+                                  .drop_duplicates(subset='code_postal')
+                                  .set_index('code_postal')['index'])
+            indices[sans_commune] = (df['Code_postale'][sans_commune].map(commune_principale)
+                                     .fillna(-1).to_numpy(dtype=int))
+
+            print(f"📮 {int((indices[sans_commune] >= 0).sum())} POI rattachés par leur code postal, "
+                  f"{int((indices < 0).sum())} sans commune")
+
+        codes_insee = codes_insee[indices]
+
+        clusters = self.cluster_lookup.lookup(codes_insee).astype(float)
+        clusters[clusters == 0] = np.nan
+
+        return codes_insee, clusters
+
     def to_csv(self):
         """
         Fonction pour sauvegarder le dataframe en csv
         """
         self.df_DataTourisme.to_csv('DataTourismClean.csv', index=False)
 
+    def build_count_matrix(self, multi_label=False):
+        """
+        Fonction qui construit, une seule fois, la matrice dense des nombres de POI par cluster (lignes) et
+        par catégorie simplifiée (colonnes). Le score de tous les clusters pour un jeu de poids est alors un
+        simple produit matrice-vecteur (cf compute_scores).
+
+        Args:
+            multi_label (bool) : si True, un POI compte dans chaque catégorie simplifiée avec laquelle il partage
+        au moins une sous-catégorie (test bit à bit), et pas seulement dans sa Categorie_simplifiee
+
+        Return:
+            count_matrix (np.ndarray) : matrice (nb_clusters, nb_categories) des nombres de POI
+        """
+
+        df = self.df_DataTourisme if not self.df_DataTourisme.empty else self.df_tourism
+
+        self.categories = list(self.categorie_dict.keys()) + ["Autre"]
+        self.cluster_ids, code_cluster = np.unique(df['Cluster_id'].to_numpy(), return_inverse=True)
+
+        nb_clusters, nb_categories = len(self.cluster_ids), len(self.categories)
+
+        if multi_label:
+            bits = df[self.colonnes_bits].to_numpy(dtype=np.uint64)
+
+            # Appartenance (nb_POI, nb_categories) : au moins un bit commun avec le masque de la catégorie
+            appartenance = (bits[:, None, :] & self.masques_categories[None, :, :]).any(axis=2)
+            appartenance = np.column_stack([appartenance, ~appartenance.any(axis=1)])
+
+            self.count_matrix = np.zeros((nb_clusters, nb_categories), dtype=np.int64)
+            np.add.at(self.count_matrix, code_cluster, appartenance.astype(np.int64))
+
+            return self.count_matrix
+
+        code_categorie = pd.Categorical(df['Categorie_simplifiee'], categories=self.categories).codes
+        garder = code_categorie >= 0
+
+        # Comptage en une passe : chaque couple (cluster, catégorie) correspond à une case de la matrice aplatie
+        self.count_matrix = np.bincount(code_cluster[garder] * nb_categories + code_categorie[garder],
+                                        minlength=nb_clusters * nb_categories).reshape(nb_clusters, nb_categories)
+
+        return self.count_matrix
+
+    def patch_count_matrix(self, df_retires, df_ajoutes):
+        """
+        Fonction qui corrige la matrice des nombres de POI après une mise à jour incrémentale, sans la recalculer :
+        les POI retirés sont décomptés, les POI ajoutés comptés, et les nouveaux clusters ajoutés à la matrice.
+
+        Args:
+            df_retires (pd.DataFrame) : POI qui ne sont plus dans la table
+            df_ajoutes (pd.DataFrame) : POI ajoutés à la table
+
+        Return:
+            count_matrix (np.ndarray) : matrice (nb_clusters, nb_categories) des nombres de POI
+        """
+
+        cluster_ids = np.union1d(self.cluster_ids, df_ajoutes['Cluster_id'].to_numpy(dtype=float))
+
+        if len(cluster_ids) > len(self.cluster_ids):
+            count_matrix = np.zeros((len(cluster_ids), len(self.categories)), dtype=self.count_matrix.dtype)
+            count_matrix[np.searchsorted(cluster_ids, self.cluster_ids)] = self.count_matrix
+            self.count_matrix, self.cluster_ids = count_matrix, cluster_ids
+
+        for df, signe in ((df_retires, -1), (df_ajoutes, 1)):
+            lignes = np.searchsorted(self.cluster_ids, df['Cluster_id'].to_numpy(dtype=float))
+            colonnes = pd.Categorical(df['Categorie_simplifiee'], categories=self.categories).codes
+            garder = colonnes >= 0
+
+            np.add.at(self.count_matrix, (lignes[garder], colonnes[garder]), signe)
+
+        return self.count_matrix
+
+    def save_count_matrix(self, chemin='count_matrix.npz'):
+        """
+        Fonction pour sauvegarder la matrice des nombres de POI avec ses axes (clusters et catégories)
+        """
+        np.savez(chemin, count_matrix=self.count_matrix, cluster_ids=self.cluster_ids,
+                 categories=np.array(self.categories))
+
+    def load_count_matrix(self, chemin='count_matrix.npz'):
+        """
+        Fonction pour recharger une matrice sauvegardée par save_count_matrix, sans recalculer les comptages
+        """
+        with np.load(chemin) as data:
+            self.count_matrix = data['count_matrix']
+            self.cluster_ids = data['cluster_ids']
+            self.categories = data['categories'].tolist()
+
+        return self.count_matrix
+
+    def weight_matrix(self, list_dict_poids):
+        """
+        Fonction qui transforme des dictionnaires de poids en matrice (nb_categories, nb_profils), dans l'ordre
+        des colonnes de count_matrix. Les catégories absentes d'un dictionnaire ont un poids nul.
+        """
+        return np.array([[dict_poids.get(categorie, 0) for dict_poids in list_dict_poids]
+                         for categorie in self.categories], dtype=float)
+
+    def compute_scores(self, dict_poids):
+        """Fonction permettant de calculer le score de tous les clusters en une fois pour un jeu de poids,
+        par un produit matrice-vecteur sur la matrice des nombres de POI
+        Args:
+            dict_poids (Dict) : dictionnaire avec le nom de la catégorie et le poid associer
+        Return:
+            scores (pd.Series) : score d'attractiviter de chaque cluster, indexé par Cluster_id"""
+
+        return self.compute_scores_batch([dict_poids])[0].rename('score')
+
+    def compute_scores_batch(self, list_dict_poids):
+        """Fonction permettant de calculer le score de tous les clusters pour plusieurs profils utilisateurs
+        en une fois, par un produit matriciel
+        Args:
+            list_dict_poids (list) : liste de dictionnaires de poids, un par profil
+        Return:
+            scores (pd.DataFrame) : scores, une ligne par cluster et une colonne par profil"""
+
+        if getattr(self, 'count_matrix', None) is None:
+            self.build_count_matrix()
+
+        scores = self.count_matrix @ self.weight_matrix(list_dict_poids)
+
+        return pd.DataFrame(scores, index=pd.Index(self.cluster_ids, name='Cluster_id'))
+
     def compute_score(self, dict_poids, cluster):
         """Focntion permettant de calculer le score d'un cluster en fonction de la liste des poids sur les catégories 
         détermiber par les choix de l'utilisateur
         Args:
             dict_poids (Dict) : dictionnaire avec le nom de la catégorie et le poid associer
             cluster (int) : le cluster id à calculer
-            df (Dataframe) : dataframe de DataTourisme nétoyer
         Return:
-            score (int) : score d'attractiviter du cluster"""
+            score (float) : score d'attractiviter du cluster (0 si le cluster n'a aucun POI)"""
+
+        if getattr(self, 'count_matrix', None) is None:
+            self.build_count_matrix()
+
+        position = np.searchsorted(self.cluster_ids, cluster)
+
+        if position == len(self.cluster_ids) or self.cluster_ids[position] != cluster:
+            return 0
+
+        return float(self.count_matrix[position] @ self.weight_matrix([dict_poids])[:, 0])
+
+
 
-        df_count = self.df_tourism[self.df_tourism['Cluster_id'] == cluster].copy()
 
-        score = 0
 
-        for categorie, poid in dict_poids.items():
-            df_subset = df_count[df_count['Categorie_simplifiee'] == categorie]
-            
-            score += poid * df_subset.shape[0]
 
-        return score
+def deduplicate(df):
+    """
+    Garde, pour chaque valeur de dedup_hash, la ligne avec le moins de nan (la première en cas d'égalité), par une
+    réduction groupée plutôt qu'un tri de tout le dataframe. L'ordre des lignes conservées est inchangé, quel que
+    soit l'index (on travaille sur les positions, pas sur les étiquettes).
+    """
+    nb_nan = pd.Series(df["nb_nan"].to_numpy())
+    positions = nb_nan.groupby(df["dedup_hash"].to_numpy(), sort=False).idxmin().to_numpy()
 
+    return df.iloc[np.sort(positions)]
 
 
+class PoiDeduplicator():
+    """
+    Déduplication incrémentale des POI : les morceaux (régions, fichiers, ...) sont ajoutés un par un, et on ne
+    conserve entre deux ajouts que la meilleure ligne de chaque clé. La mémoire dépend donc du nombre de POI
+    distincts et du plus gros morceau, pas du volume total.
+    """
 
+    def __init__(self, colonnes=("nb_nan", "dedup_hash")):
+        """
+        Args:
+            colonnes (list): colonnes du résultat quand aucun morceau n'a été ajouté
+        """
+        self.df = None
+        self.colonnes = list(colonnes)
+
+    def update(self, df_morceau):
+        """
+        Ajoute un morceau (avec les colonnes nb_nan et dedup_hash, cf DataTourismTransformer.clean_region).
+        """
+        if self.df is None:
+            self.df = deduplicate(df_morceau.reset_index(drop=True))
+        else:
+            self.df = deduplicate(pd.concat([self.df, df_morceau], ignore_index=True))
+
+    def result(self):
+        """
+        Renvoie les POI dédoublonnés (un DataFrame vide si aucun morceau n'a été ajouté).
+        """
+        if self.df is None:
+            return pd.DataFrame(columns=self.colonnes)
+
+        return self.df.reset_index(drop=True)
+
+
+def clean_region_file(chemin, cat_to_keep, categorie_dict, dedup_key, dedup_decimales):
+    """
+    Lit et nettoie le fichier d'une région (étape "map" de DataTourismTransformer.clean_data_parallel).
+    Fonction de module pour pouvoir être envoyée aux processus du pool.
+    """
+    transformer = DataTourismTransformer(pd.DataFrame(), cat_to_keep, categorie_dict, None, dedup_key, dedup_decimales,
+                                         avertissements=False)
+
+    return transformer.clean_region(pd.read_csv(chemin))
 
 
 ### Cluster ###
@@ -199,13 +927,6 @@ if __name__ == "__main__":
         "datatourisme-reg-idf.csv",  "datatourisme-reg-occ.csv", "datatourisme-reg-pac.csv",
         "datatourisme-reg-pdl.csv"]
 
-    extractor = DataTourismExtractor(list_df)
-
-    # extractor.extract_csv()
-    df_tourism = extractor.extract_data()
-
-    # print(df_tourism)
-
     # A garder score cacher qui compte sans un poids du client
     Logement = ['Hotel', 'BedAndBreakfast', 'HotelRestaurant', 'Hostel', 'CampingAndCaravanning',
                 'Accommodation', 'HotelTrade', 'RentalAccommodation', 'CollectiveAccommodation', 'TableHoteGuesthouse',
@@ -225,7 +946,7 @@ if __name__ == "__main__":
     transport = ['Transport', 'TrainStation', 'BusStation', 'Transporter', 'Airport', 'TaxiCompany'] # Transport = principalement des ports/ BusStation = gare routière
 
     # Garder
-    activités = ['Product', 'Hammam', 'AmusementPark', 'Landform', 'Casino',  'BowlingAlley', 'RailBike', 'MiniGolf', 'AdventurePark'
+    activités = ['Product', 'Hammam', 'AmusementPark', 'Landform', 'Casino',  'BowlingAlley', 'RailBike', 'MiniGolf', 'AdventurePark',
                 'BalneotherapyCentre', 'SummerToboggan', 'NauticalCentre',
                 'TastingProvider', 'ActivityProvider',  'Rental', 'Trampoline', 'EquestrianCenter', 'EquipmentRental',
                 "Tour", 'LeisureSportActivityProvider', 'Practice', 'EntertainmentAndEvent', 'MegalithDolmenMenhir', 'TrainingWorkshop', 'TeachingFarm',
@@ -272,7 +993,7 @@ if __name__ == "__main__":
                 "AccommodationProduct", 'Guesthouse', 'House', "TouristInformationCenter", "FoodEstablishment", 'Restaurant', 'CafeOrCoffeeShop', 'IceCreamShop', 'Bakery',
                 'SaleEvent', 'TheaterEvent', 'Event', 'Festival', 'MusicEvent', "SportsEvent", 'TraditionalCelebration', 'ShowEvent', 'ChildrensEvent',
                 'Concert', 'Exhibition', 'LocalAnimation', 'Rambling', 'Transport', 'TrainStation', 'BusStation', 'Transporter', 'Airport', 'TaxiCompany',
-                'Product', 'Hammam', 'AmusementPark', 'Landform', 'Casino',  'BowlingAlley', 'RailBike', 'MiniGolf', 'AdventurePark'
+                'Product', 'Hammam', 'AmusementPark', 'Landform', 'Casino',  'BowlingAlley', 'RailBike', 'MiniGolf', 'AdventurePark',
                 'TastingProvider', 'ActivityProvider',  'Rental', 'Trampoline', 'EquestrianCenter', 'EquipmentRental',
                 "Tour", 'LeisureSportActivityProvider', 'Practice', 'EntertainmentAndEvent', 'MegalithDolmenMenhir', 'TrainingWorkshop', 'TeachingFarm',
                 "CulturalActivityProvider", 'Cinematheque', 'Visit', 'WalkingTour', 'SportsAndLeisurePlace', 'OrderedList',  'GolfCourse', 'ClimbingWall', 'TennisComplex', 
@@ -299,7 +1020,7 @@ if __name__ == "__main__":
     df_cluster = pd.read_csv('../data/communes_france_cleaned.csv')
 
 
-    tourism_transformer = DataTourismTransformer(df_tourism, Liste_to_keep, categorie_dict, df_cluster)
+    tourism_transformer = DataTourismTransformer(pd.DataFrame(), Liste_to_keep, categorie_dict, df_cluster)
 
-    df_dataToursime = tourism_transformer.clean_data()
+    df_dataToursime = tourism_transformer.clean_data_parallel(list_df)
 
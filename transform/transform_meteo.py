@@ -1,117 +1,421 @@
+import os
+import pickle
+
+import requests
 import pandas as pd
 import numpy as np
 
+from extract.extract_meteo import DTYPES_SYNOP, SYNOP_DEBUT, DEPARTEMENTS_METROPOLE
+from transform.meteo_states import (COLONNES_STATION, AGREGATIONS, MAXIMUMS, colonnes_agregats, etats_mensuels,
+                                    fusionner_etats, finaliser_etats, MeteoDistributions)
+from transform.meteo_interpolation import StationInterpolator
+from transform.spatial_index import SpatialIndex
+
+
+# États partiels des agrégats mensuels et watermark de la mise à jour incrémentale (cf update_monthly)
+ETATS_METEO = "data/meteo_etats.pkl"
+
+# Noms des colonnes météo dans les tables par cluster
+RENOMMAGE_METEO = {'Pression station': 'Meteo_Pression_station_moyenne',
+                   'Température (°C)': 'Meteo_Temperature_moyenne',
+                   'Précipitations dans les 24 dernières heures': 'Meteo_Precipitations_moyenne',
+                   'Rafales sur une période': 'Meteo_Rafales_moyenne',
+                   'Rafales sur une période (max)': 'Meteo_Rafales_max'}
+
 
 class TransformMeteo:
     def __init__(self, df_meteo):
         self.df_meteo = df_meteo
     
     def process_data(self):
-        # Logic to process the extracted data
-        self.df = pd.read_csv("data/donnees-synop-essentielles-omm.csv", sep=';')
+        """
+        Agrège les observations SYNOP par station et par mois. Les observations sont séparées en une table des
+        stations (une ligne par station, avec un identifiant entier station_id) et une table de faits agrégée
+        sur les seules clés entières station_id x Mois (cf build_station_dimension, aggregate_facts).
+
+        Returns:
+            df_mensuel (pd.DataFrame): moyennes mensuelles par station, jointes aux attributs des stations
+        """
+        if self.df_meteo is None or self.df_meteo.empty:
+            self.df_meteo = pd.read_csv("data/donnees-synop-essentielles-omm.csv", sep=';', dtype=DTYPES_SYNOP)
 
-        self.df.drop(columns=["Rafale sur les 10 dernières minutes","Précipitations dans les 3 dernières heures"], inplace=True)
+        self.df = self.df_meteo.drop(columns=["Rafale sur les 10 dernières minutes","Précipitations dans les 3 dernières heures"])
 
-        self.df.dropna(inplace=True)
+        self.df = self.df.dropna()
 
         self.df['Date'] = pd.to_datetime(self.df['Date'], format="ISO8601", utc=True)
         self.df['Mois'] = self.df['Date'].dt.month
-        
-        # On construit un gros tcd, avec une méthode adaptée pour la pluie
-        self.df_mensuel = (
-        self.df.groupby([
-            "Latitude", "Longitude",
-            "department (name)", "department (code)",
-            "communes (code)", "Nom", "Mois"
-        ], as_index=False)
-        .agg({
-            "Pression station": "mean",
-            "Température (°C)": "mean",
-            "Précipitations dans les 24 dernières heures": "sum",
-            "Rafales sur une période": "mean"
-        })
-        )
+
+        self.df['station_id'] = self.build_station_dimension(self.df)
+
+        self.df_faits = self.aggregate_facts(self.df)
+
+        # Jointure avec les attributs des stations, pour les utilisations qui attendent une table à plat
+        self.df_mensuel = self.join_stations(self.df_faits)
+
+        return self.df_mensuel
+
+    def process_monthly(self, df_mensuel):
+        """
+        Équivalent de process_data pour des agrégats mensuels déjà calculés (cf MeteoExtractor.get_monthly_dataset) :
+        seules la table des stations et la table de faits sont construites.
+
+        Args:
+            df_mensuel (pd.DataFrame): une ligne par station et par mois, colonnes de process_data
+
+        Returns:
+            df_mensuel (pd.DataFrame): moyennes mensuelles par station, jointes aux attributs des stations
+        """
+        df = df_mensuel.copy()
+        df['station_id'] = self.build_station_dimension(df)
+
+        mesures = [colonne for colonne in colonnes_agregats() if colonne in df]
+
+        self.df_faits = (df[["station_id", "Mois"] + mesures]
+                         .sort_values(["station_id", "Mois"]).reset_index(drop=True))
+
+        self.df_mensuel = self.join_stations(self.df_faits)
 
         return self.df_mensuel
 
+    def monthly_dataset(self, extracteur, date_debut=SYNOP_DEBUT, date_fin=None, departements=DEPARTEMENTS_METROPOLE):
+        """
+        Agrégats mensuels par station calculés côté serveur (cf MeteoExtractor.get_monthly_dataset). Si le serveur
+        refuse l'agrégation, l'export brut est téléchargé par tranches d'un an (cf MeteoExtractor.iter_observations),
+        chaque tranche étant réduite en états partiels fusionnés au fur et à mesure : on ne garde jamais plus d'une
+        année d'observations en mémoire.
+
+        Returns:
+            df_mensuel (pd.DataFrame): moyennes mensuelles par station, jointes aux attributs des stations
+        """
+        try:
+            return self.process_monthly(extracteur.get_monthly_dataset(date_debut, date_fin, departements))
+        except requests.exceptions.HTTPError as e:
+            print(f"⚠️  Agrégation refusée par le serveur ({e}), repli sur l'export brut par tranches")
+
+        df_etats = None
+        for df in extracteur.iter_observations(date_debut, date_fin, departements):
+            if not df.empty:
+                df_etats = fusionner_etats(df_etats, etats_mensuels(df))
+
+        if df_etats is None:
+            print("⚠️  Pas de données météo")
+            return pd.DataFrame()
+
+        return self.process_monthly(finaliser_etats(df_etats))
+
+    def update_monthly(self, extracteur, chemin_etats=ETATS_METEO):
+        """
+        Mise à jour incrémentale des agrégats mensuels : seules les observations postérieures au watermark (date de
+        la dernière observation déjà intégrée) sont téléchargées, réduites en états partiels (sommes, effectifs,
+        maximums, cf transform/meteo_states.py) et fusionnées aux états conservés dans chemin_etats. Au premier
+        appel, tout l'historique est intégré, tranche par tranche. Les statistiques de distribution (quantiles,
+        jours de pluie, rafales fortes, cf MeteoDistributions) sont complétées dans la même passe.
+
+        Args:
+            extracteur (MeteoExtractor): extracteur utilisé pour télécharger les observations
+            chemin_etats (str): fichier des états et du watermark
+
+        Returns:
+            df_mensuel (pd.DataFrame): moyennes mensuelles par station, jointes aux attributs des stations
+        """
+        try:
+            with open(chemin_etats, "rb") as f:
+                etat = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            etat = {"watermark": None, "etats": None}
+
+        # Un état sans distributions ne peut pas être complété : on réintègre tout l'historique
+        if "distributions" not in etat:
+            etat = {"watermark": None, "etats": None, "distributions": MeteoDistributions()}
+
+        if etat["watermark"] is None:
+            tranches = extracteur.iter_observations()
+        else:
+            print(f"🔄 Observations météo postérieures au {etat['watermark']}")
+            tranches = extracteur.iter_observations(etat["watermark"], inclure_debut=False)
+
+        for df in tranches:
+            if df.empty:
+                continue
+
+            etat["etats"] = fusionner_etats(etat["etats"], etats_mensuels(df))
+            etat["distributions"].update(df)
+
+            watermark = pd.to_datetime(df["Date"], format="ISO8601", utc=True).max().isoformat()
+            etat["watermark"] = watermark if etat["watermark"] is None else max(etat["watermark"], watermark)
+
+        # Écriture atomique : les états et le watermark restent cohérents même si le traitement est interrompu
+        chemin_tmp = f"{chemin_etats}.{os.getpid()}.tmp"
+        with open(chemin_tmp, "wb") as f:
+            pickle.dump(etat, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(chemin_tmp, chemin_etats)
+
+        self.df_etats = etat["etats"]
+        self.distributions = etat["distributions"]
+
+        if self.df_etats is None:
+            print("⚠️  Pas de données météo")
+            return pd.DataFrame()
+
+        return self.process_monthly(finaliser_etats(self.df_etats))
+
+    def get_distributions(self):
+        """
+        Renvoie les statistiques de distribution par station et par mois (médiane et p90 de la température,
+        jours de pluie, rafales fortes), tenues à jour par update_monthly.
+        """
+        return self.distributions.to_frame()
+
+    def build_station_dimension(self, df):
+        """
+        Construit la table des stations (self.df_stations) et renvoie l'identifiant de station de chaque
+        observation. Chaque colonne de COLONNES_STATION est factorisée séparément, puis les codes sont combinés
+        colonne par colonne en un seul entier, ce qui évite de grouper sur six clés de types mélangés (les colonnes
+        texte lues en category, cf DTYPES_SYNOP, sont factorisées sans hachage).
+        Les identifiants suivent l'ordre des attributs des stations, comme l'ancien regroupement.
+
+        Args:
+            df (pd.DataFrame): observations
+
+        Returns:
+            station_id (np.ndarray): identifiant (position dans self.df_stations) de chaque observation
+        """
+        cle = np.zeros(len(df), dtype=np.int64)
+
+        for colonne in COLONNES_STATION:
+            codes, valeurs = pd.factorize(df[colonne])
+            cle, _ = pd.factorize(cle * len(valeurs) + codes)
+
+        # Les codes de factorize suivent l'ordre de première apparition : la i-ème première apparition est la station i
+        premieres = np.flatnonzero(~pd.Series(cle).duplicated().to_numpy())
+
+        df_stations = df[COLONNES_STATION].iloc[premieres].reset_index(drop=True)
+
+        # Renumérotation dans l'ordre des attributs des stations
+        ordre = df_stations.sort_values(COLONNES_STATION).index.to_numpy()
+        rang = np.empty(len(ordre), dtype=np.int64)
+        rang[ordre] = np.arange(len(ordre))
+
+        self.df_stations = df_stations.loc[ordre].reset_index(drop=True)
+        self.df_stations.insert(0, "station_id", np.arange(len(self.df_stations)))
+
+        return rang[cle]
+
+    def aggregate_facts(self, df):
+        """
+        Agrège les mesures par station et par mois, sur les deux clés entières station_id et Mois.
+
+        Args:
+            df (pd.DataFrame): observations avec les colonnes station_id et Mois
+
+        Returns:
+            df_faits (pd.DataFrame): une ligne par station_id x Mois
+        """
+        agregations = {mesure: (mesure, agregation) for mesure, agregation in AGREGATIONS.items()}
+        agregations.update({f"{mesure} (max)": (mesure, "max") for mesure in MAXIMUMS})
+
+        return df.groupby(["station_id", "Mois"], as_index=False, sort=True).agg(**agregations)
+
+    def join_stations(self, df_faits):
+        """
+        Joint une table de faits (avec station_id) aux attributs des stations. Les identifiants étant les
+        positions dans la table des stations, la jointure est une simple indexation.
+        """
+        df_attributs = self.df_stations[COLONNES_STATION].iloc[df_faits["station_id"].to_numpy()].reset_index(drop=True)
+
+        return pd.concat([df_attributs, df_faits.drop(columns=["station_id"]).reset_index(drop=True)], axis=1)
+
     def get_station_table(self):
-        self.df.groupby([
-            "Latitude", "Longitude",
-            "department (name)", "department (code)",
-            "communes (code)", "Nom"]).unique()
-        return self.df_station_table
+        """
+        Renvoie la table des stations (une ligne par station), construite par process_data.
+        """
+        if getattr(self, "df_stations", None) is None:
+            self.process_data()
+
+        return self.df_stations
+
+
+    def build_station_index(self):
+        """
+        Construit, une seule fois, l'index spatial de la table des stations (cf build_station_dimension),
+        utilisé par find_nearest_station(s) et build_cluster_bridge. Les positions dans l'index sont les station_id.
+        """
+        if getattr(self, "df_stations", None) is None:
+            self.process_data()
+
+        self.station_index = SpatialIndex(self.df_stations["Latitude"], self.df_stations["Longitude"])
+
+        return self.station_index
+
+
+    def find_nearest_stations(self, latitudes, longitudes, k=1, max_distance_km=None):
+        """
+        Trouve en un seul appel vectorisé les k stations météo les plus proches d'un lot de points
+        (centroïdes des clusters, communes, ...), en distance sur la sphère.
+
+        Args:
+            latitudes (array-like): latitudes des points
+            longitudes (array-like): longitudes des points
+            k (int): nombre de stations par point
+            max_distance_km (float): distance maximale, au-delà le point n'a pas de station
+
+        Returns:
+            stations (np.ndarray): codes communes des stations les plus proches (None si aucune)
+            distances (np.ndarray): distances en km
+        """
+        if getattr(self, "station_index", None) is None:
+            self.build_station_index()
+
+        indices, distances = self.station_index.query(latitudes, longitudes, k=k, max_distance_km=max_distance_km)
+
+        # L'indice -1 (pas de station) pointe sur le None ajouté en fin de tableau
+        codes = np.append(self.df_stations["communes (code)"].to_numpy(dtype=object), None)
+        stations = codes[indices]
+
+        return stations, distances
 
 
     def find_nearest_station(self, long, lat):
         """
-        Version vectorisée pour trouver la station météo la plus proche.
+        Trouve la station météo la plus proche d'un point (cf find_nearest_stations).
+        """
+        stations, _ = self.find_nearest_stations([lat], [long])
+        return stations[0]
+
+
+    def build_cluster_bridge(self, df_cluster_table, max_distance_km=None):
+        """
+        Construit la table de correspondance cluster -> station (la plus proche du centre du cluster), sur des clés
+        entières. Avec la table de faits station x mois (self.df_faits), elle forme un schéma en étoile : les
+        données d'une station ne sont stockées qu'une fois, quel que soit le nombre de clusters qui l'utilisent.
+
+        Args:
+            df_cluster_table (pd.DataFrame): DataFrame avec les colonnes 'code_cluster', 'latitude_centre' et
+        'longitude_centre' (la colonne 'nearest_meteo_station' y est ajoutée)
+            max_distance_km (float): distance maximale entre un cluster et sa station
+
+        Returns:
+            df_cluster_station (pd.DataFrame): une ligne par cluster, colonnes code_cluster et station_id
         """
-        df = self.df_mensuel.drop_duplicates(subset=["communes (code)"])
-        distances = np.sqrt((df["Longitude"] - long)**2 + (df["Latitude"] - lat)**2)
-        nearest_idx = distances.idxmin()
-        return df.loc[nearest_idx, "communes (code)"]
+        if getattr(self, "station_index", None) is None:
+            self.build_station_index()
+
+        # Une seule requête sur l'index pour tous les centroïdes des clusters
+        indices, _ = self.station_index.query(df_cluster_table['latitude_centre'], df_cluster_table['longitude_centre'],
+                                              max_distance_km=max_distance_km)
+
+        codes = np.append(self.df_stations["communes (code)"].to_numpy(dtype=object), None)
+        df_cluster_table["nearest_meteo_station"] = codes[indices]
 
+        trouve = indices >= 0
+        self.df_cluster_station = pd.DataFrame({"code_cluster": df_cluster_table["code_cluster"].to_numpy()[trouve],
+                                                "station_id": indices[trouve]})
 
-    def link_clusters_with_meteo(self, df_cluster_table):
+        return self.df_cluster_station
+
+    def materialize_cluster_meteo(self, clusters=None):
+        """
+        Matérialise, à la demande, une ligne par cluster et par mois à partir de la table de correspondance
+        cluster -> station et de la table de faits station x mois (jointure sur des clés entières).
+
+        Args:
+            clusters (array-like): clusters à matérialiser, tous par défaut
+
+        Returns:
+            df_cluster_meteo (pd.DataFrame): colonnes code_cluster, Mois et données météo
+        """
+        df_cluster_station = self.df_cluster_station
+        if clusters is not None:
+            df_cluster_station = df_cluster_station[df_cluster_station["code_cluster"].isin(clusters)]
+
+        self.df_cluster_meteo = (df_cluster_station.merge(self.df_faits, on="station_id")
+                                 .drop(columns=["station_id"])
+                                 .sort_values(["code_cluster", "Mois"])
+                                 .reset_index(drop=True)
+                                 .rename(columns=RENOMMAGE_METEO))
+
+        return self.df_cluster_meteo
+
+    def link_clusters_with_meteo(self, df_cluster_table, max_distance_km=None):
         """
         Associe à chaque cluster la station météo la plus proche et toutes les données météo
-        correspondantes, pour chaque mois.
+        correspondantes, pour chaque mois (cf build_cluster_bridge et materialize_cluster_meteo).
         
         Args:
-            df_cluster_table (pd.DataFrame): DataFrame avec colonnes 'nearest_meteo_station' et 'code_cluster'
+            df_cluster_table (pd.DataFrame): DataFrame avec colonnes 'code_cluster', 'latitude_centre' et 'longitude_centre'
+            max_distance_km (float): distance maximale entre un cluster et sa station
         
         Returns:
             df_cluster_meteo (pd.DataFrame): DataFrame où chaque ligne correspond à un cluster + mois,
                                             avec toutes les données météo de la station la plus proche
         """
-        df_cluster_table["nearest_meteo_station"] = None
+        self.build_cluster_bridge(df_cluster_table, max_distance_km=max_distance_km)
 
-        for cluster in df_cluster_table.index:
-            print(f"Processing cluster {cluster}")
+        return self.materialize_cluster_meteo()
 
-            long = df_cluster_table.loc[cluster, 'longitude_centre']
-            lat = df_cluster_table.loc[cluster, 'latitude_centre']
+    def save_star_schema(self, dossier="data/"):
+        """
+        Sauvegarde la météo en schéma en étoile : table des stations, table de faits station x mois et table de
+        correspondance cluster -> station, au lieu d'une ligne par cluster et par mois.
+        """
+        self.df_stations.to_csv(dossier + "meteo_stations.csv", index=False)
+        self.df_faits.to_csv(dossier + "meteo_station_mois.csv", index=False)
+        self.df_cluster_station.to_csv(dossier + "cluster_station.csv", index=False)
 
-            nearest_station = self.find_nearest_station(long, lat)
+    def interpolate_clusters(self, df_communes, k=4, puissance=2, max_distance_km=None, altitudes_stations=None):
+        """
+        Alternative à link_clusters_with_meteo : la météo de chaque cluster est interpolée à partir des k stations
+        les plus proches de chacune de ses communes (pondération inverse à la distance, puis moyenne des communes
+        pondérée par la population), avec une correction d'altitude optionnelle des températures. Les poids sont
+        calculés une fois (cf StationInterpolator) ; chaque appel n'est ensuite qu'un produit matriciel creux.
 
-            df_cluster_table.loc[cluster, 'nearest_meteo_station'] = nearest_station
+        Args:
+            df_communes (pd.DataFrame): communes nettoyées (cf TownTransformer.clean_data)
+            k (int): nombre de stations par commune
+            puissance (float): exposant de la pondération inverse à la distance
+            max_distance_km (float): distance maximale entre une commune et ses stations
+            altitudes_stations (pd.Series): altitude des stations, indexée par leur code commune ("communes (code)")
 
+        Returns:
+            df_cluster_meteo (pd.DataFrame): une ligne par cluster et par mois
+        """
+        if altitudes_stations is not None:
+            altitudes_stations = self.df_stations["communes (code)"].astype(str).map(altitudes_stations)
 
-        # Merge sur le code INSEE de la station
-        self.df_cluster_meteo = self.df_mensuel.merge(
-            df_cluster_table[['nearest_meteo_station', 'code_cluster']],
-            left_on='communes (code)',
-            right_on='nearest_meteo_station',
-            how='inner'
-        )
+        interpolateur = StationInterpolator(self.df_stations, df_communes, k=k, puissance=puissance,
+                                            max_distance_km=max_distance_km, altitudes_stations=altitudes_stations)
 
-        # On garde la colonne code_cluster, on supprime la colonne doublon
-        self.df_cluster_meteo.drop(columns=['nearest_meteo_station', 'Latitude', 'Longitude', 'department (code)',
-                                       'department (name)', 'communes (code)', 'Nom'], inplace=True)
+        # Tableau dense station x mois x mesure
+        mesures = list(AGREGATIONS)
+        valeurs = np.full((len(self.df_stations), 12, len(mesures)), np.nan)
+        valeurs[self.df_faits["station_id"].to_numpy(), self.df_faits["Mois"].to_numpy() - 1] = \
+            self.df_faits[mesures].to_numpy(dtype=float)
 
-        # Le merge conserve toutes les colonnes de df_mensuel, donc chaque mois est conservé
-        # Les données sont automatiquement "par mois" grâce à la colonne 'Mois' dans df_mensuel
+        valeurs_clusters = interpolateur.interpoler(valeurs)
+        valeurs_clusters[:, :, mesures.index("Température (°C)")] += interpolateur.correction_altitude[:, None]
 
-        self.df_cluster_meteo["ID"] = self.df_cluster_meteo["code_cluster"].astype(str) + "_" + self.df_cluster_meteo["Mois"].astype(str)
+        nb_clusters = len(interpolateur.cluster_ids)
+        self.df_cluster_meteo = pd.DataFrame(valeurs_clusters.reshape(nb_clusters * 12, len(mesures)), columns=mesures)
+        self.df_cluster_meteo.insert(0, "Mois", np.tile(np.arange(1, 13), nb_clusters))
+        self.df_cluster_meteo.insert(0, "code_cluster", np.repeat(interpolateur.cluster_ids, 12))
 
-        self.df_cluster_meteo.rename(columns={'Pression station': 'Meteo_Pression_station_moyenne',
-                                              'Température (°C)': 'Meteo_Temperature_moyenne',
-                                              'Précipitations dans les 24 dernières heures': 'Meteo_Precipitations_moyenne',
-                                              'Rafales sur une période': 'Meteo_Rafales_moyenne'}, inplace=True)
+        self.df_cluster_meteo = self.df_cluster_meteo.dropna(subset=mesures, how="all").reset_index(drop=True)
 
-        return self.df_cluster_meteo
+        self.df_cluster_meteo.rename(columns=RENOMMAGE_METEO, inplace=True)
 
+        return self.df_cluster_meteo
 
     
 if __name__ == "__main__":
-    df_meteo = pd.read_csv("data/donnees-synop-essentielles-omm.csv", sep=';')
+    df_meteo = pd.read_csv("data/donnees-synop-essentielles-omm.csv", sep=';', dtype=DTYPES_SYNOP)
     transformer = TransformMeteo(df_meteo)
 
-    df_meteo_cleaned = transformer.process_data()
-    df_meteo_cleaned.to_csv("data/meteo_cleaned.csv", index=False)
+    transformer.process_data()
 
     df_cluster = pd.read_csv("data/cluster_mapping.csv")
 
-    df_cluster_meteo = transformer.link_clusters_with_meteo(df_cluster)
+    transformer.build_cluster_bridge(df_cluster)
 
-    df_cluster_meteo.to_csv("data/cluster_meteo.csv", index=False)
+    # Les lignes par cluster et par mois ne sont matérialisées qu'à la demande (cf materialize_cluster_meteo)
+    transformer.save_star_schema("data/")